@@ -1,14 +1,21 @@
 # app/routes/ai_explain.py
 
+import json
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional  
 
 from app.ml.ai_helper import (
-    get_short_remedy,
-    get_remedy_explanation,
-    get_farmer_chat_reply
+    get_short_remedy_async,
+    get_remedy_explanation_async,
+    get_farmer_chat_reply_async,
+    get_llm_flight_stats,
+    stream_remedy_explanation,
+    stream_farmer_chat_reply
 )
+from app.ml import remedy_cache
 
 router = APIRouter(prefix="/ai", tags=["AI Assistant"])
 
@@ -18,6 +25,12 @@ class DiseaseRequest(BaseModel):
     language: str = "en"
 
 
+class CacheInvalidateRequest(BaseModel):
+    disease: Optional[str] = None
+    language: Optional[str] = None
+    kind: Optional[str] = None        # remedy | explanation
+
+
 class ChatRequest(BaseModel):
     question: str
     disease: Optional[str] = None     
@@ -25,27 +38,28 @@ class ChatRequest(BaseModel):
 
 
 @router.post("/remedy")
-def ai_short_remedy(req: DiseaseRequest):
+async def ai_short_remedy(req: DiseaseRequest):
+    # async all the way: identical requests wait on the loop, not in threads
     try:
-        result = get_short_remedy(req.disease, req.language)
+        result = await get_short_remedy_async(req.disease, req.language)
         return {"remedy": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/explain")
-def ai_explanation(req: DiseaseRequest):
+async def ai_explanation(req: DiseaseRequest):
     try:
-        result = get_remedy_explanation(req.disease, req.language)
+        result = await get_remedy_explanation_async(req.disease, req.language)
         return {"explanation": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/chat")
-def ai_chat(req: ChatRequest):
+async def ai_chat(req: ChatRequest):
     try:
-        reply = get_farmer_chat_reply(
+        reply = await get_farmer_chat_reply_async(
             question=req.question,
             disease_name=req.disease,
             language=req.language
@@ -53,3 +67,56 @@ def ai_chat(req: ChatRequest):
         return {"reply": reply}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _sse(chunks):
+    """
+    Server-Sent Events: one `data: {"delta": ...}` per chunk, then `event: done`.
+    """
+    async def gen():
+        async for delta in chunks:
+            yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/explain/stream")
+async def ai_explanation_stream(req: DiseaseRequest):
+    return _sse(stream_remedy_explanation(req.disease, req.language))
+
+
+@router.post("/chat/stream")
+async def ai_chat_stream(req: ChatRequest):
+    return _sse(stream_farmer_chat_reply(
+        question=req.question,
+        disease_name=req.disease,
+        language=req.language
+    ))
+
+
+@router.get("/cache")
+def ai_cache_stats():
+    return remedy_cache.get_stats()
+
+
+@router.post("/cache/invalidate")
+def ai_cache_invalidate(req: CacheInvalidateRequest):
+    deleted = remedy_cache.invalidate(
+        disease=req.disease,
+        language=req.language,
+        kind=req.kind,
+    )
+    return {"message": "cache invalidated", "deleted": deleted}
+
+
+@router.get("/stats")
+def ai_stats():
+    """
+    Upstream LLM calls actually issued vs. coalesced onto an in-flight one.
+    """
+    return get_llm_flight_stats()
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
 from app.db.database import SessionLocal
 from app import crud, schemas
 
-from app.models.fcm_device import FCMDevice
+from app.models.alert import Alert
+from app.utils import spatial
 from app.utils.socket_manager import broadcast_new_alert
-from app.utils.fcm_sender import send_fcm, haversine
+from app.utils.fcm_dispatch import schedule_alert_push
 
 router = APIRouter(prefix="/alerts", tags=["Alerts"])
 
@@ -19,11 +20,9 @@ def get_db():
 
 @router.post("/", response_model=schemas.AlertResponse)
 async def create_alert(alert: schemas.AlertCreate, db: Session = Depends(get_db)):
-
-    
     saved = crud.create_alert(db, alert)
 
-    await broadcast_new_alert({
+    payload = {
         "id": saved.id,
         "disease": saved.disease,
         "severity": saved.severity,
@@ -32,28 +31,12 @@ async def create_alert(alert: schemas.AlertCreate, db: Session = Depends(get_db)
         "lon": saved.lon,
         "source": saved.source,
         "timestamp": saved.created_at.isoformat()
-    })
-
-    
-    users = db.query(FCMToken).all()
-
-    for user in users:
-        if user.lat is None or user.lon is None:
-            continue
+    }
+    await broadcast_new_alert(payload)
 
-        dist = haversine(alert.lat, alert.lon, user.lat, user.lon)
-
-        if dist <= 5:  
-            send_fcm(
-                token=user.token,
-                title=f"Disease Alert: {alert.disease}",
-                body=f"{alert.severity} severity near your area ({dist:.1f} km)",
-                data={
-                    "lat": alert.lat,
-                    "lon": alert.lon,
-                    "disease": alert.disease
-                }
-            )
+    # farmers within ALERT_PUSH_RADIUS_KM are notified in the background
+    if saved.lat is not None and saved.lon is not None:
+        schedule_alert_push(payload)
 
     return saved
 
@@ -62,33 +45,31 @@ def list_alerts(db: Session = Depends(get_db)):
     return crud.get_alerts(db)
 
 @router.get("/nearby")
-def get_nearby_alerts(lat: float, lon: float, db: Session = Depends(get_db)):
-    alerts = crud.get_alerts(db)
-    nearby = []
-
-    from math import radians, sin, cos, sqrt, atan2
-    R = 6371
-
-    for a in alerts:
-        if a.lat is None or a.lon is None:
-            continue
-
-        dlat = radians(a.lat - lat)
-        dlon = radians(a.lon - lon)
-
-        x = sin(dlat/2)**2 + cos(radians(lat)) * cos(radians(a.lat)) * sin(dlon/2)**2
-        distance = R * 2 * atan2(sqrt(x), sqrt(1-x))
-
-        if distance <= 5:
-            nearby.append({
-                "id": a.id,
-                "disease": a.disease,
-                "severity": a.severity,
-                "cases": a.cases,
-                "lat": a.lat,
-                "lon": a.lon,
-                "distance": round(distance, 2),
-                "timestamp": a.created_at.isoformat()
-            })
-
-    return nearby
+def get_nearby_alerts(
+    lat: float,
+    lon: float,
+    radius_km: float = Query(spatial.NEARBY_RADIUS_KM, gt=0, le=100),
+    limit: int = Query(spatial.NEARBY_LIMIT, ge=1, le=spatial.NEARBY_MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    hits = spatial.alert_index.nearby(db, lat, lon, radius_km, limit)
+    if not hits:
+        return []
+
+    distance = dict(hits)
+    alerts = db.query(Alert).filter(Alert.id.in_(distance)).all()
+    alerts.sort(key=lambda a: distance[a.id])
+
+    return [
+        {
+            "id": a.id,
+            "disease": a.disease,
+            "severity": a.severity,
+            "cases": a.cases,
+            "lat": a.lat,
+            "lon": a.lon,
+            "distance": round(distance[a.id], 2),
+            "timestamp": a.created_at.isoformat()
+        }
+        for a in alerts
+    ]
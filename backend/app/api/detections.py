@@ -1,6 +1,12 @@
-from fastapi import APIRouter, Depends, File, UploadFile, Form, Body
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Body, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+import asyncio
+import hashlib
+import json
+import os
 
 from app.db.database import SessionLocal
 from app.models.report import Report
@@ -8,11 +14,23 @@ from app.models.detection import Detection
 
 from app import crud
 from app.utils.socket_manager import broadcast_new_detection
-from app.utils.supabase_upload import upload_detection_image
-from app.ml.model_utils import predict_image
+from app.utils import storage, map_changes
+from app.utils.uploads import spool
+from app.utils.image_variants import put_image_later, variant_urls
+from app.ml.model_utils import (
+    predict_image_async,
+    get_inference_stats,
+    default_model_version,
+    InferenceBusy,
+)
+from app.ml.remedy_jobs import schedule_remedy, get_remedy_result, wait_for_remedy
+from app.ml import result_cache
 
 router = APIRouter(prefix="/detections", tags=["Detections"])
 
+MAP_DATA_PAGE_SIZE = int(os.getenv("MAP_DATA_PAGE_SIZE", "5000"))
+MAP_DATA_MAX_PAGE_SIZE = 20000
+
 def get_db():
     db = SessionLocal()
     try:
@@ -21,6 +39,48 @@ def get_db():
         db.close()
 
 
+# uploads that outlive their /predict response (kept referenced until done)
+_pending_uploads = set()
+
+
+def _insert_report(db: Session, lat: float, lon: float, image_url):
+    report = Report(
+        source="mobile",
+        image_url=image_url,
+        lat=lat,
+        lon=lon
+    )
+    db.add(report)
+    db.commit()
+    db.refresh(report)
+    return report
+
+
+def _attach_image_url(report_id: int, image_url: str):
+    db = SessionLocal()
+    try:
+        db.query(Report).filter(Report.id == report_id).update({"image_url": image_url})
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _finish_upload(upload, report_id: int, image_hash: str):
+    """
+    Waits for the storage upload queued by /predict and stores the URL
+    on the report once the object really exists.
+    """
+    image_url = await upload
+    if image_url is None:
+        return
+
+    result_cache.remember_upload(image_hash, image_url)
+    try:
+        await asyncio.to_thread(_attach_image_url, report_id, image_url)
+    except Exception as e:
+        print(" Report image_url update error:", e)
+
+
 @router.post("/predict")
 async def predict_disease(
     file: UploadFile = File(...),
@@ -29,23 +89,54 @@ async def predict_disease(
     lon: float = Form(...),
     db: Session = Depends(get_db)
 ):
+    """
+    Storage upload (write-behind queue), inference and the report insert
+    run concurrently.
+    The response does not wait for the upload: image_url is already the
+    final public URL, and image_status says whether the object is there
+    yet (the report row gets the URL as soon as it is).
+    """
+    image = await spool(file)
+    report = None
     try:
-        
-        image_bytes = await file.read()
-        unique_filename = f"{uuid.uuid4()}.jpg"
+        # same photo retried by the offline app: reuse stored URL / result
+        image_hash = image.sha256
+        cached = result_cache.lookup(image_hash) or {}
+
+        upload_task = None
+        image_url = cached.get("image_url")
+        if image_url:
+            result_cache.stats["uploads_skipped"] += 1
+        else:
+            key = storage.new_key()
+            image_url = storage.public_url(key)
+            upload_task = await put_image_later(key, image, image.content_type)
 
-        image_url = upload_detection_image(image_bytes, unique_filename)
-        if image_url is None:
-            return {"error": "Image upload failed"}
+        # a cached prediction only counts if the current default model made it
+        reuse = "exact_disease" in cached and cached.get("model_version") == default_model_version()
 
-        result = predict_image(image_bytes, language=language)
+        async def classify():
+            if reuse:
+                result_cache.stats["inference_skipped"] += 1
+                return cached
+            return await predict_image_async(image)
+
+        report_write = asyncio.to_thread(
+            _insert_report, db, lat, lon, None if upload_task else image_url
+        )
+        report, result = await asyncio.gather(report_write, classify(), return_exceptions=True)
+
+        if isinstance(report, Exception):
+            raise report
+        if isinstance(result, Exception):
+            raise result
         if "error" in result:
-            return result
+            raise RuntimeError(result["error"])
+        if not reuse:
+            result_cache.remember_prediction(image_hash, result)
 
         exact = result["exact_disease"]
         confidence = float(result["confidence"])
-        remedy = result["remedy"]
-        explanation = result["ai_explanation"]
 
         
         if confidence >= 85:
@@ -55,40 +146,67 @@ async def predict_disease(
         else:
             severity = "Low"
 
-        report = Report(
-            source="mobile",
-            image_url=image_url,
-            lat=lat,
-            lon=lon
-        )
-        db.add(report)
-        db.commit()
-        db.refresh(report)
-
-        detection = crud.create_detection(db, {
+        detection = await asyncio.to_thread(crud.create_detection, db, {
             "report_id": report.id,
             "disease_label": exact,
             "confidence": confidence,
             "severity": severity,
             "bbox": None,
-            "model_version": "15-class-v1"
+            "model_version": result.get("model_version")
         })
 
-        
+        # remedy + explanation come later via GET /detections/{id}/remedy
+        # or the 'remedy_ready' socket event
+        await schedule_remedy(detection.id, exact, language)
+
+        image_status = "uploaded"
+        if upload_task is not None:
+            if upload_task.done() and upload_task.result() is None:
+                image_status = "failed"
+            elif not upload_task.done():
+                image_status = "uploading"
+            job = asyncio.create_task(_finish_upload(upload_task, report.id, image_hash))
+            _pending_uploads.add(job)
+            job.add_done_callback(_pending_uploads.discard)
+
         return {
             "report_id": report.id,
             "detection_id": detection.id,
             "image_url": image_url,
+            "image_status": image_status,
+            "image_variants": variant_urls(image_url),
             "disease": exact,
             "confidence": confidence,
             "severity": severity,
-            "remedy": remedy,
-            "ai_explanation": explanation,
+            "remedy": None,
+            "ai_explanation": None,
+            "remedy_status": "pending",
+            "remedy_url": f"/detections/{detection.id}/remedy",
+            "model_version": result.get("model_version"),
+            "cached": reuse,
         }
 
+    except InferenceBusy as e:
+        _discard_report(db, report)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
     except Exception as e:
         print(" Predict error:", e)
+        _discard_report(db, report)
         return {"error": str(e)}
+    finally:
+        image.release()
+
+
+def _discard_report(db: Session, report):
+    # the report row was written in parallel with a prediction that failed
+    if isinstance(report, Report):
+        try:
+            map_changes.detections_removed(db, [report.id])
+            db.delete(report)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(" Report cleanup error:", e)
 
 
 @router.post("/save")
@@ -117,7 +235,7 @@ async def save_detection(
             "confidence": float(payload.get("confidence", 0)),
             "severity": payload.get("severity", "Medium"),
             "bbox": payload.get("bbox"),
-            "model_version": payload.get("model_version", "15-class-v1"),
+            "model_version": payload.get("model_version") or default_model_version(),
         })
 
         
@@ -138,28 +256,147 @@ async def save_detection(
         return {"error": str(e)}
 
 
+def _http_date(dt: datetime) -> str:
+    return format_datetime(dt.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def _utc_naive(dt: datetime) -> datetime:
+    # created_at is stored as naive UTC
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
 @router.get("/map_data")
-def get_map_data(db: Session = Depends(get_db)):
-    detections = crud.get_detections(db)
-    out = []
-
-    for d in detections:
-        out.append({
-            "id": d.id,
-            "disease": d.disease_label,
-            "confidence": d.confidence,
-            "severity": d.severity,
-            "lat": d.report.lat,
-            "lon": d.report.lon,
-            "timestamp": d.created_at.isoformat(),
-        })
+def get_map_data(
+    request: Request,
+    limit: int = Query(MAP_DATA_PAGE_SIZE, ge=1, le=MAP_DATA_MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor of the previous page"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    disease: Optional[list[str]] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Detections with a position, newest first, as one joined projection.
+    Keyset paginated: while more rows exist the response carries an
+    X-Next-Cursor header to pass back as `cursor`. Unchanged pages
+    answer 304 to If-None-Match / If-Modified-Since.
+    """
+    q = (
+        db.query(
+            Detection.id,
+            Detection.disease_label,
+            Detection.confidence,
+            Detection.severity,
+            Detection.created_at,
+            Report.lat,
+            Report.lon,
+            Report.image_url,
+        )
+        .join(Report, Detection.report_id == Report.id)
+        .filter(Report.lat.isnot(None), Report.lon.isnot(None))
+    )
+    if cursor is not None:
+        q = q.filter(Detection.id < cursor)
+    if since is not None:
+        q = q.filter(Detection.created_at >= _utc_naive(since))
+    if until is not None:
+        q = q.filter(Detection.created_at < _utc_naive(until))
+    if disease:
+        q = q.filter(Detection.disease_label.in_(disease))
+
+    rows = q.order_by(Detection.id.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    out = [
+        {
+            "id": r.id,
+            "disease": r.disease_label,
+            "confidence": r.confidence,
+            "severity": r.severity,
+            "lat": r.lat,
+            "lon": r.lon,
+            "timestamp": r.created_at.isoformat(),
+            "image_url": r.image_url,
+            "image_variants": variant_urls(r.image_url),
+        }
+        for r in rows
+    ]
+    body = json.dumps(out, separators=(",", ":")).encode()
+
+    # hashed from the body: image_url is filled in after the row is created
+    headers = {"ETag": f'"{hashlib.sha1(body).hexdigest()[:20]}"', "Cache-Control": "no-cache"}
+    if rows:
+        headers["Last-Modified"] = _http_date(max(r.created_at for r in rows))
+    if more:
+        headers["X-Next-Cursor"] = str(rows[-1].id)
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if if_none_match == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since and "Last-Modified" in headers:
+        try:
+            if parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(headers["Last-Modified"]):
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/{detection_id}/remedy")
+async def get_detection_remedy(
+    detection_id: int,
+    language: str = "en",
+    wait: float = 0,
+    db: Session = Depends(get_db)
+):
+    """
+    Follow-up to /predict. Pass wait=<seconds> (max 20) to long-poll
+    until the remedy is ready instead of polling repeatedly.
+    """
+    result = await get_remedy_result(detection_id)
+
+    if result is None:
+        # pruned, or the detection wasn't made through /predict
+        detection = db.query(Detection).filter(Detection.id == detection_id).first()
+        if not detection:
+            raise HTTPException(status_code=404, detail="Detection not found")
+        result = await schedule_remedy(detection_id, detection.disease_label, language)
+    elif result["status"] != "ready":
+        # retries a failed one or takes over an abandoned pending one;
+        # a pending one that is being generated is returned as is
+        result = await schedule_remedy(detection_id, result["disease"], result["language"])
+
+    if result["status"] == "pending" and wait > 0:
+        result = await wait_for_remedy(detection_id, min(wait, 20.0))
+
+    return result
+
+
+@router.get("/inference_stats")
+def inference_stats():
+    """
+    Achieved micro-batch sizes, for tuning INFER_MAX_BATCH / INFER_MAX_WAIT_MS.
+    """
+    return get_inference_stats()
+
 
-    return out
+@router.get("/cache_stats")
+def prediction_cache_stats():
+    """
+    Hit rate of the content-hash cache in front of predict / upload.
+    """
+    return result_cache.get_stats()
 
 
 @router.delete("/{report_id}")
 def delete_detection(report_id: int, db: Session = Depends(get_db)):
     try:
+        # cluster / tile caches of every worker drop it via the change log
+        map_changes.detections_removed(db, [report_id])
         db.query(Detection).filter(Detection.report_id == report_id).delete()
         db.query(Report).filter(Report.id == report_id).delete()
         db.commit()
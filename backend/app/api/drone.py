@@ -1,9 +1,18 @@
 # app/routes/drone.py
-from fastapi import APIRouter, UploadFile, File, Form, Depends
+import asyncio
+import shutil
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from datetime import datetime
+from typing import List, Optional
 from uuid import uuid4
 
-from app.ml.model_utils import predict_image
+from app.ml.model_utils import (
+    predict_image_async,
+    InferenceBusy,
+)
+from app.ml import tiling
+from app.ml import survey_jobs
+from app.utils.uploads import spool, MAX_DRONE_FRAME_MB
 from app.utils.socket_manager import broadcast_new_detection, broadcast_new_alert
 from app.db.database import SessionLocal
 from app import crud, schemas
@@ -19,16 +28,68 @@ def get_db():
         db.close()
 
 
+async def analyze_tiled(source, lat: float, lon: float, tile_size: int, overlap: float, gsd_cm: float):
+    try:
+        return await tiling.analyze_frame(source, lat, lon, tile_size, overlap, gsd_cm)
+    except tiling.FrameTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except tiling.FrameDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def analyze_single(source):
+    """
+    Whole frame squashed to the model input (quick look for small images).
+    """
+    result = await predict_image_async(source)
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+
+    confidence = result["confidence"]
+    if confidence >= 85:
+        severity = "High"
+    elif confidence >= 60:
+        severity = "Moderate"
+    else:
+        severity = "Low"
+
+    return {
+        "mode": "single",
+        "label": result["exact_disease"],
+        "confidence": round(confidence, 2),
+        "severity": severity,
+        "bbox": None,
+        "model_version": result.get("model_version"),
+    }
+
+
 @router.post("/analyze")
 async def analyze_drone_image(
     file: UploadFile = File(...),
     lat: float = Form(...),
     lon: float = Form(...),
+    mode: str = Form("tiled"),                       # tiled | single
+    tile_size: int = Form(tiling.DRONE_TILE_SIZE),   # tile edge in pixels
+    overlap: float = Form(tiling.DRONE_TILE_OVERLAP),
+    gsd_cm: Optional[float] = Form(None),            # ground sample distance, cm/pixel
     db=Depends(get_db)
 ):
-    image_bytes = await file.read()
+    if tile_size < 64:
+        raise HTTPException(status_code=400, detail="tile_size must be at least 64 pixels")
 
-    result = predict_image(image_bytes)
+    image = await spool(file, MAX_DRONE_FRAME_MB)
+
+    try:
+        if mode == "single":
+            result = await analyze_single(image)
+        else:
+            result = await analyze_tiled(
+                image.open(), lat, lon, tile_size, overlap, gsd_cm or tiling.DRONE_GSD_CM
+            )
+    except InferenceBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+    finally:
+        image.release()
 
     detection_data = {
         "report_id": None,
@@ -36,7 +97,7 @@ async def analyze_drone_image(
         "confidence": result["confidence"],
         "severity": result["severity"],
         "bbox": result.get("bbox"),
-        "model_version": "v1.0"
+        "model_version": result.get("model_version")
     }
 
     detection = crud.create_detection(db, detection_data)
@@ -53,28 +114,103 @@ async def analyze_drone_image(
         "source": "drone"
     })
 
-    alert = crud.create_alert(db, schemas.AlertCreate(
-        disease=result["label"],
-        severity=result["severity"],
-        lat=lat,
-        lon=lon,
-        cases=1,
-        source="drone"
-    ))
-
-    await broadcast_new_alert({
-        "id": alert.id,
-        "disease": alert.disease,
-        "severity": alert.severity,
-        "lat": alert.lat,
-        "lon": alert.lon,
-        "cases": alert.cases,
-        "source": "drone",
-        "timestamp": alert.created_at.isoformat()
-    })
+    alert = None
+    if result["label"] not in tiling.NOT_INFECTED:
+        alert = crud.create_alert(db, schemas.AlertCreate(
+            disease=result["label"],
+            severity=result["severity"],
+            lat=lat,
+            lon=lon,
+            cases=result.get("summary", {}).get("infected_tiles", 1),
+            source="drone"
+        ))
+
+        await broadcast_new_alert({
+            "id": alert.id,
+            "disease": alert.disease,
+            "severity": alert.severity,
+            "lat": alert.lat,
+            "lon": alert.lon,
+            "cases": alert.cases,
+            "source": "drone",
+            "timestamp": alert.created_at.isoformat()
+        })
 
     return {
         "detection": detection.id,
-        "alert": alert.id,
+        "alert": alert.id if alert else None,
         "result": result
     }
+
+
+# -------------------------------------------------
+# Bulk flight uploads
+# -------------------------------------------------
+@router.post("/surveys")
+async def create_drone_survey(
+    files: Optional[List[UploadFile]] = File(None),  # frames as multipart files
+    archive: Optional[UploadFile] = File(None),      # or one zip of the flight
+    lat: Optional[float] = Form(None),               # fallback position
+    lon: Optional[float] = Form(None),
+    frames_meta: Optional[str] = Form(None),         # JSON [{"name", "lat", "lon"}]
+    tile_size: int = Form(tiling.DRONE_TILE_SIZE),
+    overlap: float = Form(tiling.DRONE_TILE_OVERLAP),
+    gsd_cm: Optional[float] = Form(None),
+):
+    """
+    Queues a whole flight for background analysis. Frame positions come
+    from frames_meta, then GPS EXIF, then lat/lon. Poll
+    /drone/surveys/{job_id} or join it with the 'watch_survey' socket event.
+    """
+    if tile_size < 64:
+        raise HTTPException(status_code=400, detail="tile_size must be at least 64 pixels")
+
+    try:
+        positions = survey_jobs.parse_frames_meta(frames_meta)
+    except survey_jobs.SurveyUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job_dir = survey_jobs.new_job_dir()
+    try:
+        frames = await asyncio.to_thread(
+            survey_jobs.spool_uploads,
+            job_dir,
+            [(f.filename, f.file) for f in files or []],
+            archive.file if archive else None,
+        )
+    except survey_jobs.SurveyUploadError as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not frames:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="No image frames in the upload")
+
+    job = await survey_jobs.create_job(job_dir, frames, {
+        "lat": lat,
+        "lon": lon,
+        "positions": positions,
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "gsd_cm": gsd_cm or tiling.DRONE_GSD_CM,
+    })
+
+    return {
+        "job_id": job["job_id"],
+        "frames": job["total"],
+        "status": job["status"],
+        "status_url": f"/drone/surveys/{job['job_id']}",
+    }
+
+
+@router.get("/surveys")
+async def list_drone_surveys():
+    return await survey_jobs.list_jobs()
+
+
+@router.get("/surveys/{job_id}")
+async def get_drone_survey(job_id: str, frames: bool = True):
+    view = await survey_jobs.get_view(job_id, with_frames=frames)
+    if view is None:
+        raise HTTPException(status_code=404, detail="Survey job not found")
+    return view
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends
+import asyncio
+
+from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 from app.db.database import SessionLocal
 from app.models.fcm_device import FCMDevice
-from app.utils.fcm_sender import send_fcm
+from app.utils.fcm_dispatch import get_stats as get_push_stats
+from app.utils import notification_outbox
+from app.utils.spatial import device_index
 
 router = APIRouter(prefix="/fcm", tags=["FCM"])
 
@@ -30,35 +34,73 @@ def register_fcm_token(payload: FCMRegister, db: Session = Depends(get_db)):
         existing.lat = payload.lat
         existing.lon = payload.lon
     else:
-        new_entry = FCMDevice(
+        existing = FCMDevice(
             device_id=payload.device_id,
             token=payload.token,
             lat=payload.lat,
             lon=payload.lon
         )
-        db.add(new_entry)
+        db.add(existing)
 
     db.commit()
+    # keeps the in-process alert radius index current for moved devices
+    device_index.upsert(existing.id, payload.lat, payload.lon)
 
     return {"message": "Token saved"}
 
+class OutboxRequeue(BaseModel):
+    ids: Optional[List[int]] = None
+
+def _queue_test_push():
+    db = SessionLocal()
+    try:
+        device = db.query(FCMDevice).order_by(FCMDevice.id.desc()).first()
+    finally:
+        db.close()
+
+    if not device:
+        return None
+
+    # alert_id None: test pushes are never deduplicated
+    notification_outbox.enqueue([{
+        "device_id": device.id,
+        "alert_id": None,
+        "token": device.token,
+        "title": "WheatGuard Test Alert 🌾",
+        "body": "Your FCM push notification is working!",
+        "data": {"test": "ok"},
+    }])
+    return device
+
+
 @router.post("/send-test")
-def send_test_notification(db: Session = Depends(get_db)):
-    
-    device = db.query(FCMDevice).order_by(FCMDevice.id.desc()).first()
+async def send_test_notification():
+    # async only to wake the outbox worker on its loop; the queries run
+    # in a thread
+    device = await asyncio.to_thread(_queue_test_push)
 
     if not device:
         return {"error": "No device registered"}
 
-    send_fcm(
-        token=device.token,
-        title="WheatGuard Test Alert 🌾",
-        body="Your FCM push notification is working!",
-        data={"test": "ok"}
-    )
+    notification_outbox.wake()
 
     return {
-        "message": "Test notification sent",
+        "message": "Test notification queued",
         "device_id": device.device_id,
         "token": device.token
-    }
\ No newline at end of file
+    }
+
+@router.get("/stats")
+def push_stats():
+    return {**get_push_stats(), "outbox": notification_outbox.get_stats()}
+
+@router.get("/outbox/dead")
+def outbox_dead_letters(limit: int = Query(100, ge=1, le=1000)):
+    return notification_outbox.dead_letters(limit)
+
+@router.post("/outbox/requeue")
+def outbox_requeue(payload: OutboxRequeue):
+    """
+    Retry dead-lettered pushes (all of them when no ids are given).
+    """
+    return {"requeued": notification_outbox.requeue_dead(payload.ids)}
@@ -3,8 +3,11 @@
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from sqlalchemy.orm import Session
 from fastapi.responses import FileResponse
-import os, uuid, json
+import os, json
 from app.models.fields import Field
+from app.utils import storage, vector_tiles
+from app.utils.uploads import spool
+from app.utils.image_variants import put_image_later, variant_urls
 
 
 from app.db.database import SessionLocal
@@ -12,6 +15,7 @@ from app import crud
 
 router = APIRouter(prefix="/fields", tags=["Fields"])
 
+# photos saved before the storage layer existed are still served from here
 FARMER_FOLDER = "uploads/farmers"
 FIELD_FOLDER = "uploads/fields"
 
@@ -27,6 +31,19 @@ def get_db():
         db.close()
 
 
+async def _store_photo(photo: UploadFile, prefix: str) -> str:
+    """
+    Queue the photo for upload and return its public URL.
+    """
+    key = storage.new_key(photo.filename, prefix=prefix)
+    image = await spool(photo)
+    try:
+        await put_image_later(key, image, image.content_type)
+    finally:
+        image.release()
+    return storage.public_url(key)
+
+
 @router.post("/")
 async def register_field(
     farmer_id: int = Form(...),
@@ -43,19 +60,8 @@ async def register_field(
     db: Session = Depends(get_db),
 ):
 
-    ext1 = farmer_photo.filename.split(".")[-1]
-    fname1 = f"{uuid.uuid4()}.{ext1}"
-    farmer_path = os.path.join(FARMER_FOLDER, fname1)
-    with open(farmer_path, "wb") as f:
-        f.write(await farmer_photo.read())
-    farmer_url = f"/fields/photo/farmer/{fname1}"
-
-    ext2 = field_photo.filename.split(".")[-1]
-    fname2 = f"{uuid.uuid4()}.{ext2}"
-    field_path = os.path.join(FIELD_FOLDER, fname2)
-    with open(field_path, "wb") as f:
-        f.write(await field_photo.read())
-    field_url = f"/fields/photo/field/{fname2}"
+    farmer_url = await _store_photo(farmer_photo, "farmers")
+    field_url = await _store_photo(field_photo, "fields")
 
     data = {
         "farmer_id": farmer_id,
@@ -100,26 +106,24 @@ async def update_field(
 
     
     if farmer_photo:
-        ext = farmer_photo.filename.split(".")[-1]
-        fname = f"{uuid.uuid4()}.{ext}"
-        path = os.path.join(FARMER_FOLDER, fname)
-        with open(path, "wb") as f:
-            f.write(await farmer_photo.read())
-        updates["photo_url"] = f"/fields/photo/farmer/{fname}"
+        updates["photo_url"] = await _store_photo(farmer_photo, "farmers")
 
     if field_photo:
-        ext = field_photo.filename.split(".")[-1]
-        fname = f"{uuid.uuid4()}.{ext}"
-        path = os.path.join(FIELD_FOLDER, fname)
-        with open(path, "wb") as f:
-            f.write(await field_photo.read())
-        updates["field_photo_url"] = f"/fields/photo/field/{fname}"
+        updates["field_photo_url"] = await _store_photo(field_photo, "fields")
+
+    field = db.query(Field).filter(Field.id == field_id).first()
+    if field:
+        # committed by update_field together with the edit
+        vector_tiles.field_changed(db, field)
 
     updated = crud.update_field(db, field_id, updates)
 
     if not updated:
         raise HTTPException(status_code=404, detail="Field not found")
 
+    vector_tiles.field_changed(db, updated)
+    db.commit()
+
     return {"message": "Field updated", "field": updated}
 
 
@@ -131,9 +135,16 @@ def serve_farmer_photo(filename: str):
 def serve_field_photo(filename: str):
     return FileResponse(os.path.join(FIELD_FOLDER, filename))
 
+def _field_out(field: Field) -> dict:
+    out = {c.name: getattr(field, c.name) for c in Field.__table__.columns}
+    out["photo_variants"] = variant_urls(field.photo_url)
+    out["field_photo_variants"] = variant_urls(field.field_photo_url)
+    return out
+
+
 @router.get("/")
 def list_fields(db: Session = Depends(get_db)):
-    return crud.get_all_fields(db)
+    return [_field_out(f) for f in crud.get_all_fields(db)]
 
 @router.delete("/{field_id}")
 def delete_field(field_id: int, db: Session = Depends(get_db)):
@@ -143,6 +154,7 @@ def delete_field(field_id: int, db: Session = Depends(get_db)):
         return {"error": "Field not found"}
 
     
+    vector_tiles.field_changed(db, field)
     db.delete(field)
     db.commit()
 
@@ -1,10 +1,10 @@
 # backend/app/routes/map_data.py
 
-from fastapi import APIRouter, Query, Depends
+from fastapi import APIRouter, Query, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.db.database import SessionLocal
 from app import models
-import math
+from app.utils import spatial, clusters
 
 router = APIRouter(prefix="/map", tags=["Map Data"])
 
@@ -15,15 +15,6 @@ def get_db():
     finally:
         db.close()
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
-    a = (math.sin(d_lat / 2) ** 2 +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(d_lon / 2) ** 2)
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
 @router.get("/data")
 def get_map_data(db: Session = Depends(get_db)):
     results = (
@@ -59,28 +50,75 @@ def get_map_data(db: Session = Depends(get_db)):
 def get_nearby_alerts(
     lat: float = Query(...),
     lon: float = Query(...),
+    radius_km: float = Query(spatial.NEARBY_RADIUS_KM, gt=0, le=100),
+    limit: int = Query(spatial.NEARBY_LIMIT, ge=1, le=spatial.NEARBY_MAX_LIMIT),
     db: Session = Depends(get_db),
 ):
+    hits = spatial.report_index.nearby(db, lat, lon, radius_km, limit)
+    if not hits:
+        return []
+
+    distance = dict(hits)
     results = (
         db.query(
+            models.Detection.id,
+            models.Detection.report_id,
             models.Detection.disease_label.label("disease"),
             models.Detection.severity,
             models.Report.lat,
             models.Report.lon,
         )
         .join(models.Report, models.Detection.report_id == models.Report.id)
-        .filter(models.Report.lat.isnot(None))
-        .filter(models.Report.lon.isnot(None))
+        .filter(models.Report.id.in_(distance))
         .all()
     )
+    results.sort(key=lambda r: distance[r.report_id])
+
+    return [
+        {
+            "id": r.id,
+            "disease": r.disease,
+            "severity": r.severity,
+            "lat": r.lat,
+            "lon": r.lon,
+            "distance": round(distance[r.report_id], 2),
+        }
+        for r in results
+    ]
+
+
+@router.get("/clusters")
+def get_map_clusters(
+    bbox: str = Query(..., description="west,south,east,north in degrees"),
+    zoom: int = Query(..., ge=0, le=22),
+    db: Session = Depends(get_db),
+):
+    """
+    Pre-aggregated detection counts per grid cell for the viewport, with
+    disease and severity breakdowns. Past CLUSTER_MAX_ZOOM the cells are
+    replaced by individual detections (count 1).
+    """
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+    if west > east or south > north:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+
+    west, east = max(west, -180.0), min(east, 180.0)
+    south, north = max(south, -90.0), min(north, 90.0)
+
+    if zoom > clusters.CLUSTER_MAX_ZOOM:
+        items = clusters.points(db, west, south, east, north)
+        mode = "points"
+    else:
+        items = clusters.detection_clusters.clusters(db, west, south, east, north, zoom)
+        mode = "clusters"
 
-    nearby = []
-    for r in results:
-        dist = haversine(lat, lon, r.lat, r.lon)
-        if dist <= 5:  
-            nearby.append({
-                "disease": r.disease,
-                "severity": r.severity,
-                "distance": round(dist, 2),
-            })
-    return nearby
\ No newline at end of file
+    return {
+        "zoom": zoom,
+        "mode": mode,
+        "cell_deg": clusters.cell_deg(zoom) if mode == "clusters" else None,
+        "total": sum(c["count"] for c in items),
+        "clusters": items,
+    }
@@ -0,0 +1,105 @@
+# app/api/models.py
+
+import asyncio
+import os
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Optional
+
+from app.ml import model_sync
+from app.ml.model_config import MODEL_DIR, variant_path, create_session
+from app.ml.model_utils import registry
+
+router = APIRouter(prefix="/models", tags=["Models"])
+
+
+class LoadModelRequest(BaseModel):
+    version: str
+    variant: Optional[str] = None     # fp32 | optimized | int8_dynamic | int8_static
+    file: Optional[str] = None        # .onnx file name inside app/ml/
+    make_default: bool = False
+
+
+class DefaultModelRequest(BaseModel):
+    version: str
+
+
+class CandidateRequest(BaseModel):
+    version: Optional[str] = None     # None stops shadow traffic
+    percent: float = 10
+
+
+def _model_path(req: LoadModelRequest) -> str:
+    if req.file:
+        # only files that were deployed next to the default model
+        path = os.path.join(MODEL_DIR, os.path.basename(req.file))
+    else:
+        try:
+            path = variant_path(req.variant or "fp32")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if not path.endswith(".onnx") or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Model file not found: {os.path.basename(path)}")
+    return path
+
+
+@router.get("/")
+def list_models():
+    return registry.info()
+
+
+@router.post("/load")
+async def load_model_version(req: LoadModelRequest):
+    """
+    Loads (or reloads) a version without restarting the server. The
+    session is built off the event loop; requests keep using the current
+    default until the new one is registered. Other workers follow (see
+    app.ml.model_sync).
+    """
+    if len(req.version) > 40:
+        raise HTTPException(status_code=400, detail="version must be at most 40 characters")
+
+    path = _model_path(req)
+    try:
+        session = await asyncio.to_thread(create_session, path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to load ONNX: {e}")
+
+    registry.register(req.version, path, session, make_default=req.make_default)
+    print(f" Model version '{req.version}' loaded from {os.path.basename(path)}")
+    await asyncio.to_thread(model_sync.share, req.version)
+    return registry.info()
+
+
+@router.post("/default")
+async def set_default_model(req: DefaultModelRequest):
+    try:
+        registry.set_default(req.version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not loaded")
+    await asyncio.to_thread(model_sync.share)
+    return registry.info()
+
+
+@router.post("/candidate")
+async def set_candidate_model(req: CandidateRequest):
+    try:
+        registry.set_candidate(req.version, req.percent)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not loaded")
+    await asyncio.to_thread(model_sync.share)
+    return registry.info()
+
+
+@router.delete("/{version}")
+async def unload_model(version: str):
+    try:
+        registry.unload(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not loaded")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await asyncio.to_thread(model_sync.share)
+    return registry.info()
@@ -0,0 +1,41 @@
+# app/api/tiles.py
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.utils import vector_tiles
+
+router = APIRouter(prefix="/tiles", tags=["Vector Tiles"])
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@router.get("/{layer}/{z}/{x}/{y}.mvt")
+def get_vector_tile(layer: str, z: int, x: int, y: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Mapbox Vector Tile for detections, alerts or fields (XYZ scheme).
+    Empty tiles answer 204.
+    """
+    if layer not in vector_tiles.LAYERS:
+        raise HTTPException(status_code=404, detail=f"Unknown layer: {layer}")
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    try:
+        data, fp = vector_tiles.get_tile(db, layer, z, x, y)
+    except vector_tiles.VectorTilesUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    headers = {"ETag": f'"{fp}"', "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    if not data:
+        return Response(status_code=204, headers=headers)
+    return Response(content=data, media_type=vector_tiles.MEDIA_TYPE, headers=headers)
@@ -1,24 +1,54 @@
 # app/routes/upload.py
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import uuid
+import asyncio
+from fastapi import APIRouter, UploadFile, File
 
-from app.utils.supabase_upload import upload_detection_image
+from app.utils import storage
+from app.utils.uploads import spool
+from app.utils.image_variants import put_image_later, variant_urls
+from app.ml import result_cache
 
 router = APIRouter(prefix="/upload", tags=["Uploads"])
 
+# background uploads still running after their response was sent
+_pending = set()
+
+
+async def _remember_when_uploaded(upload, image_hash: str):
+    url = await upload
+    if url:
+        result_cache.remember_upload(image_hash, url)
+
 
 @router.post("/image")
 async def upload_image(file: UploadFile = File(...)):
-    
-    file_bytes = await file.read()
-    if not file_bytes:
-        raise HTTPException(status_code=400, detail="Empty file")
+    """
+    Hands the bytes to the storage queue and returns the final URL
+    straight away (the object appears once the upload has finished).
+    """
+    image = await spool(file)
+    try:
+        # retried upload of the same photo: hand back the first URL (only
+        # remembered once that upload finished, hence "uploaded")
+        image_hash = image.sha256
+        cached = result_cache.lookup(image_hash)
+        if cached and cached.get("image_url"):
+            result_cache.stats["uploads_skipped"] += 1
+            url = cached["image_url"]
+            return {"url": url, "variants": variant_urls(url), "status": "uploaded"}
+
+        key = storage.new_key(file.filename)
+        upload = await put_image_later(key, image, image.content_type)
+    finally:
+        image.release()
+
+    task = asyncio.create_task(_remember_when_uploaded(upload, image_hash))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
 
-    ext = (file.filename or "jpg").split(".")[-1].lower()
-    filename = f"{uuid.uuid4()}.{ext}"
+    url = storage.public_url(key)
+    return {"url": url, "variants": variant_urls(url), "status": "queued"}
 
-    url = upload_detection_image(file_bytes, filename)
-    if not url:
-        raise HTTPException(status_code=500, detail="Failed to upload to Supabase")
 
-    return {"url": url}
+@router.get("/stats")
+def upload_stats():
+    return storage.get_stats()
@@ -32,6 +32,8 @@ def get_detections(db: Session):
 
 
 def create_alert(db: Session, data):
+    if not isinstance(data, dict):
+        data = data.dict()
     alert = Alert(**data)
     db.add(alert)
     db.commit()
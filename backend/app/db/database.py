@@ -1,7 +1,9 @@
 # app/db/database.py
 
 import os
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
@@ -36,11 +38,30 @@ def init_db():
     from app.models.fcm_device import FCMDevice
     from app.models.ndvi_history import NDVIHistory
     from app.models.ndvi_stress import NDVIStressAlert
+    from app.models.ai_cache import AICacheEntry
+    from app.models.prediction_cache import PredictionCacheEntry
+    from app.models.notification_outbox import NotificationOutbox
+    from app.models.map_change import MapChange
+    from app.models.model_deployment import ModelDeployment
+    from app.models.remedy_result import RemedyResult
+    from app.models.survey_job import SurveyJob
 
     print("Creating database tables (if not exists)...")
-    Base.metadata.create_all(bind=engine)
+    for attempt in range(3):
+        try:
+            Base.metadata.create_all(bind=engine)
+            break
+        except DBAPIError as e:
+            # several uvicorn workers starting on an empty database race
+            # to create the same table; the next pass skips what exists
+            if attempt == 2 or "already exists" not in str(e):
+                raise
+            time.sleep(0.5)
     print(" Tables ready")
 
+    from app.utils.spatial import ensure_spatial_indexes
+    ensure_spatial_indexes()
+
 
 def get_db():
     db = SessionLocal()
@@ -1,4 +1,6 @@
 # app/main.py
+import asyncio
+import os
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import socketio
@@ -7,9 +9,12 @@ from app.db.database import init_db
 from dotenv import load_dotenv
 load_dotenv()
 
+from app.utils import socket_manager
+
 sio = socketio.AsyncServer(
     async_mode="asgi",
     cors_allowed_origins=["*"],
+    client_manager=socket_manager.create_client_manager(),
 )
 
 fastapi_app = FastAPI(
@@ -19,6 +24,10 @@ fastapi_app = FastAPI(
 
 app = socketio.ASGIApp(sio, other_asgi_app=fastapi_app)
 
+# added first so CORS headers are also set on its 413 responses
+from app.middleware.upload_limit import UploadLimitMiddleware
+fastapi_app.add_middleware(UploadLimitMiddleware)
+
 fastapi_app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -28,6 +37,7 @@ fastapi_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
 from app.api import (
@@ -43,15 +53,24 @@ from app.api import sentinel_ndvi
 from app.api.ai_explain import router as ai_router
 from app.api import local_sync
 from app.middleware.auth_middleware import verify_token
-from app.utils import socket_manager
 from app.ml.model_utils import load_model
+from app.ml.remedy_jobs import get_remedy_result
+from app.ml import survey_jobs
+from app.ml.ai_helper import prewarm_remedy_cache
+from app.ml import model_sync
 from app.api import upload
 from app.api import alerts
 from app.api import fcm_tokens
 from app.api import ndvi_history
 from app import ndvi_stress
-from app.scheduler import start_scheduler
+from app.scheduler import start_scheduler, stop_scheduler
 from app.api import fields
+from app.api import models as model_admin
+from app.api import tiles
+from app.utils import notification_outbox
+from app.utils import socket_feed
+from app.utils import worker_events
+from app.utils.leader import Leader
 
 
 fastapi_app.include_router(admin_auth.router)
@@ -66,10 +85,14 @@ fastapi_app.include_router(fcm_tokens.router)
 fastapi_app.include_router(ndvi_history.router)
 fastapi_app.include_router(ndvi_stress.router)
 fastapi_app.include_router(fields.router)
+fastapi_app.include_router(model_admin.router)
+fastapi_app.include_router(tiles.router)
 
 
 from fastapi.staticfiles import StaticFiles
-fastapi_app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+from app.utils import storage
+os.makedirs(storage.LOCAL_STORAGE_DIR, exist_ok=True)
+fastapi_app.mount("/uploads", StaticFiles(directory=storage.LOCAL_STORAGE_DIR), name="uploads")
 
 UNPROTECTED_PATHS = [
     "/admin/login",
@@ -154,24 +177,121 @@ fastapi_app.include_router(map_data.router)
 socket_manager.sio = sio
 
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
+    """
+    auth (optional): {"token": admin JWT} joins the admin room and gets
+    every location event; {"lat", "lon", "radius_km"} or {"bbox"}
+    subscribes to that area right away (see subscribe_area);
+    {"msgpack": true} receives new_detections batches as msgpack.
+    """
+    auth = auth or {}
+    if auth.get("token"):
+        try:
+            admin_auth.verify_jwt_token(auth["token"])
+            await sio.enter_room(sid, socket_manager.ADMIN_ROOM)
+        except Exception:
+            print(f" Socket {sid}: invalid admin token, connected as guest")
+
+    try:
+        await socket_manager.subscribe_area(sid, auth)
+    except ValueError:
+        pass
+    # compact binary batches (see app.utils.socket_feed)
+    sio.manager.use_msgpack(sid, bool(auth.get("msgpack")))
     print(f"Client connected: {sid}")
 
 @sio.event
 async def disconnect(sid):
     print(f" Client disconnected: {sid}")
 
+@sio.event
+async def subscribe_area(sid, data):
+    """
+    Farmer app / map view: receive new_detections batches, new_alert and
+    ndvi_stress_update only for this area. Replaces the previous area;
+    an empty payload unsubscribes.
+    """
+    try:
+        rooms = await socket_manager.subscribe_area(sid, data)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"rooms": len(rooms)}
+
+@sio.event
+async def watch_detection(sid, data):
+    """
+    Mobile app joins the room for its detection_id right after /predict
+    and receives 'remedy_ready' when the LLM text is done.
+    """
+    try:
+        detection_id = int((data or {}).get("detection_id"))
+    except (TypeError, ValueError):
+        return {"error": "detection_id required"}
+
+    await sio.enter_room(sid, socket_manager.detection_room(detection_id))
+
+    # the remedy may already be finished before the client joined
+    result = await get_remedy_result(detection_id)
+    if result and result["status"] == "ready":
+        await sio.emit("remedy_ready", result, to=sid)
+
+    return {"status": result["status"] if result else "unknown"}
+
+@sio.event
+async def watch_survey(sid, data):
+    """
+    Dashboard joins the room of a bulk drone survey and receives
+    'survey_progress' until the job is done.
+    """
+    job_id = str((data or {}).get("job_id") or "")
+    view = await survey_jobs.get_view(job_id, with_frames=False)
+    if view is None:
+        return {"error": "unknown job_id"}
+
+    await sio.enter_room(sid, socket_manager.survey_room(job_id))
+    await sio.emit("survey_progress", view, to=sid)
+    return {"status": view["status"]}
+
 @fastapi_app.get("/")
 def root():
     return {"message": "WheatGuard Backend Running ✔"}
 
+async def _start_singletons():
+    start_scheduler()
+    notification_outbox.start()
+
+    # the texts go to the shared ai_cache table, one worker fills it
+    if os.getenv("AI_CACHE_PREWARM", "1") == "1":
+        asyncio.get_running_loop().run_in_executor(None, prewarm_remedy_cache)
+
+async def _stop_singletons():
+    stop_scheduler()
+    await notification_outbox.stop()
+
+# scheduler, outbox worker and cache prewarm run in one process only,
+# whatever the number of uvicorn workers / containers
+background_leader = Leader("background", _start_singletons, _stop_singletons)
+
+@fastapi_app.get("/realtime/stats")
+def realtime_stats():
+    return {**socket_feed.get_stats(), "leader": background_leader.status()}
+
 @fastapi_app.on_event("startup")
 async def startup_event():
     print("Starting WheatGuard AI Backend...")
     init_db() 
     load_model()
-    start_scheduler()  
-    print(" Model loaded & Scheduler running")
+    # subscribed first: no /models change can slip between the two
+    await worker_events.start()
+    await model_sync.reconcile()
+    await background_leader.start()
+    print(" Model loaded" + (" & Scheduler running" if background_leader.is_leader else ", scheduler runs in another worker"))
+
+@fastapi_app.on_event("shutdown")
+async def shutdown_event():
+    await socket_manager.detection_feed.flush()
+    await background_leader.stop()
+    await worker_events.stop()
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,56 @@
+# app/middleware/upload_limit.py
+
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "25"))
+MAX_DRONE_UPLOAD_MB = int(os.getenv("MAX_DRONE_UPLOAD_MB", "2048"))   # whole flights as zip
+
+
+def body_limit(path: str) -> int:
+    mb = MAX_DRONE_UPLOAD_MB if path.startswith("/drone") else MAX_UPLOAD_MB
+    return mb * 1024 * 1024
+
+
+class UploadLimitMiddleware:
+    """
+    Caps request bodies while they are received: a too large
+    Content-Length is refused before reading anything, and chunked
+    bodies are counted as they stream in, so an oversized upload never
+    reaches disk or memory in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        limit = body_limit(scope["path"])
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": f"Request body larger than {limit // (1024 * 1024)} MB"},
+            )
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Request body larger than {limit // (1024 * 1024)} MB",
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,17 +1,98 @@
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional
 
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+from app.ml import remedy_cache
+from app.utils.single_flight import SingleFlight
 
 load_dotenv()
 
+LLM_BASE_URL = "https://openrouter.ai/api/v1"
+LLM_MODEL = "x-ai/grok-4-fast"
+
+# Upstream limits: per-request timeout, retries (the SDK backs off
+# exponentially between attempts) and max concurrent requests.
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "60"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "16"))
+
 client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
+    base_url=LLM_BASE_URL,
+    api_key=os.getenv("OPENROUTER_API_KEY"),
+    timeout=AI_TIMEOUT_SECONDS,
+    max_retries=AI_MAX_RETRIES,
+)
+
+# Used by the streaming endpoints; one shared connection pool.
+async_client = AsyncOpenAI(
+    base_url=LLM_BASE_URL,
     api_key=os.getenv("OPENROUTER_API_KEY"),
+    timeout=AI_TIMEOUT_SECONDS,
+    max_retries=AI_MAX_RETRIES,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=AI_MAX_CONCURRENCY,
+            max_keepalive_connections=AI_MAX_CONCURRENCY,
+        ),
+        timeout=AI_TIMEOUT_SECONDS,
+    ),
 )
 
+
+class _Slots:
+    """
+    One AI_MAX_CONCURRENCY budget for all upstream calls: blocking ones
+    (worker threads, `with`) and async ones (event loop, `async with`).
+    Async callers that find every slot taken wait in a small pool of
+    their own, never in the default executor the request path uses.
+    """
+
+    def __init__(self, size: int):
+        self._sem = threading.BoundedSemaphore(size)
+        self._waiters = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ai-slots")
+
+    def __enter__(self):
+        self._sem.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._sem.release()
+
+    async def __aenter__(self):
+        if not self._sem.acquire(blocking=False):
+            # all slots taken: wait in a worker thread, not on the loop
+            fut = asyncio.get_running_loop().run_in_executor(self._waiters, self._sem.acquire)
+            try:
+                await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                # the thread still gets the slot eventually; hand it back
+                fut.add_done_callback(lambda _: self._sem.release())
+                raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._sem.release()
+
+
+_slots = _Slots(AI_MAX_CONCURRENCY)
+
+# Bump when the remedy / explanation prompts change so cached text
+# generated from the old prompts is no longer served.
+PROMPT_VERSION = 1
+
+# Identical concurrent LLM requests (e.g. an outbreak of "Yellow Rust"
+# in Hindi) share one upstream call.
+remedy_flight = SingleFlight("remedy")
+explanation_flight = SingleFlight("explanation")
+chat_flight = SingleFlight("chat")
+
 LANG_MAP = {
     "en": "English",
     "hi": "Hindi",
@@ -190,13 +271,52 @@ def _get_display_disease_name(raw_name: str, language: str) -> str:
     return mapping["en"]
 
 
-def get_short_remedy(disease_name: str, language: str = "en") -> str:
-    lang_full = LANG_MAP.get(language, "English")
-    season = _current_season_india()
+def _cache_key(kind: str, disease_name: str, language: str, season: str):
+    lang = language if language in LANG_MAP else "en"
+    return (kind, (disease_name or "").strip(), lang, season, PROMPT_VERSION)
+
+
+def _complete(prompt: str, max_tokens: int) -> str:
+    with _slots:
+        resp = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+        )
+    return resp.choices[0].message.content.strip()
+
+
+async def _acomplete(prompt: str, max_tokens: int) -> str:
+    async with _slots:
+        resp = await async_client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+        )
+    return resp.choices[0].message.content.strip()
 
-    display_name = _get_display_disease_name(disease_name, language)
 
-    prompt = f"""
+async def _stream_completion(prompt: str, max_tokens: int):
+    """
+    Yields text deltas as the model produces them.
+    """
+    async with _slots:
+        stream = await async_client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+def _short_remedy_prompt(display_name: str, lang_full: str, season: str) -> str:
+    return f"""
 You are a Krishi Vaidya (agri doctor) helping Indian wheat farmers.
 
 Write 3–4 VERY SIMPLE bullet points to control this wheat problem.
@@ -250,25 +370,55 @@ FORMAT:
 Language: {lang_full}
 """
 
+
+def get_short_remedy(disease_name: str, language: str = "en", fallback: bool = True) -> str:
+    """
+    fallback=False raises on upstream errors instead of returning the
+    "not available" text (background jobs mark the result failed).
+    """
+    lang_full = LANG_MAP.get(language, "English")
+    season = _current_season_india()
+
+    display_name = _get_display_disease_name(disease_name, language)
+    prompt = _short_remedy_prompt(display_name, lang_full, season)
+
+    def _generate():
+        return _complete(prompt, max_tokens=700)
+
+    key = _cache_key("remedy", disease_name, language, season)
     try:
-        resp = client.chat.completions.create(
-            model="x-ai/grok-4-fast",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=700,
-        )
-        return resp.choices[0].message.content.strip()
+        return remedy_cache.get_or_generate(key, _generate, remedy_flight)
     except Exception as e:
         print(f" short_remedy error: {e}")
+        if not fallback:
+            raise
         return f"Remedy not available right now for {display_name}."
 
 
-def get_remedy_explanation(disease_name: str, language: str = "en") -> str:
+async def get_short_remedy_async(disease_name: str, language: str = "en", fallback: bool = True) -> str:
+    """
+    get_short_remedy on the event loop (async client, no worker thread).
+    """
     lang_full = LANG_MAP.get(language, "English")
     season = _current_season_india()
 
     display_name = _get_display_disease_name(disease_name, language)
+    prompt = _short_remedy_prompt(display_name, lang_full, season)
 
-    prompt = f"""
+    key = _cache_key("remedy", disease_name, language, season)
+    try:
+        return await remedy_cache.get_or_generate_async(
+            key, lambda: _acomplete(prompt, max_tokens=700), remedy_flight
+        )
+    except Exception as e:
+        print(f" short_remedy error: {e}")
+        if not fallback:
+            raise
+        return f"Remedy not available right now for {display_name}."
+
+
+def _explanation_prompt(display_name: str, lang_full: str, season: str) -> str:
+    return f"""
 Explain this wheat problem for an Indian farmer.
 
 Disease (farmer name): **{display_name}**
@@ -344,37 +494,48 @@ Tone:
 Language: {lang_full}
 """
 
+
+def get_remedy_explanation(disease_name: str, language: str = "en", fallback: bool = True) -> str:
+    lang_full = LANG_MAP.get(language, "English")
+    season = _current_season_india()
+
+    display_name = _get_display_disease_name(disease_name, language)
+    prompt = _explanation_prompt(display_name, lang_full, season)
+
+    def _generate():
+        return _complete(prompt, max_tokens=1400)
+
+    key = _cache_key("explanation", disease_name, language, season)
     try:
-        resp = client.chat.completions.create(
-            model="x-ai/grok-4-fast",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1400,
-        )
-        return resp.choices[0].message.content.strip()
+        return remedy_cache.get_or_generate(key, _generate, explanation_flight)
     except Exception as e:
         print(f" detailed_explanation error: {e}")
+        if not fallback:
+            raise
         return f"Explanation not available right now for {display_name}."
 
 
-def get_farmer_chat_reply(
-    question: str,
-    disease_name: Optional[str] = None,
-    language: str = "en",
-) -> str:
-    """
-    Chatbot used on ResultPage.
-    Farmer can ask doubt in EN/HI/MR. Answer in same language.
-    """
+async def get_remedy_explanation_async(disease_name: str, language: str = "en", fallback: bool = True) -> str:
     lang_full = LANG_MAP.get(language, "English")
     season = _current_season_india()
 
-    if disease_name:
-        display_name = _get_display_disease_name(disease_name, language)
-        disease_text = f"{display_name}"
-    else:
-        disease_text = "wheat crop problem"
+    display_name = _get_display_disease_name(disease_name, language)
+    prompt = _explanation_prompt(display_name, lang_full, season)
 
-    prompt = f"""
+    key = _cache_key("explanation", disease_name, language, season)
+    try:
+        return await remedy_cache.get_or_generate_async(
+            key, lambda: _acomplete(prompt, max_tokens=1400), explanation_flight
+        )
+    except Exception as e:
+        print(f" detailed_explanation error: {e}")
+        if not fallback:
+            raise
+        return f"Explanation not available right now for {display_name}."
+
+
+def _chat_prompt(question: str, disease_text: str, lang_full: str, season: str) -> str:
+    return f"""
 You are an AI Krishi Sevak helping Indian wheat farmers.
 
 Farmer question (in {lang_full}):
@@ -424,13 +585,152 @@ ALWAYS:
 Language: {lang_full}
 """
 
+
+def _chat_context(disease_name: Optional[str], language: str):
+    lang_full = LANG_MAP.get(language, "English")
+    season = _current_season_india()
+
+    if disease_name:
+        display_name = _get_display_disease_name(disease_name, language)
+        disease_text = f"{display_name}"
+    else:
+        disease_text = "wheat crop problem"
+
+    return lang_full, season, disease_text
+
+
+def _chat_key(question, disease_name, language, season):
+    # same question (ignoring case / spacing) about the same disease
+    return (
+        " ".join((question or "").lower().split()),
+        (disease_name or "").strip(),
+        language,
+        season,
+    )
+
+
+def get_farmer_chat_reply(
+    question: str,
+    disease_name: Optional[str] = None,
+    language: str = "en",
+) -> str:
+    """
+    Chatbot used on ResultPage.
+    Farmer can ask doubt in EN/HI/MR. Answer in same language.
+    """
+    lang_full, season, disease_text = _chat_context(disease_name, language)
+    prompt = _chat_prompt(question, disease_text, lang_full, season)
+
+    def _generate():
+        return _complete(prompt, max_tokens=900)
+
+    key = _chat_key(question, disease_name, language, season)
     try:
-        resp = client.chat.completions.create(
-            model="x-ai/grok-4-fast",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=900,
-        )
-        return resp.choices[0].message.content.strip()
+        return chat_flight.do(key, _generate)
     except Exception as e:
         print(f" farmer_chat error: {e}")
         return "Right now I am not able to answer. Please contact your local Krishi Sevak."
+
+
+async def get_farmer_chat_reply_async(
+    question: str,
+    disease_name: Optional[str] = None,
+    language: str = "en",
+) -> str:
+    lang_full, season, disease_text = _chat_context(disease_name, language)
+    prompt = _chat_prompt(question, disease_text, lang_full, season)
+
+    key = _chat_key(question, disease_name, language, season)
+    try:
+        return await chat_flight.do_async(key, lambda: _acomplete(prompt, max_tokens=900))
+    except Exception as e:
+        print(f" farmer_chat error: {e}")
+        return "Right now I am not able to answer. Please contact your local Krishi Sevak."
+
+
+async def stream_remedy_explanation(disease_name: str, language: str = "en"):
+    """
+    Streaming variant of get_remedy_explanation. A cached explanation is
+    sent as a single chunk; a freshly generated one is cached when done.
+    """
+    lang_full = LANG_MAP.get(language, "English")
+    season = _current_season_india()
+    display_name = _get_display_disease_name(disease_name, language)
+
+    key = _cache_key("explanation", disease_name, language, season)
+    cached = await remedy_cache.get_cached_async(key)
+    if cached:
+        yield cached
+        return
+
+    prompt = _explanation_prompt(display_name, lang_full, season)
+    parts = []
+    try:
+        async for delta in _stream_completion(prompt, max_tokens=1400):
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        print(f" detailed_explanation stream error: {e}")
+        if not parts:
+            yield f"Explanation not available right now for {display_name}."
+        return
+
+    await remedy_cache.put_async(key, "".join(parts).strip())
+
+
+async def stream_farmer_chat_reply(
+    question: str,
+    disease_name: Optional[str] = None,
+    language: str = "en",
+):
+    """
+    Streaming variant of get_farmer_chat_reply.
+    """
+    lang_full, season, disease_text = _chat_context(disease_name, language)
+    prompt = _chat_prompt(question, disease_text, lang_full, season)
+
+    sent = False
+    try:
+        async for delta in _stream_completion(prompt, max_tokens=900):
+            sent = True
+            yield delta
+    except Exception as e:
+        print(f" farmer_chat stream error: {e}")
+        if not sent:
+            yield "Right now I am not able to answer. Please contact your local Krishi Sevak."
+
+
+def prewarm_remedy_cache():
+    """
+    Generate remedy + explanation for every disease x language for the
+    current season, skipping anything already cached. Meant to run once
+    in the background at startup.
+    """
+    if not os.getenv("OPENROUTER_API_KEY"):
+        print(" AI cache prewarm skipped (no OPENROUTER_API_KEY)")
+        return
+
+    purged = remedy_cache.purge_stale(PROMPT_VERSION)
+    if purged:
+        print(f" AI cache: purged {purged} entries from old prompts")
+
+    season = _current_season_india()
+    generated = 0
+
+    for disease in DISEASE_TRANSLATIONS:
+        for language in LANG_MAP:
+            if not remedy_cache.is_cached(_cache_key("remedy", disease, language, season)):
+                get_short_remedy(disease, language)
+                generated += 1
+            if not remedy_cache.is_cached(_cache_key("explanation", disease, language, season)):
+                get_remedy_explanation(disease, language)
+                generated += 1
+
+    print(f" AI cache prewarmed ({generated} generated)")
+
+
+def get_llm_flight_stats():
+    return {
+        f.name: f.stats()
+        for f in (remedy_flight, explanation_flight, chat_flight)
+    }
@@ -0,0 +1,157 @@
+# app/ml/batcher.py
+
+import asyncio
+import os
+from collections import Counter
+
+import numpy as np
+
+INFER_MAX_BATCH = int(os.getenv("INFER_MAX_BATCH", "8"))
+INFER_MAX_WAIT_MS = float(os.getenv("INFER_MAX_WAIT_MS", "10"))
+
+
+class InferenceBatcher:
+    """
+    Dynamic micro-batching for the ONNX classifier.
+
+    Requests submit one image and await the model output for it. Queued
+    images are coalesced into a single batch which is flushed when it
+    reaches `max_batch` images or when the oldest queued image has
+    waited `max_wait_ms`. `run_batch` gets the list of queued items and
+    returns one output per item (an Exception instance fails only that
+    item's caller).
+
+    Batches run on `executor` (never on the event loop); up to `workers`
+    batches can be in flight at once.
+    """
+
+    def __init__(
+        self,
+        run_batch,
+        max_batch=INFER_MAX_BATCH,
+        max_wait_ms=INFER_MAX_WAIT_MS,
+        executor=None,
+        workers=1,
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self.workers = max(1, int(workers))
+
+        self._pending = []
+        self._wakeup = None
+        self._loop = None
+        self._worker_tasks = []
+        self._closed = False
+
+        self.batch_sizes = Counter()
+        self.total_batches = 0
+        self.total_images = 0
+
+    def _ensure_workers(self):
+        if self._worker_tasks and not any(t.done() for t in self._worker_tasks):
+            return
+
+        for t in self._worker_tasks:
+            t.cancel()
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def submit(self, x) -> np.ndarray:
+        """
+        Queue a single image and wait for its logits.
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_workers()
+
+        fut = loop.create_future()
+        self._pending.append((x, fut, loop.time()))
+        self._wakeup.set()
+        return await fut
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            while not self._pending:
+                if self._closed:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # wait for the batch to fill up, but never longer than the
+            # deadline of the oldest queued image
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            # another worker may have taken the batch while we waited
+            items = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            if not items:
+                continue
+
+            await self._run(items)
+
+    async def _run(self, items):
+        loop = asyncio.get_running_loop()
+        batch = [x for x, _, _ in items]
+
+        try:
+            outputs = await loop.run_in_executor(self.executor, self.run_batch, batch)
+        except Exception as e:
+            for _, fut, _ in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        size = len(items)
+        self.batch_sizes[size] += 1
+        self.total_batches += 1
+        self.total_images += size
+
+        for i, (_, fut, _) in enumerate(items):
+            if fut.done():
+                continue
+            if isinstance(outputs[i], Exception):
+                fut.set_exception(outputs[i])
+            else:
+                fut.set_result(outputs[i])
+
+    def close(self):
+        """
+        Stop the workers once everything already queued has been served
+        (used when a model version is replaced or unloaded). Safe to call
+        from any thread.
+        """
+        self._closed = True
+        if self._wakeup is not None and not self._loop.is_closed():
+            # asyncio.Event is not thread-safe: set it on its own loop
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stats(self):
+        avg = self.total_images / self.total_batches if self.total_batches else 0.0
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "workers": self.workers,
+            "queued": len(self._pending),
+            "total_batches": self.total_batches,
+            "total_images": self.total_images,
+            "avg_batch_size": round(avg, 2),
+            "batch_size_histogram": {
+                str(k): v for k, v in sorted(self.batch_sizes.items())
+            },
+        }
@@ -0,0 +1,94 @@
+# app/ml/model_config.py
+
+import os
+
+try:
+    import onnxruntime as ort
+except:
+    ort = None
+
+DISEASE_CLASSES = [
+    "Aphid",
+    "Black Rust",
+    "Blast",
+    "Brown Rust",
+    "Common Root Rot",
+    "Fusarium Head Blight",
+    "Leaf Blight",
+    "Mildew",
+    "Mite",
+    "Septoria",
+    "Smut",
+    "Stem fly",
+    "Tan spot",
+    "Yellow Rust",
+    "BYDV",
+    "Black_Chaff",
+    "Karnal_Bunt",
+    "Powdery_Mildew",
+    "Healthy"
+]
+
+MODEL_DIR = os.path.dirname(__file__)
+ONNX_PATH = os.path.join(MODEL_DIR, "wheat_disease_b3.onnx")
+
+# Variants produced by `python -m app.ml.prepare_models`.
+MODEL_VARIANTS = {
+    "fp32": "wheat_disease_b3.onnx",
+    "optimized": "wheat_disease_b3.opt.onnx",
+    "int8_dynamic": "wheat_disease_b3.int8-dynamic.onnx",
+    "int8_static": "wheat_disease_b3.int8-static.onnx",
+}
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "fp32")
+
+# Session options. ORT_*_THREADS = 0 lets onnxruntime decide.
+# Inter-op threads only matter with the parallel execution mode, which
+# is switched on when ORT_INTER_OP_THREADS > 1.
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+ORT_GRAPH_OPT_LEVEL = os.getenv("ORT_GRAPH_OPT_LEVEL", "all")   # disable | basic | extended | all
+ORT_ENABLE_MEM_ARENA = os.getenv("ORT_ENABLE_MEM_ARENA", "1") == "1"
+
+
+def variant_path(variant: str) -> str:
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant '{variant}', expected one of {list(MODEL_VARIANTS)}")
+    return os.path.join(MODEL_DIR, MODEL_VARIANTS[variant])
+
+
+def session_options(
+    intra_op_threads=ORT_INTRA_OP_THREADS,
+    inter_op_threads=ORT_INTER_OP_THREADS,
+    graph_opt_level=ORT_GRAPH_OPT_LEVEL,
+    mem_arena=ORT_ENABLE_MEM_ARENA,
+    optimized_model_path=None,
+):
+    levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = levels.get(graph_opt_level, levels["all"])
+    opts.enable_cpu_mem_arena = mem_arena
+
+    if intra_op_threads > 0:
+        opts.intra_op_num_threads = intra_op_threads
+    if inter_op_threads > 1:
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        opts.inter_op_num_threads = inter_op_threads
+
+    if optimized_model_path:
+        opts.optimized_model_filepath = optimized_model_path
+
+    return opts
+
+
+def create_session(path: str, **options):
+    return ort.InferenceSession(
+        path,
+        sess_options=session_options(**options),
+        providers=["CPUExecutionProvider"]
+    )
@@ -0,0 +1,120 @@
+# app/ml/model_sync.py
+"""
+Keeps the model registry of every API worker in step.
+
+A /models change is applied by the worker that got the request, which
+then calls `share()`: its registry (versions, default, candidate) is
+written to the model_deployments table and announced through
+app.utils.worker_events. The other workers, and workers started later,
+`reconcile()` with the table: build sessions for missing versions (in a
+thread), switch default and candidate, unload versions that are gone.
+Shadow statistics stay per worker.
+"""
+
+import asyncio
+
+from app.db.database import SessionLocal
+from app.ml.model_config import create_session
+from app.ml.model_utils import registry
+from app.models.model_deployment import ModelDeployment
+from app.utils import worker_events
+
+_lock = None
+
+
+def _save():
+    info = registry.info()
+    candidate = info["candidate_version"]
+
+    db = SessionLocal()
+    try:
+        db.query(ModelDeployment).delete()
+        db.add_all([
+            ModelDeployment(
+                version=version,
+                path=m["path"],
+                is_default=version == info["default_version"],
+                is_candidate=version == candidate,
+                shadow_percent=info["shadow_percent"] if version == candidate else 0.0,
+            )
+            for version, m in info["models"].items()
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def share(reloaded: str = None):
+    """
+    Store this worker's registry as the wanted state and tell the other
+    workers; `reloaded` is a version whose file was loaded again under
+    the same path. Blocking: call from a worker thread / sync endpoint.
+    """
+    _save()
+    worker_events.publish("models", {"reloaded": reloaded})
+
+
+def _wanted():
+    db = SessionLocal()
+    try:
+        return [
+            (r.version, r.path, r.is_default, r.is_candidate, r.shadow_percent)
+            for r in db.query(ModelDeployment).all()
+        ]
+    finally:
+        db.close()
+
+
+async def reconcile(payload=None):
+    """
+    Bring the local registry in line with model_deployments. No rows:
+    nothing was changed through /models, keep the startup model.
+    """
+    global _lock
+
+    if _lock is None:
+        _lock = asyncio.Lock()
+
+    reloaded = (payload or {}).get("reloaded")
+    async with _lock:
+        try:
+            rows = await asyncio.to_thread(_wanted)
+        except Exception as e:
+            print(" model sync error:", e)
+            return
+        if not rows:
+            return
+
+        loaded = registry.info()["models"]
+        for version, path, *_ in rows:
+            if version in loaded and loaded[version]["path"] == path and version != reloaded:
+                continue
+            try:
+                session = await asyncio.to_thread(create_session, path)
+            except Exception as e:
+                print(f" model sync: failed to load '{version}':", e)
+                continue
+            registry.register(version, path, session)
+
+        default = next((r[0] for r in rows if r[2]), None)
+        if default and default in registry.info()["models"]:
+            registry.set_default(default)
+
+        candidate = next((r for r in rows if r[3]), None)
+        if candidate and candidate[0] in registry.info()["models"]:
+            registry.set_candidate(candidate[0], candidate[4])
+        else:
+            registry.set_candidate(None, 0)
+
+        wanted = {r[0] for r in rows}
+        for version in list(registry.info()["models"]):
+            if version not in wanted and version != registry.default_version:
+                registry.unload(version)
+
+        print(f" Model registry synced (default {registry.default_version})")
+
+
+worker_events.on("models", reconcile)
@@ -1,87 +1,99 @@
+import asyncio
 import os
-from io import BytesIO
-from PIL import Image
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
 
 from app.ml.ai_helper import (
     get_short_remedy,
     get_remedy_explanation
 )
+from app.ml.batcher import InferenceBatcher, INFER_MAX_BATCH
+from app.ml.registry import ModelRegistry
+from app.utils.uploads import SpooledUpload
+from app.ml.preprocess import IMAGE_SIZE, preprocess_into, batch_buffer
+from app.ml.model_config import (
+    ort,
+    DISEASE_CLASSES,
+    ONNX_PATH,
+    MODEL_VARIANT,
+    ORT_INTRA_OP_THREADS,
+    ORT_INTER_OP_THREADS,
+    ORT_GRAPH_OPT_LEVEL,
+    variant_path,
+)
+
+loaded_variant = None
+
+# Version stored on Detection rows for the model loaded at startup.
+# Defaults to the architecture + variant, e.g. "b3-19class-fp32".
+MODEL_VERSION = os.getenv("MODEL_VERSION", "")
+
+# Inference never runs on the event loop: preprocessing and session.run
+# go to this bounded pool. Each session uses ORT_INTRA_OP_THREADS threads
+# (0 = let onnxruntime decide), so WORKERS x THREADS should fit the box.
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", "2"))
+INFER_MAX_QUEUE = int(os.getenv("INFER_MAX_QUEUE", "64"))
+
+infer_executor = ThreadPoolExecutor(
+    max_workers=INFER_WORKERS,
+    thread_name_prefix="onnx-infer",
+)
+
+_active_requests = 0
+_rejected_requests = 0
+
+
+class InferenceBusy(Exception):
+    """
+    Raised when INFER_MAX_QUEUE requests are already waiting for the model.
+    API handlers turn this into a 503.
+    """
 
-try:
-    import onnxruntime as ort
-except:
-    ort = None
-
-DISEASE_CLASSES = [
-    "Aphid",
-    "Black Rust",
-    "Blast",
-    "Brown Rust",
-    "Common Root Rot",
-    "Fusarium Head Blight",
-    "Leaf Blight",
-    "Mildew",
-    "Mite",
-    "Septoria",
-    "Smut",
-    "Stem fly",
-    "Tan spot",
-    "Yellow Rust",
-    "BYDV",
-    "Black_Chaff",
-    "Karnal_Bunt",
-    "Powdery_Mildew",
-    "Healthy"
-]
-
-IMAGE_SIZE = 380   
-ONNX_PATH = os.path.join(os.path.dirname(__file__), "wheat_disease_b3.onnx")
-
-onnx_session = None
 
 def load_onnx():
-    global onnx_session
+    global loaded_variant
 
     if ort is None:
         print(" onnxruntime NOT installed")
         return
 
-    if not os.path.exists(ONNX_PATH):
-        print(f" ONNX not found: {ONNX_PATH}")
+    variant = MODEL_VARIANT
+    try:
+        path = variant_path(variant)
+    except ValueError as e:
+        print(f" {e}")
+        variant, path = "fp32", ONNX_PATH
+
+    if not os.path.exists(path) and variant != "fp32":
+        print(f" Model variant '{variant}' not found ({path}), falling back to fp32")
+        variant, path = "fp32", ONNX_PATH
+
+    if not os.path.exists(path):
+        print(f" ONNX not found: {path}")
         return
 
+    version = MODEL_VERSION or f"b3-19class-{variant}"
     try:
-        onnx_session = ort.InferenceSession(
-            ONNX_PATH,
-            providers=["CPUExecutionProvider"]
-        )
-        print(" 19-class EfficientNet-B3 ONNX loaded.")
+        registry.load(version, path, make_default=True)
+        loaded_variant = variant
+        print(f" 19-class EfficientNet-B3 ONNX loaded ({variant}, version {version}).")
     except Exception as e:
         print(" Failed to load ONNX:", e)
-        onnx_session = None
 
 
 def load_model():
     load_onnx()
-    if onnx_session:
+    if registry.get():
         print(" Model ready.")
     else:
         print(" ERROR: model NOT loaded")
 
 
 def preprocess_image(image_bytes: bytes):
-    img = Image.open(BytesIO(image_bytes)).convert("RGB")
-    img = img.resize((IMAGE_SIZE, IMAGE_SIZE))
-
-    arr = np.array(img).astype("float32") / 255.0
-
-    mean = np.array([0.485, 0.456, 0.406], dtype="float32")
-    std = np.array([0.229, 0.224, 0.225], dtype="float32")
-
-    arr = (arr - mean) / std
-    arr = arr.transpose(2, 0, 1)
-    arr = np.expand_dims(arr, 0)
+    arr = np.empty((1, 3, IMAGE_SIZE, IMAGE_SIZE), dtype="float32")
+    preprocess_into(image_bytes, arr[0])
     return arr
 
 
@@ -90,32 +102,223 @@ def softmax(x):
     return e / e.sum()
 
 
-def predict_image(image_bytes: bytes, language="en"):
-    global onnx_session
+def run_batch(session, batch: np.ndarray) -> np.ndarray:
+    """
+    Runs an Nx3xHxW batch through the session and returns Nx19 logits.
+    Falls back to one call per image when the exported model has a
+    fixed batch dimension of 1.
+    """
+    inp = session.get_inputs()[0]
+    batch_dim = inp.shape[0] if inp.shape else None
 
-    if onnx_session is None:
-        load_onnx()
+    if isinstance(batch_dim, int) and batch_dim != len(batch):
+        return np.concatenate([
+            session.run(None, {inp.name: batch[i:i + 1]})[0]
+            for i in range(len(batch))
+        ], axis=0)
 
-    if onnx_session is None:
-        return {"error": "ONNX model not loaded"}
+    return session.run(None, {inp.name: batch})[0]
 
-    x = preprocess_image(image_bytes)
-    inp_name = onnx_session.get_inputs()[0].name
 
-    logits = onnx_session.run(None, {inp_name: x})[0][0]
-    probs = softmax(logits)
+def infer_images(session, sources):
+    """
+    Batch job for the micro-batcher: decodes every queued image straight
+    into this worker's preallocated NCHW buffer, then runs the model once.
+    An image that fails to decode only fails its own request.
+    """
+    buf = batch_buffer(len(sources), capacity=INFER_MAX_BATCH)
+    outputs = [None] * len(sources)
+    slots = []
+
+    for i, src in enumerate(sources):
+        try:
+            preprocess_into(src, buf[len(slots)])
+            slots.append(i)
+        except Exception as e:
+            outputs[i] = e
+
+    if slots:
+        logits = run_batch(session, buf[:len(slots)])
+        for row, i in enumerate(slots):
+            outputs[i] = logits[row]
+
+    return outputs
+
+
+# Every loaded version gets its own micro-batcher; all of them share
+# the inference pool.
+registry = ModelRegistry(
+    lambda session: InferenceBatcher(
+        partial(infer_images, session),
+        executor=infer_executor,
+        workers=INFER_WORKERS,
+    )
+)
+
+
+def default_model_version():
+    return registry.default_version
+
 
+def classify_logits(logits):
+    probs = softmax(logits)
     idx = int(np.argmax(probs))
-    predicted = DISEASE_CLASSES[idx]
-    conf = float(probs[idx] * 100)
+    return DISEASE_CLASSES[idx], float(probs[idx] * 100)
+
 
-    remedy = get_short_remedy(predicted, language)
-    explanation = get_remedy_explanation(predicted, language)
+def _build_result(logits, model_version, language="en", with_remedy=True):
+    predicted, conf = classify_logits(logits)
 
-    return {
+    result = {
         "exact_disease": predicted,
         "confidence": conf,
-        "remedy": remedy,
-        "ai_explanation": explanation,
-        "backend": "19-class-efficientnet-b3-onnx"
+        "backend": "19-class-efficientnet-b3-onnx",
+        "model_version": model_version,
     }
+
+    if with_remedy:
+        result["remedy"] = get_short_remedy(predicted, language)
+        result["ai_explanation"] = get_remedy_explanation(predicted, language)
+
+    return result
+
+
+def predict_image(image_bytes: bytes, language="en"):
+    if registry.get() is None:
+        load_onnx()
+
+    entry = registry.get()
+    if entry is None:
+        return {"error": "ONNX model not loaded"}
+
+    x = preprocess_image(image_bytes)
+    logits = run_batch(entry.session, x)[0]
+
+    return _build_result(logits, entry.version, language)
+
+
+def _image_source(source):
+    # spooled uploads are decoded straight from their spooled file
+    return source.open() if isinstance(source, SpooledUpload) else source
+
+
+async def _shadow_predict(candidate, source, served: str):
+    """
+    Runs the candidate model on a copy of a request and records whether
+    it agrees with the class the default model returned.
+    """
+    try:
+        logits = await candidate.batcher.submit(_image_source(source))
+    except Exception as e:
+        print(f" Shadow inference failed ({candidate.version}): {e}")
+        registry.record_shadow(candidate.version, agreed=False, failed=True)
+        return
+    finally:
+        if isinstance(source, SpooledUpload):
+            source.release()
+
+    candidate.requests += 1
+    agreed = DISEASE_CLASSES[int(np.argmax(logits))] == served
+    registry.record_shadow(candidate.version, agreed)
+
+
+async def predict_image_async(source, version=None):
+    """
+    Classification only (no LLM remedy), with the forward pass going
+    through the model's micro-batcher so concurrent uploads share one
+    session.run. Remedy text is produced separately by remedy_jobs.
+    Raises InferenceBusy instead of queueing past INFER_MAX_QUEUE.
+    `source` is the image as bytes, a file path or a SpooledUpload.
+
+    Uses the registry's default version unless `version` is given. A
+    share of requests is also sent to the shadow candidate, if any;
+    its answer is only compared, never returned.
+    """
+    global _active_requests, _rejected_requests
+
+    if registry.get() is None:
+        load_onnx()
+
+    entry = registry.get(version)
+    if entry is None:
+        return {"error": "ONNX model not loaded"}
+
+    if _active_requests >= INFER_MAX_QUEUE:
+        _rejected_requests += 1
+        raise InferenceBusy("Inference queue is full, please retry shortly")
+
+    _active_requests += 1
+    try:
+        logits = await entry.batcher.submit(_image_source(source))
+    finally:
+        _active_requests -= 1
+
+    entry.requests += 1
+    result = _build_result(logits, entry.version, with_remedy=False)
+
+    # shadow traffic is best effort: skip it when the pool is already busy
+    candidate = registry.pick_shadow(entry.version)
+    if candidate is not None and _active_requests < INFER_MAX_QUEUE // 2:
+        if isinstance(source, SpooledUpload):
+            source.retain()
+        asyncio.create_task(_shadow_predict(candidate, source, result["exact_disease"]))
+
+    return result
+
+
+async def predict_tiles_async(frame, boxes, version=None):
+    """
+    Classifies crops of a decoded drone frame through the model's
+    micro-batcher. Only a window of max_batch x workers tiles is cropped
+    and queued at a time, so a large frame is never expanded to float32
+    as a whole and phone uploads can still interleave with the tiles.
+    Returns (model_version, [logits per box]).
+    """
+    global _active_requests, _rejected_requests
+
+    if registry.get() is None:
+        load_onnx()
+
+    entry = registry.get(version)
+    if entry is None:
+        raise RuntimeError("ONNX model not loaded")
+
+    if _active_requests >= INFER_MAX_QUEUE:
+        _rejected_requests += 1
+        raise InferenceBusy("Inference queue is full, please retry shortly")
+
+    window = entry.batcher.max_batch * entry.batcher.workers
+    in_flight = deque()
+    logits = []
+
+    _active_requests += 1
+    try:
+        for box in boxes:
+            in_flight.append(asyncio.ensure_future(entry.batcher.submit(frame.crop(box))))
+            if len(in_flight) >= window:
+                logits.append(await in_flight.popleft())
+        while in_flight:
+            logits.append(await in_flight.popleft())
+    finally:
+        for task in in_flight:
+            task.cancel()
+        _active_requests -= 1
+
+    entry.requests += 1
+    return entry.version, logits
+
+
+def get_inference_stats():
+    entry = registry.get()
+    stats = entry.batcher.stats() if entry else {}
+    stats.update({
+        "model_variant": loaded_variant,
+        "graph_opt_level": ORT_GRAPH_OPT_LEVEL,
+        "intra_op_threads": ORT_INTRA_OP_THREADS,
+        "inter_op_threads": ORT_INTER_OP_THREADS,
+        "max_queue": INFER_MAX_QUEUE,
+        "active_requests": _active_requests,
+        "rejected_requests": _rejected_requests,
+        "registry": registry.info(),
+    })
+    return stats
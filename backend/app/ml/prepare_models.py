@@ -0,0 +1,229 @@
+# app/ml/prepare_models.py
+"""
+Builds CPU deployment variants of wheat_disease_b3.onnx and compares them.
+
+Run from backend/:
+    python -m app.ml.prepare_models optimize
+    python -m app.ml.prepare_models quantize-dynamic
+    python -m app.ml.prepare_models quantize-static --calib-dir data/calib
+    python -m app.ml.prepare_models report --images data/holdout [--out report.json]
+    python -m app.ml.prepare_models all --calib-dir data/calib --images data/holdout
+
+The held-out set is one sub-folder per class, named like DISEASE_CLASSES
+(e.g. data/holdout/Yellow Rust/*.jpg). Pick the variant at runtime with
+MODEL_VARIANT=fp32|optimized|int8_dynamic|int8_static.
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from app.ml.model_config import (
+    ort,
+    DISEASE_CLASSES,
+    ONNX_PATH,
+    MODEL_VARIANTS,
+    variant_path,
+    create_session,
+)
+from app.ml.preprocess import IMAGE_SIZE, preprocess_into
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _list_images(folder: str):
+    return sorted(
+        p for p in glob.glob(os.path.join(folder, "**", "*"), recursive=True)
+        if p.lower().endswith(IMAGE_EXTS)
+    )
+
+
+def _load(path: str) -> np.ndarray:
+    x = np.empty((1, 3, IMAGE_SIZE, IMAGE_SIZE), dtype="float32")
+    preprocess_into(path, x[0])
+    return x
+
+
+def optimize():
+    """
+    Serializes the graph after onnxruntime's offline optimizations so
+    startup doesn't redo them. Note: an 'all'-level optimized model may
+    contain CPU-specific fused ops, so build it on the deployment machine.
+    """
+    out = variant_path("optimized")
+    create_session(ONNX_PATH, graph_opt_level="all", optimized_model_path=out)
+    print(f" optimized model written: {out}")
+    return out
+
+
+def _pre_processed_input() -> str:
+    """
+    Shape inference + graph cleanup recommended before quantization.
+    Falls back to the raw model on older onnxruntime builds.
+    """
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError:
+        return ONNX_PATH
+
+    prep = os.path.join(os.path.dirname(ONNX_PATH), "wheat_disease_b3.prep.onnx")
+    try:
+        quant_pre_process(ONNX_PATH, prep)
+    except Exception as e:
+        print(f" quantization pre-processing skipped: {e}")
+        return ONNX_PATH
+    return prep
+
+
+def quantize_dynamic():
+    from onnxruntime.quantization import quantize_dynamic as _quantize, QuantType
+
+    out = variant_path("int8_dynamic")
+    _quantize(_pre_processed_input(), out, weight_type=QuantType.QInt8)
+    print(f" dynamic INT8 model written: {out}")
+    return out
+
+
+def quantize_static(calib_dir: str, max_images: int = 200):
+    from onnxruntime.quantization import (
+        quantize_static as _quantize,
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+    )
+
+    paths = _list_images(calib_dir)[:max_images]
+    if not paths:
+        raise SystemExit(f"No calibration images found in {calib_dir}")
+
+    src = _pre_processed_input()
+    input_name = create_session(src).get_inputs()[0].name
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            p = next(self._paths, None)
+            return None if p is None else {input_name: _load(p)}
+
+    out = variant_path("int8_static")
+    _quantize(
+        src,
+        out,
+        ImageReader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    print(f" static INT8 model written ({len(paths)} calibration images): {out}")
+    return out
+
+
+def _holdout(images_dir: str):
+    samples = []
+    for idx, name in enumerate(DISEASE_CLASSES):
+        for p in _list_images(os.path.join(images_dir, name)):
+            samples.append((p, idx))
+    return samples
+
+
+def report(images_dir: str, batch_size: int = 8, out_path=None):
+    """
+    Accuracy (top-1 on the held-out set) vs. latency for every variant
+    that exists on disk.
+    """
+    samples = _holdout(images_dir)
+    if not samples:
+        raise SystemExit(f"No labelled images under {images_dir}/<class name>/")
+
+    inputs = np.concatenate([_load(p) for p, _ in samples])
+    labels = np.array([y for _, y in samples])
+
+    rows = []
+    for variant in MODEL_VARIANTS:
+        path = variant_path(variant)
+        if not os.path.exists(path):
+            continue
+
+        sess = create_session(path)
+        name = sess.get_inputs()[0].name
+        sess.run(None, {name: inputs[:1]})    # warm-up
+
+        single = []
+        preds = []
+        for i in range(len(inputs)):
+            t = time.perf_counter()
+            logits = sess.run(None, {name: inputs[i:i + 1]})[0]
+            single.append((time.perf_counter() - t) * 1000)
+            preds.append(int(np.argmax(logits[0])))
+
+        # batched throughput (skipped for models exported with batch=1)
+        batched = None
+        if not isinstance(sess.get_inputs()[0].shape[0], int):
+            t = time.perf_counter()
+            for i in range(0, len(inputs), batch_size):
+                sess.run(None, {name: inputs[i:i + batch_size]})
+            batched = len(inputs) / (time.perf_counter() - t)
+
+        rows.append({
+            "variant": variant,
+            "size_mb": round(os.path.getsize(path) / 1e6, 1),
+            "accuracy": round(float(np.mean(np.array(preds) == labels)), 4),
+            "p50_ms": round(float(np.percentile(single, 50)), 2),
+            "p95_ms": round(float(np.percentile(single, 95)), 2),
+            "batch_images_per_s": round(batched, 1) if batched else None,
+        })
+
+    print(f"\n{len(samples)} held-out images, batch size {batch_size}\n")
+    print(f"{'variant':<14}{'size MB':>9}{'top-1':>9}{'p50 ms':>9}{'p95 ms':>9}{'img/s':>9}")
+    for r in rows:
+        print(
+            f"{r['variant']:<14}{r['size_mb']:>9}{r['accuracy']:>9.3f}"
+            f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['batch_images_per_s'] or '-':>9}"
+        )
+
+    if out_path:
+        with open(out_path, "w") as f:
+            json.dump({"images": len(samples), "batch_size": batch_size, "variants": rows}, f, indent=2)
+        print(f"\n report written: {out_path}")
+
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prepare and compare ONNX model variants")
+    ap.add_argument("command", choices=["optimize", "quantize-dynamic", "quantize-static", "report", "all"])
+    ap.add_argument("--calib-dir", help="images for static quantization calibration")
+    ap.add_argument("--calib-max", type=int, default=200)
+    ap.add_argument("--images", help="held-out set: <dir>/<class name>/*.jpg")
+    ap.add_argument("--batch", type=int, default=8)
+    ap.add_argument("--out", help="write the report as JSON")
+    args = ap.parse_args()
+
+    if ort is None:
+        raise SystemExit("onnxruntime is not installed")
+    if not os.path.exists(ONNX_PATH):
+        raise SystemExit(f"ONNX not found: {ONNX_PATH}")
+
+    if args.command in ("optimize", "all"):
+        optimize()
+    if args.command in ("quantize-dynamic", "all"):
+        quantize_dynamic()
+    if args.command == "quantize-static" or (args.command == "all" and args.calib_dir):
+        if not args.calib_dir:
+            raise SystemExit("--calib-dir is required for static quantization")
+        quantize_static(args.calib_dir, args.calib_max)
+    if args.command == "report" or (args.command == "all" and args.images):
+        if not args.images:
+            raise SystemExit("--images is required for the report")
+        report(args.images, args.batch, args.out)
+
+
+if __name__ == "__main__":
+    main()
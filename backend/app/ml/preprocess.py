@@ -0,0 +1,69 @@
+# app/ml/preprocess.py
+
+import threading
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = 380
+
+MEAN = np.array([0.485, 0.456, 0.406], dtype="float32")
+STD = np.array([0.229, 0.224, 0.225], dtype="float32")
+
+# (x / 255 - mean) / std folded into one multiply-add: x * SCALE + OFFSET,
+# shaped to broadcast over a 3xHxW (CHW) image.
+SCALE = (1.0 / (255.0 * STD)).astype("float32").reshape(3, 1, 1)
+OFFSET = (-MEAN / STD).astype("float32").reshape(3, 1, 1)
+
+_local = threading.local()
+
+
+def decode_resized(source, size: int = IMAGE_SIZE) -> Image.Image:
+    """
+    Decode to a size x size RGB image. For JPEGs, draft mode lets libjpeg
+    decode straight to a reduced scale (1/2, 1/4, 1/8) that is still at
+    least `size`, so a 12MP phone photo is never fully decoded.
+    A PIL image is used as is (only resized).
+    """
+    if isinstance(source, Image.Image):
+        # already decoded, e.g. a tile cropped from a drone frame
+        img = source
+    else:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = BytesIO(source)
+        img = Image.open(source)
+        img.draft("RGB", (size, size))
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.BICUBIC)
+    return img
+
+
+def preprocess_into(source, out: np.ndarray, size: int = IMAGE_SIZE):
+    """
+    Decode `source` (bytes, file object or PIL image) and write the normalized CHW
+    float32 tensor into `out` (3 x size x size, e.g. one slot of a batch
+    buffer). No intermediate full-size float arrays are allocated.
+    """
+    hwc = np.asarray(decode_resized(source, size))
+    chw = hwc.transpose(2, 0, 1)
+
+    np.multiply(chw, SCALE, out=out, casting="unsafe")
+    out += OFFSET
+    return out
+
+
+def batch_buffer(n: int, capacity: int = 0, size: int = IMAGE_SIZE) -> np.ndarray:
+    """
+    Per-thread reusable NCHW float32 buffer holding at least `capacity`
+    images; returns a view of its first n slots.
+    """
+    buf = getattr(_local, "buffer", None)
+    if buf is None or buf.shape[0] < n or buf.shape[2] != size:
+        buf = np.empty((max(n, capacity), 3, size, size), dtype="float32")
+        _local.buffer = buf
+    return buf[:n]
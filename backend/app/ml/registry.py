@@ -0,0 +1,132 @@
+# app/ml/registry.py
+
+import random
+import threading
+from datetime import datetime
+
+from app.ml.model_config import create_session
+
+
+class ModelEntry:
+    def __init__(self, version: str, path: str, session, batcher):
+        self.version = version
+        self.path = path
+        self.session = session
+        self.batcher = batcher
+        self.loaded_at = datetime.utcnow()
+        self.requests = 0
+
+    def info(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at.isoformat(),
+            "requests": self.requests,
+            "batching": self.batcher.stats(),
+        }
+
+
+class ModelRegistry:
+    """
+    Holds several ONNX sessions keyed by version. The default version
+    serves traffic and can be swapped without a restart; an optional
+    candidate receives a copy of `shadow_percent` % of requests so its
+    predictions can be compared with the default's (never returned).
+    """
+
+    def __init__(self, batcher_factory):
+        self._batcher_factory = batcher_factory
+        self._models = {}
+        self._lock = threading.Lock()
+
+        self.default_version = None
+        self.candidate_version = None
+        self.shadow_percent = 0.0
+        self.shadow_stats = {}
+
+    def load(self, version: str, path: str, make_default: bool = False) -> ModelEntry:
+        return self.register(version, path, create_session(path), make_default)
+
+    def register(self, version: str, path: str, session, make_default: bool = False) -> ModelEntry:
+        """
+        Add an already created session. Call from the event loop thread;
+        create the session beforehand in a worker thread, it is slow.
+        """
+        entry = ModelEntry(version, path, session, self._batcher_factory(session))
+
+        with self._lock:
+            old = self._models.get(version)
+            self._models[version] = entry
+            if make_default or self.default_version is None:
+                self.default_version = version
+
+        if old is not None:
+            old.batcher.close()
+        return entry
+
+    def get(self, version=None):
+        return self._models.get(version or self.default_version)
+
+    def set_default(self, version: str):
+        with self._lock:
+            if version not in self._models:
+                raise KeyError(version)
+            self.default_version = version
+            if self.candidate_version == version:
+                self.candidate_version = None
+                self.shadow_percent = 0.0
+
+    def set_candidate(self, version, percent: float):
+        with self._lock:
+            if version is not None and version not in self._models:
+                raise KeyError(version)
+            self.candidate_version = version
+            self.shadow_percent = max(0.0, min(100.0, float(percent))) if version else 0.0
+            if version:
+                self.shadow_stats.setdefault(version, {"compared": 0, "agreed": 0, "failed": 0})
+
+    def unload(self, version: str):
+        with self._lock:
+            if version == self.default_version:
+                raise ValueError("Cannot unload the default model")
+            entry = self._models.pop(version, None)
+            if entry is None:
+                raise KeyError(version)
+            if self.candidate_version == version:
+                self.candidate_version = None
+                self.shadow_percent = 0.0
+
+        entry.batcher.close()
+
+    def pick_shadow(self, served_version: str):
+        """
+        Candidate entry to shadow this request with, or None.
+        """
+        candidate = self.candidate_version
+        if not candidate or candidate == served_version or self.shadow_percent <= 0:
+            return None
+        if random.random() * 100 >= self.shadow_percent:
+            return None
+        return self._models.get(candidate)
+
+    def record_shadow(self, candidate: str, agreed, failed: bool = False):
+        stats = self.shadow_stats.setdefault(candidate, {"compared": 0, "agreed": 0, "failed": 0})
+        if failed:
+            stats["failed"] += 1
+            return
+        stats["compared"] += 1
+        if agreed:
+            stats["agreed"] += 1
+
+    def info(self):
+        shadow = {
+            v: {**s, "agreement": round(s["agreed"] / s["compared"], 4) if s["compared"] else None}
+            for v, s in self.shadow_stats.items()
+        }
+        return {
+            "default_version": self.default_version,
+            "candidate_version": self.candidate_version,
+            "shadow_percent": self.shadow_percent,
+            "shadow": shadow,
+            "models": {v: e.info() for v, e in list(self._models.items())},
+        }
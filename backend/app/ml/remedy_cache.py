@@ -0,0 +1,246 @@
+# app/ml/remedy_cache.py
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import SessionLocal
+from app.models.ai_cache import AICacheEntry
+from app.utils import worker_events
+
+# Remedy / explanation text only depends on (disease, language, season)
+# and the prompt itself, so it is generated once and then served from
+# memory, backed by the ai_cache table so it survives restarts.
+# Bump PROMPT_VERSION in ai_helper whenever a prompt changes: rows
+# written with an older version are never served and get purged.
+AI_CACHE_TTL_HOURS = float(os.getenv("AI_CACHE_TTL_HOURS", str(24 * 30)))
+AI_CACHE_IO_THREADS = int(os.getenv("AI_CACHE_IO_THREADS", "4"))
+
+# DB reads / writes of async callers get their own threads, so LLM
+# bursts never queue behind (or in front of) /predict's DB calls on the
+# default executor
+_io = ThreadPoolExecutor(max_workers=AI_CACHE_IO_THREADS, thread_name_prefix="ai-cache")
+
+_memory = {}
+_lock = threading.Lock()
+
+stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+
+def _expired(created_at) -> bool:
+    if AI_CACHE_TTL_HOURS <= 0 or created_at is None:
+        return False
+    return datetime.utcnow() - created_at > timedelta(hours=AI_CACHE_TTL_HOURS)
+
+
+def _load(key):
+    kind, disease, language, season, version = key
+
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(AICacheEntry)
+            .filter(
+                AICacheEntry.kind == kind,
+                AICacheEntry.disease == disease,
+                AICacheEntry.language == language,
+                AICacheEntry.season == season,
+                AICacheEntry.prompt_version == version,
+            )
+            .first()
+        )
+        if row is None or _expired(row.created_at):
+            return None
+        return row.text, row.created_at
+    finally:
+        db.close()
+
+
+def _save(key, text):
+    kind, disease, language, season, version = key
+
+    db = SessionLocal()
+    try:
+        db.query(AICacheEntry).filter(
+            AICacheEntry.kind == kind,
+            AICacheEntry.disease == disease,
+            AICacheEntry.language == language,
+            AICacheEntry.season == season,
+            AICacheEntry.prompt_version == version,
+        ).delete()
+        db.add(AICacheEntry(
+            kind=kind,
+            disease=disease,
+            language=language,
+            season=season,
+            prompt_version=version,
+            text=text,
+        ))
+        db.commit()
+    except IntegrityError:
+        # a concurrent caller stored the same key first
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        print(" ai_cache save error:", e)
+    finally:
+        db.close()
+
+
+def get_cached(key):
+    """
+    Cached text for key (memory first, then DB), or None.
+    """
+    entry = _memory.get(key)
+    if entry and not _expired(entry[1]):
+        stats["memory_hits"] += 1
+        return entry[0]
+
+    try:
+        entry = _load(key)
+    except Exception as e:
+        print(" ai_cache load error:", e)
+        entry = None
+
+    if entry:
+        stats["db_hits"] += 1
+        with _lock:
+            _memory[key] = entry
+        return entry[0]
+
+    return None
+
+
+def put(key, text):
+    with _lock:
+        _memory[key] = (text, datetime.utcnow())
+    _save(key, text)
+
+
+def get_or_generate(key, generate, flight):
+    """
+    key = (kind, disease, language, season, prompt_version).
+    `generate` is only called on a miss and must raise on failure, so
+    fallback text is never cached. Concurrent misses share one call
+    through `flight` (a SingleFlight); only that call stores the text.
+    """
+    text = get_cached(key)
+    if text is not None:
+        return text
+
+    def lead():
+        stats["misses"] += 1
+        text = generate()
+        put(key, text)
+        return text
+
+    return flight.do(key, lead)
+
+
+async def get_cached_async(key):
+    entry = _memory.get(key)
+    if entry and not _expired(entry[1]):
+        stats["memory_hits"] += 1
+        return entry[0]
+    return await asyncio.get_running_loop().run_in_executor(_io, get_cached, key)
+
+
+async def put_async(key, text):
+    await asyncio.get_running_loop().run_in_executor(_io, put, key, text)
+
+
+async def get_or_generate_async(key, generate, flight):
+    """
+    get_or_generate() for a coroutine function `generate`.
+    """
+    text = await get_cached_async(key)
+    if text is not None:
+        return text
+
+    async def lead():
+        stats["misses"] += 1
+        text = await generate()
+        await put_async(key, text)
+        return text
+
+    return await flight.do_async(key, lead)
+
+
+def is_cached(key) -> bool:
+    entry = _memory.get(key)
+    if entry and not _expired(entry[1]):
+        return True
+    try:
+        return _load(key) is not None
+    except Exception:
+        return False
+
+
+def _forget(disease=None, language=None, kind=None):
+    with _lock:
+        for key in list(_memory):
+            if kind and key[0] != kind:
+                continue
+            if disease and key[1] != disease:
+                continue
+            if language and key[2] != language:
+                continue
+            _memory.pop(key, None)
+
+
+def _on_invalidated(payload):
+    # None: events may have been missed, drop the whole memory copy
+    _forget(**(payload or {}))
+
+
+worker_events.on("ai_cache.invalidate", _on_invalidated)
+
+
+def invalidate(disease=None, language=None, kind=None) -> int:
+    """
+    Drop cached text (memory of every worker + DB). With no filters
+    everything goes.
+    """
+    db = SessionLocal()
+    try:
+        q = db.query(AICacheEntry)
+        if kind:
+            q = q.filter(AICacheEntry.kind == kind)
+        if disease:
+            q = q.filter(AICacheEntry.disease == disease)
+        if language:
+            q = q.filter(AICacheEntry.language == language)
+        deleted = q.delete()
+        db.commit()
+    finally:
+        db.close()
+
+    # after the commit, so no worker can reload the old rows
+    _forget(disease, language, kind)
+    worker_events.publish("ai_cache.invalidate", {"disease": disease, "language": language, "kind": kind})
+    return deleted
+
+
+def purge_stale(prompt_version: int) -> int:
+    """
+    Remove rows written by older prompt versions.
+    """
+    db = SessionLocal()
+    try:
+        deleted = (
+            db.query(AICacheEntry)
+            .filter(AICacheEntry.prompt_version != prompt_version)
+            .delete()
+        )
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def get_stats():
+    return {**stats, "memory_entries": len(_memory), "ttl_hours": AI_CACHE_TTL_HOURS}
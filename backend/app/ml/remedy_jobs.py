@@ -0,0 +1,184 @@
+# app/ml/remedy_jobs.py
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import SessionLocal
+from app.ml.ai_helper import get_short_remedy_async, get_remedy_explanation_async
+from app.models.remedy_result import RemedyResult
+from app.utils.socket_manager import broadcast_remedy_ready
+
+# Remedy / explanation text is generated after /detections/predict has
+# already answered with the disease label. Results live in the
+# remedy_results table so the follow-up endpoint works on any worker,
+# and are pushed over Socket.IO. A detection is generated by one worker
+# at a time: a pending row is left alone unless it is older than
+# REMEDY_PENDING_TIMEOUT_S (its worker went away).
+REMEDY_PENDING_TIMEOUT_S = float(os.getenv("REMEDY_PENDING_TIMEOUT_S", "120"))
+REMEDY_POLL_S = float(os.getenv("REMEDY_POLL_S", "0.5"))
+REMEDY_RESULTS_RETENTION_DAYS = float(os.getenv("REMEDY_RESULTS_RETENTION_DAYS", "7"))
+
+_tasks = {}
+
+
+def _entry(row) -> dict:
+    return {
+        "detection_id": row.detection_id,
+        "disease": row.disease,
+        "language": row.language,
+        "status": row.status,
+        "remedy": row.remedy,
+        "ai_explanation": row.ai_explanation,
+    }
+
+
+def _load(detection_id: int):
+    db = SessionLocal()
+    try:
+        row = db.get(RemedyResult, detection_id)
+        return _entry(row) if row else None
+    finally:
+        db.close()
+
+
+def _claim(detection_id: int, disease: str, language: str):
+    """
+    (entry, claimed): claimed when this worker should generate it, i.e.
+    no row yet, a failed one or an abandoned pending one.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        row = db.get(RemedyResult, detection_id)
+
+        if row is None:
+            row = RemedyResult(
+                detection_id=detection_id, disease=disease, language=language,
+                status="pending", updated_at=now,
+            )
+            db.add(row)
+            try:
+                db.commit()
+            except IntegrityError:
+                # another worker inserted it first
+                db.rollback()
+                return _entry(db.get(RemedyResult, detection_id)), False
+            return _entry(row), True
+
+        if row.status == "ready":
+            return _entry(row), False
+        if row.status == "pending" and now - row.updated_at < timedelta(seconds=REMEDY_PENDING_TIMEOUT_S):
+            return _entry(row), False
+
+        # only if nobody took it over since we read it
+        claimed = db.query(RemedyResult).filter(
+            RemedyResult.detection_id == detection_id,
+            RemedyResult.updated_at == row.updated_at,
+        ).update({
+            "disease": disease, "language": language, "status": "pending",
+            "remedy": None, "ai_explanation": None, "updated_at": now,
+        }, synchronize_session=False)
+        db.commit()
+        db.expire_all()
+        return _entry(db.get(RemedyResult, detection_id)), bool(claimed)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _save(entry: dict):
+    db = SessionLocal()
+    try:
+        db.query(RemedyResult).filter(RemedyResult.detection_id == entry["detection_id"]).update({
+            "status": entry["status"],
+            "remedy": entry["remedy"],
+            "ai_explanation": entry["ai_explanation"],
+            "updated_at": datetime.utcnow(),
+        }, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def schedule_remedy(detection_id: int, disease: str, language: str = "en") -> dict:
+    """
+    Start generating remedy + explanation for a detection in the
+    background, unless it is ready or being generated (by any worker).
+    Returns the stored entry immediately.
+    """
+    entry, claimed = await asyncio.to_thread(_claim, detection_id, disease, language)
+
+    if claimed and detection_id not in _tasks:
+        task = asyncio.create_task(_generate(entry))
+        _tasks[detection_id] = task
+        task.add_done_callback(lambda _: _tasks.pop(detection_id, None))
+
+    return entry
+
+
+async def _generate(entry: dict):
+    # both LLM calls go through the async client, side by side, so they
+    # never hold a thread of the pool /predict runs on. No fallback text
+    # here: a failed call leaves the entry "failed" so the next request
+    # for it schedules it again instead of keeping the stub.
+    try:
+        remedy, explanation = await asyncio.gather(
+            get_short_remedy_async(entry["disease"], entry["language"], fallback=False),
+            get_remedy_explanation_async(entry["disease"], entry["language"], fallback=False),
+        )
+        entry["remedy"] = remedy
+        entry["ai_explanation"] = explanation
+        entry["status"] = "ready"
+    except Exception as e:
+        print(" remedy job error:", e)
+        entry["status"] = "failed"
+
+    try:
+        await asyncio.to_thread(_save, entry)
+    except Exception as e:
+        print(" remedy save error:", e)
+        return
+
+    if entry["status"] == "ready":
+        await broadcast_remedy_ready(entry)
+
+
+async def get_remedy_result(detection_id: int):
+    return await asyncio.to_thread(_load, detection_id)
+
+
+async def wait_for_remedy(detection_id: int, timeout: float):
+    """
+    Long-poll helper: wait up to `timeout` seconds for a pending remedy,
+    on the task when this worker generates it, else on the table.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    task = _tasks.get(detection_id)
+    if task is not None and timeout > 0:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    result = await get_remedy_result(detection_id)
+    while result is not None and result["status"] == "pending" and loop.time() < deadline:
+        await asyncio.sleep(min(REMEDY_POLL_S, max(deadline - loop.time(), 0)))
+        result = await get_remedy_result(detection_id)
+    return result
+
+
+def prune(db) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=REMEDY_RESULTS_RETENTION_DAYS)
+    deleted = db.query(RemedyResult).filter(RemedyResult.updated_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,152 @@
+# app/ml/result_cache.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from app.db.database import SessionLocal
+from app.models.prediction_cache import PredictionCacheEntry
+
+# The offline mobile app retries uploads, so the exact same photo often
+# reaches /detections/predict and /upload/image several times. Results
+# are keyed by the sha256 of the raw bytes: a repeat skips decoding,
+# inference and the storage re-upload.
+# PREDICTION_CACHE_PERSIST=1 also keeps entries in the prediction_cache
+# table so they survive restarts.
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "5000"))
+PREDICTION_CACHE_PERSIST = os.getenv("PREDICTION_CACHE_PERSIST", "0") == "1"
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+
+stats = {
+    "lookups": 0,
+    "memory_hits": 0,
+    "db_hits": 0,
+    "inference_skipped": 0,
+    "uploads_skipped": 0,
+}
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _remember(h: str, entry: dict):
+    with _lock:
+        _lru[h] = entry
+        _lru.move_to_end(h)
+        while len(_lru) > PREDICTION_CACHE_SIZE:
+            _lru.popitem(last=False)
+
+
+def _load(h: str):
+    db = SessionLocal()
+    try:
+        row = db.query(PredictionCacheEntry).filter(
+            PredictionCacheEntry.content_hash == h
+        ).first()
+        if row is None:
+            return None
+        entry = {"image_url": row.image_url}
+        if row.disease is not None:
+            entry.update({
+                "exact_disease": row.disease,
+                "confidence": row.confidence,
+                "backend": row.backend,
+                "model_version": row.model_version,
+            })
+        return entry
+    finally:
+        db.close()
+
+
+def _persist(h: str, entry: dict):
+    db = SessionLocal()
+    try:
+        row = db.query(PredictionCacheEntry).filter(
+            PredictionCacheEntry.content_hash == h
+        ).first()
+        if row is None:
+            row = PredictionCacheEntry(content_hash=h)
+            db.add(row)
+
+        row.image_url = entry.get("image_url")
+        row.disease = entry.get("exact_disease")
+        row.confidence = entry.get("confidence")
+        row.backend = entry.get("backend")
+        row.model_version = entry.get("model_version")
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(" prediction_cache save error:", e)
+    finally:
+        db.close()
+
+
+def lookup(h: str):
+    """
+    Cached entry for a content hash, or None. The entry may hold only an
+    image_url (seen by /upload/image) or also a prediction.
+    """
+    stats["lookups"] += 1
+
+    with _lock:
+        entry = _lru.get(h)
+        if entry is not None:
+            _lru.move_to_end(h)
+
+    if entry is not None:
+        stats["memory_hits"] += 1
+        return entry
+
+    if not PREDICTION_CACHE_PERSIST:
+        return None
+
+    try:
+        entry = _load(h)
+    except Exception as e:
+        print(" prediction_cache load error:", e)
+        return None
+
+    if entry is not None:
+        stats["db_hits"] += 1
+        _remember(h, entry)
+    return entry
+
+
+def remember_prediction(h: str, result: dict, image_url=None):
+    entry = dict(_lru.get(h) or {})
+    entry.update({
+        "exact_disease": result["exact_disease"],
+        "confidence": result["confidence"],
+        "backend": result.get("backend"),
+        "model_version": result.get("model_version"),
+    })
+    if image_url:
+        entry["image_url"] = image_url
+
+    _remember(h, entry)
+    if PREDICTION_CACHE_PERSIST:
+        _persist(h, entry)
+
+
+def remember_upload(h: str, image_url: str):
+    entry = dict(_lru.get(h) or {})
+    entry["image_url"] = image_url
+
+    _remember(h, entry)
+    if PREDICTION_CACHE_PERSIST:
+        _persist(h, entry)
+
+
+def get_stats():
+    hits = stats["memory_hits"] + stats["db_hits"]
+    return {
+        **stats,
+        "hit_rate": round(hits / stats["lookups"], 3) if stats["lookups"] else 0.0,
+        "entries": len(_lru),
+        "max_entries": PREDICTION_CACHE_SIZE,
+        "persistent": PREDICTION_CACHE_PERSIST,
+    }
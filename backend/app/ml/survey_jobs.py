@@ -0,0 +1,481 @@
+# app/ml/survey_jobs.py
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from collections import OrderedDict, Counter
+from datetime import datetime
+
+from app.db.database import SessionLocal
+from app.models.report import Report
+from app.models.detection import Detection
+from app.models.alert import Alert
+from app.models.survey_job import SurveyJob
+from app.ml import tiling
+from app.ml.model_utils import InferenceBusy
+from app.utils.socket_manager import broadcast_survey_progress, broadcast_new_alert
+
+# A drone flight is uploaded once (many files or one zip), spooled to
+# disk and analysed frame by frame by a small pool of background
+# workers. Detections and alerts are written in one transaction when
+# the whole flight is done. The worker running a job keeps it in memory
+# (bounded) and writes its public view to the survey_jobs table with
+# every progress update, so any worker can report on it.
+SURVEY_WORKERS = int(os.getenv("SURVEY_WORKERS", "2"))
+SURVEY_MAX_FRAMES = int(os.getenv("SURVEY_MAX_FRAMES", "1000"))
+SURVEY_MAX_FRAME_MB = int(os.getenv("SURVEY_MAX_FRAME_MB", "200"))
+SURVEY_SPOOL_DIR = os.getenv("SURVEY_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "wheatguard_surveys"))
+MAX_SURVEY_JOBS = int(os.getenv("MAX_SURVEY_JOBS", "200"))
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp")
+
+_jobs = OrderedDict()
+_queue = None
+_workers = []
+
+
+class SurveyUploadError(ValueError):
+    pass
+
+
+# -------------------------------------------------
+# Spooling
+# -------------------------------------------------
+def new_job_dir() -> str:
+    path = os.path.join(SURVEY_SPOOL_DIR, uuid.uuid4().hex)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTS)
+
+
+def _frame_path(job_dir: str, index: int, name: str) -> str:
+    # never trust client file names as paths
+    return os.path.join(job_dir, f"{index:05d}_{os.path.basename(name)}")
+
+
+def spool_file(job_dir: str, index: int, name: str, fileobj) -> dict:
+    if index >= SURVEY_MAX_FRAMES:
+        raise SurveyUploadError(f"Too many frames (max {SURVEY_MAX_FRAMES})")
+
+    path = _frame_path(job_dir, index, name)
+    limit = SURVEY_MAX_FRAME_MB * 1024 * 1024
+    size = 0
+    with open(path, "wb") as out:
+        while True:
+            chunk = fileobj.read(1024 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                raise SurveyUploadError(f"{name} is larger than {SURVEY_MAX_FRAME_MB} MB")
+            out.write(chunk)
+    return {"name": os.path.basename(name), "path": path}
+
+
+def spool_zip(job_dir: str, start: int, fileobj) -> list:
+    """
+    Extract the images of a flight archive one member at a time.
+    """
+    frames = []
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise SurveyUploadError("Archive is not a valid zip file")
+
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image(info.filename):
+                continue
+            if info.file_size > SURVEY_MAX_FRAME_MB * 1024 * 1024:
+                raise SurveyUploadError(f"{info.filename} is larger than {SURVEY_MAX_FRAME_MB} MB")
+            with archive.open(info) as member:
+                frames.append(spool_file(job_dir, start + len(frames), info.filename, member))
+    return frames
+
+
+def spool_uploads(job_dir: str, files, archive=None) -> list:
+    """
+    files: (file name, file object) pairs; archive: zip file object.
+    Non-image files are ignored.
+    """
+    frames = []
+    for name, fileobj in files:
+        if is_image(name or ""):
+            frames.append(spool_file(job_dir, len(frames), name, fileobj))
+    if archive is not None:
+        frames.extend(spool_zip(job_dir, len(frames), archive))
+    return frames
+
+
+def parse_frames_meta(raw):
+    """
+    Optional per-frame positions: a JSON list of {"name", "lat", "lon"}
+    (name = file name inside the upload or archive).
+    """
+    if not raw:
+        return {}
+    try:
+        items = json.loads(raw)
+        return {
+            os.path.basename(m["name"]): (float(m["lat"]), float(m["lon"]))
+            for m in items
+        }
+    except (ValueError, TypeError, KeyError) as e:
+        raise SurveyUploadError(f"Invalid frames_meta: {e}")
+
+
+# -------------------------------------------------
+# Jobs
+# -------------------------------------------------
+def _store(job: dict):
+    _jobs[job["job_id"]] = job
+    _jobs.move_to_end(job["job_id"])
+    while len(_jobs) > MAX_SURVEY_JOBS:
+        oldest = next(iter(_jobs))
+        if _jobs[oldest]["status"] not in ("done", "failed"):
+            break
+        _jobs.popitem(last=False)
+
+
+def _ensure_workers():
+    global _queue, _workers
+
+    if _workers and not any(t.done() for t in _workers):
+        return
+
+    for t in _workers:
+        t.cancel()
+
+    if _queue is None:
+        _queue = asyncio.Queue()
+    _workers = [asyncio.create_task(_worker()) for _ in range(SURVEY_WORKERS)]
+
+
+def _save_view(job_id: str, status: str, view: str, frames: str):
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        row = db.get(SurveyJob, job_id)
+        if row is None:
+            db.add(SurveyJob(job_id=job_id, status=status, view=view, frames=frames, created_at=now, updated_at=now))
+            _prune(db)
+        else:
+            row.status, row.view, row.frames, row.updated_at = status, view, frames, now
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _prune(db):
+    # same bound as in memory: the newest MAX_SURVEY_JOBS, running ones kept
+    old = (
+        db.query(SurveyJob.job_id)
+        .order_by(SurveyJob.created_at.desc())
+        .offset(MAX_SURVEY_JOBS)
+        .all()
+    )
+    if old:
+        db.query(SurveyJob).filter(
+            SurveyJob.job_id.in_([r.job_id for r in old]),
+            SurveyJob.status.in_(("done", "failed")),
+        ).delete(synchronize_session=False)
+
+
+async def _persist(job: dict):
+    # one save at a time per job, so an older view never lands last
+    async with job["_save_lock"]:
+        # serialized here: frames keep changing on the loop meanwhile
+        view = public_view(job)
+        frames = json.dumps(view.pop("frames"))
+        try:
+            await asyncio.to_thread(_save_view, job["job_id"], job["status"], json.dumps(view), frames)
+        except Exception as e:
+            print(f" survey state save error ({job['job_id']}):", e)
+
+
+def _load_view(job_id: str, with_frames: bool):
+    db = SessionLocal()
+    try:
+        row = db.get(SurveyJob, job_id)
+        if row is None:
+            return None
+        view = json.loads(row.view)
+        if with_frames:
+            view["frames"] = json.loads(row.frames)
+        return view
+    finally:
+        db.close()
+
+
+def _load_views():
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(SurveyJob.view)
+            .order_by(SurveyJob.created_at.desc())
+            .limit(MAX_SURVEY_JOBS)
+            .all()
+        )
+        return [json.loads(r.view) for r in rows]
+    finally:
+        db.close()
+
+
+async def create_job(job_dir: str, frames: list, options: dict) -> dict:
+    """
+    Register a spooled flight and queue all its frames.
+    options: lat, lon (fallback position), positions (name -> (lat, lon)),
+    tile_size, overlap, gsd_cm.
+    """
+    job = {
+        "job_id": os.path.basename(job_dir),
+        "status": "queued",
+        "total": len(frames),
+        "processed": 0,
+        "failed": 0,
+        "created_at": datetime.utcnow().isoformat(),
+        "finished_at": None,
+        "frames": [
+            {"name": f["name"], "status": "queued"} for f in frames
+        ],
+        "summary": None,
+        "detections": 0,
+        "alerts": [],
+        "_dir": job_dir,
+        "_paths": [f["path"] for f in frames],
+        "_options": options,
+        "_last_emit": 0.0,
+        "_save_lock": asyncio.Lock(),
+    }
+    _store(job)
+    await _persist(job)
+
+    _ensure_workers()
+    for i in range(len(frames)):
+        _queue.put_nowait((job["job_id"], i))
+    return job
+
+
+def public_view(job: dict, with_frames: bool = True) -> dict:
+    view = {k: v for k, v in job.items() if not k.startswith("_")}
+    view["progress"] = round(job["processed"] / job["total"], 4) if job["total"] else 1.0
+    if not with_frames:
+        view.pop("frames")
+    return view
+
+
+async def get_view(job_id: str, with_frames: bool = True):
+    """
+    Public view of a job: from memory on the worker running it, else
+    as last saved by that worker. None when unknown.
+    """
+    job = _jobs.get(job_id)
+    if job is not None:
+        return public_view(job, with_frames=with_frames)
+    return await asyncio.to_thread(_load_view, job_id, with_frames)
+
+
+async def list_jobs():
+    views = {v["job_id"]: v for v in await asyncio.to_thread(_load_views)}
+    for job in _jobs.values():
+        views[job["job_id"]] = public_view(job, with_frames=False)
+    return sorted(views.values(), key=lambda v: v["created_at"], reverse=True)
+
+
+async def _emit_progress(job: dict, force: bool = False):
+    # a flight has hundreds of frames; two updates per second are plenty
+    now = time.monotonic()
+    if not force and now - job["_last_emit"] < 0.5:
+        return
+    job["_last_emit"] = now
+    await _persist(job)
+    await broadcast_survey_progress(public_view(job, with_frames=False))
+
+
+def _frame_position(job: dict, index: int):
+    opts = job["_options"]
+    name = job["frames"][index]["name"]
+
+    if name in opts["positions"]:
+        return opts["positions"][name]
+
+    pos = tiling.exif_latlon(job["_paths"][index])
+    if pos:
+        return pos
+
+    if opts["lat"] is not None and opts["lon"] is not None:
+        return opts["lat"], opts["lon"]
+    return None
+
+
+async def _analyze(job: dict, index: int):
+    frame = job["frames"][index]
+    opts = job["_options"]
+
+    try:
+        # frames are decoded straight from the spooled file
+        path = job["_paths"][index]
+        pos = await asyncio.to_thread(_frame_position, job, index)
+        if pos is None:
+            raise ValueError("No position: send lat/lon, frames_meta or GPS EXIF")
+
+        while True:
+            try:
+                result = await tiling.analyze_frame(
+                    path, pos[0], pos[1],
+                    opts["tile_size"], opts["overlap"], opts["gsd_cm"],
+                )
+                break
+            except InferenceBusy:
+                # phone uploads have priority, back off and retry
+                await asyncio.sleep(1.0)
+
+        frame.update({
+            "status": "done",
+            "lat": pos[0],
+            "lon": pos[1],
+            "label": result["label"],
+            "confidence": result["confidence"],
+            "severity": result["severity"],
+            "bbox": result["bbox"],
+            "model_version": result["model_version"],
+            "infected_tiles": result["summary"]["infected_tiles"],
+            "tiles": result["summary"]["tiles"],
+        })
+    except Exception as e:
+        print(f" survey frame error ({job['job_id']} #{index}):", e)
+        frame.update({"status": "failed", "error": str(e)})
+        job["failed"] += 1
+
+
+async def _worker():
+    while True:
+        job_id, index = await _queue.get()
+        job = _jobs.get(job_id)
+        try:
+            if job is None or job["status"] == "failed":
+                continue
+
+            job["status"] = "running"
+            await _analyze(job, index)
+            job["processed"] += 1
+
+            if job["processed"] == job["total"]:
+                await _finish(job)
+            else:
+                await _emit_progress(job)
+        except Exception as e:
+            print(" survey worker error:", e)
+        finally:
+            _queue.task_done()
+
+
+def _write_results(job: dict):
+    """
+    One transaction per flight: a report + detection per analysed frame
+    and one alert per disease found.
+    """
+    done = [f for f in job["frames"] if f["status"] == "done"]
+    infected = [f for f in done if f["label"] not in tiling.NOT_INFECTED]
+
+    db = SessionLocal()
+    try:
+        reports = [
+            Report(source="drone", lat=f["lat"], lon=f["lon"], captured_at=datetime.utcnow())
+            for f in done
+        ]
+        db.add_all(reports)
+        db.flush()
+
+        db.add_all([
+            Detection(
+                report_id=r.id,
+                disease_label=f["label"],
+                confidence=f["confidence"],
+                severity=f["severity"],
+                bbox=f["bbox"],
+                model_version=f["model_version"],
+            )
+            for r, f in zip(reports, done)
+        ])
+
+        alerts = []
+        for disease, frames in _group(infected).items():
+            share = len(frames) / len(done)
+            alerts.append(Alert(
+                disease=disease,
+                severity=tiling.severity_for(share),
+                cases=len(frames),
+                lat=sum(f["lat"] for f in frames) / len(frames),
+                lon=sum(f["lon"] for f in frames) / len(frames),
+                source="drone",
+                message=f"Drone survey {job['job_id'][:8]}: {len(frames)}/{len(done)} frames",
+            ))
+        db.add_all(alerts)
+        db.commit()
+
+        return len(done), [
+            {
+                "id": a.id,
+                "disease": a.disease,
+                "severity": a.severity,
+                "lat": a.lat,
+                "lon": a.lon,
+                "cases": a.cases,
+                "source": "drone",
+                "timestamp": a.created_at.isoformat(),
+            }
+            for a in alerts
+        ]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _group(frames):
+    groups = {}
+    for f in frames:
+        groups.setdefault(f["label"], []).append(f)
+    return groups
+
+
+async def _finish(job: dict):
+    job["status"] = "writing"
+    await _emit_progress(job, force=True)
+
+    done = [f for f in job["frames"] if f["status"] == "done"]
+    job["summary"] = {
+        "frames_analyzed": len(done),
+        "frames_infected": sum(1 for f in done if f["label"] not in tiling.NOT_INFECTED),
+        "disease_counts": dict(Counter(f["label"] for f in done if f["label"] not in tiling.NOT_INFECTED)),
+    }
+
+    try:
+        job["detections"], alerts = await asyncio.to_thread(_write_results, job)
+        job["alerts"] = [a["id"] for a in alerts]
+        job["status"] = "done"
+    except Exception as e:
+        print(" survey write error:", e)
+        job["status"] = "failed"
+        job["error"] = str(e)
+        alerts = []
+    finally:
+        job["finished_at"] = datetime.utcnow().isoformat()
+        shutil.rmtree(job["_dir"], ignore_errors=True)
+
+    await _emit_progress(job, force=True)
+    for a in alerts:
+        await broadcast_new_alert(a)
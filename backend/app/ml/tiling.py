@@ -0,0 +1,316 @@
+# app/ml/tiling.py
+"""
+Sliding-window helpers for drone orthophotos.
+
+A drone frame is far larger than the 380x380 model input, so squashing
+it loses every lesion. Instead it is cut into overlapping tiles that are
+classified one by one (through the micro-batcher) and mapped back to
+ground coordinates from the frame centre and the ground sample distance.
+"""
+
+import asyncio
+import math
+import os
+import struct
+from collections import Counter
+from io import BytesIO
+
+from PIL import Image
+
+from app.ml.model_utils import predict_tiles_async, classify_logits
+
+DRONE_TILE_SIZE = int(os.getenv("DRONE_TILE_SIZE", "512"))          # pixels
+DRONE_TILE_OVERLAP = float(os.getenv("DRONE_TILE_OVERLAP", "0.25"))  # fraction of a tile
+DRONE_GSD_CM = float(os.getenv("DRONE_GSD_CM", "2.0"))              # cm per pixel
+DRONE_MIN_CONFIDENCE = float(os.getenv("DRONE_MIN_CONFIDENCE", "60"))
+DRONE_MAX_PIXELS = int(os.getenv("DRONE_MAX_PIXELS", "250000000"))
+# Most pixels a frame is decoded to. JPEGs above it are decoded by
+# libjpeg at 1/2, 1/4 or 1/8 scale; other formats above it are refused.
+DRONE_DECODE_PIXELS = int(os.getenv("DRONE_DECODE_PIXELS", "64000000"))
+
+HEALTHY = "Healthy"
+# frame whose tiles are mostly diseased but all below DRONE_MIN_CONFIDENCE
+UNCERTAIN = "Uncertain"
+NOT_INFECTED = {HEALTHY, UNCERTAIN}
+
+METERS_PER_DEG_LAT = 111320.0
+
+
+class FrameDecodeError(ValueError):
+    pass
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def _open(source) -> Image.Image:
+    """
+    Image.open for drone frames (bytes, a spooled upload's read handle or
+    a survey frame on disk), minus PIL's global decompression-bomb limit
+    (~89MP), which stays in place for phone uploads. Only the header is
+    read; callers check the size against DRONE_MAX_PIXELS themselves.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            prefix = f.read(16)
+    else:
+        source.seek(0)
+        prefix = source.read(16)
+
+    Image.init()
+    for fmt in Image.ID:
+        factory, accept = Image.OPEN[fmt]
+        accepted = not accept or accept(prefix)
+        if not accepted or isinstance(accepted, str):
+            continue
+        try:
+            if not isinstance(source, (str, os.PathLike)):
+                source.seek(0)
+            return factory(source)
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+    raise Image.UnidentifiedImageError("cannot identify image file")
+
+
+class Frame:
+    """
+    A decoded drone frame, addressed in full-resolution pixels. Frames
+    over DRONE_DECODE_PIXELS are held at the reduced scale libjpeg
+    decoded them at; `crop` maps each tile box onto that.
+    """
+
+    def __init__(self, img: Image.Image, size):
+        self.img = img
+        self.size = size
+        self._sx = size[0] / img.size[0]
+        self._sy = size[1] / img.size[1]
+
+    def crop(self, box) -> Image.Image:
+        left, top, right, bottom = box
+        return self.img.crop((
+            round(left / self._sx), round(top / self._sy),
+            round(right / self._sx), round(bottom / self._sy),
+        ))
+
+    def close(self):
+        self.img.close()
+
+
+def open_frame(source) -> Frame:
+    """
+    Decode a drone frame once, in its own mode (tiles are converted to
+    RGB one by one) and to at most DRONE_DECODE_PIXELS. Tiles are cropped
+    from it on demand, so only the tiles of the current batch are ever
+    expanded to float32.
+    """
+    try:
+        img = _open(source)
+    except Exception as e:
+        raise FrameDecodeError(f"Could not decode image: {e}")
+
+    w, h = img.size
+    if w * h > DRONE_MAX_PIXELS:
+        img.close()
+        raise FrameTooLarge(f"Frame too large: {w}x{h} (max {DRONE_MAX_PIXELS} pixels)")
+
+    if w * h > DRONE_DECODE_PIXELS:
+        scale = 2
+        while scale < 8 and w * h > DRONE_DECODE_PIXELS * scale * scale:
+            scale *= 2
+        img.draft(img.mode, (w // scale, h // scale))    # no-op unless JPEG
+        if img.size[0] * img.size[1] > DRONE_DECODE_PIXELS:
+            img.close()
+            raise FrameTooLarge(
+                f"Frame too large: {w}x{h} (only JPEGs over {DRONE_DECODE_PIXELS} "
+                f"pixels can be decoded at reduced scale)"
+            )
+
+    try:
+        img.load()
+    except Exception as e:
+        img.close()
+        raise FrameDecodeError(f"Could not decode image: {e}")
+    return Frame(img, (w, h))
+
+
+def _dms_to_deg(dms, ref) -> float:
+    deg = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+    return -deg if ref in ("S", "W") else deg
+
+
+def exif_latlon(source):
+    """
+    (lat, lon) from the EXIF GPS block most drones write, or None.
+    Only the header is parsed, the image itself is not decoded.
+    """
+    try:
+        with _open(source) as img:
+            gps = img.getexif().get_ifd(0x8825)
+        if not gps or 2 not in gps or 4 not in gps:
+            return None
+        return _dms_to_deg(gps[2], gps.get(1)), _dms_to_deg(gps[4], gps.get(3))
+    except Exception:
+        return None
+
+
+def _starts(length: int, tile: int, stride: int):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)      # last tile flush with the edge
+    return starts
+
+
+def tile_boxes(width: int, height: int, tile: int = DRONE_TILE_SIZE, overlap: float = DRONE_TILE_OVERLAP):
+    """
+    (row, col, (left, top, right, bottom)) for overlapping tiles covering
+    the whole frame. Frames smaller than a tile give a single tile.
+    """
+    overlap = min(max(overlap, 0.0), 0.9)
+    stride = max(1, int(tile * (1 - overlap)))
+
+    boxes = []
+    for row, top in enumerate(_starts(height, tile, stride)):
+        for col, left in enumerate(_starts(width, tile, stride)):
+            boxes.append((row, col, (left, top, min(left + tile, width), min(top + tile, height))))
+    return boxes
+
+
+def pixel_to_latlon(lat: float, lon: float, x: float, y: float, width: int, height: int, gsd_m: float):
+    """
+    Ground position of pixel (x, y), assuming a north-up frame whose
+    centre is at (lat, lon). Good enough over a single frame.
+    """
+    east = (x - width / 2) * gsd_m
+    north = (height / 2 - y) * gsd_m
+
+    dlat = north / METERS_PER_DEG_LAT
+    dlon = east / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return lat + dlat, lon + dlon
+
+
+def severity_for(infected_fraction: float) -> str:
+    if infected_fraction >= 0.30:
+        return "High"
+    if infected_fraction >= 0.10:
+        return "Moderate"
+    return "Low"
+
+
+def summarize(tiles):
+    """
+    Aggregate per-tile predictions. A tile counts as infected when its
+    class is not Healthy and the confidence reaches DRONE_MIN_CONFIDENCE.
+    Without infected tiles the frame is Healthy only if Healthy tiles
+    outnumber the low-confidence disease ones; otherwise it is Uncertain
+    and `suspected_disease` names the most common low-confidence class.
+    """
+    infected = [
+        t for t in tiles
+        if t["disease"] != HEALTHY and t["confidence"] >= DRONE_MIN_CONFIDENCE
+    ]
+    counts = Counter(t["disease"] for t in infected)
+    suspected = None
+
+    if counts:
+        dominant = counts.most_common(1)[0][0]
+        confs = [t["confidence"] for t in infected if t["disease"] == dominant]
+    else:
+        healthy = [t["confidence"] for t in tiles if t["disease"] == HEALTHY]
+        low = Counter(t["disease"] for t in tiles if t["disease"] != HEALTHY)
+        if healthy and len(healthy) >= sum(low.values()):
+            dominant = HEALTHY
+            confs = healthy
+        else:
+            dominant = UNCERTAIN
+            suspected = low.most_common(1)[0][0] if low else None
+            confs = [t["confidence"] for t in tiles if t["disease"] == suspected] or [0.0]
+
+    fraction = len(infected) / len(tiles) if tiles else 0.0
+
+    bbox = None
+    if infected:
+        bbox = {
+            "min_lat": min(t["lat"] for t in infected),
+            "min_lon": min(t["lon"] for t in infected),
+            "max_lat": max(t["lat"] for t in infected),
+            "max_lon": max(t["lon"] for t in infected),
+        }
+
+    return {
+        "tiles": len(tiles),
+        "infected_tiles": len(infected),
+        "infected_fraction": round(fraction, 4),
+        "dominant_disease": dominant,
+        "suspected_disease": suspected,
+        "confidence": round(sum(confs) / len(confs), 2),
+        "severity": severity_for(fraction) if infected else "Low",
+        "disease_counts": dict(counts),
+        "infected_bbox": bbox,
+    }
+
+
+async def analyze_frame(
+    source,
+    lat: float,
+    lon: float,
+    tile_size: int = DRONE_TILE_SIZE,
+    overlap: float = DRONE_TILE_OVERLAP,
+    gsd_cm: float = DRONE_GSD_CM,
+):
+    """
+    Per-tile disease grid for a drone frame (bytes, path or file object) plus
+    an aggregate summary. Raises FrameDecodeError / FrameTooLarge for unusable images and
+    InferenceBusy when the model queue is full.
+    """
+    frame = await asyncio.to_thread(open_frame, source)
+
+    width, height = frame.size
+    gsd_m = gsd_cm / 100.0
+    boxes = tile_boxes(width, height, tile_size, overlap)
+
+    try:
+        model_version, logits = await predict_tiles_async(frame, [box for _, _, box in boxes])
+    finally:
+        frame.close()
+
+    tiles = []
+    for (row, col, (left, top, right, bottom)), out in zip(boxes, logits):
+        disease, confidence = classify_logits(out)
+        t_lat, t_lon = pixel_to_latlon(
+            lat, lon, (left + right) / 2, (top + bottom) / 2, width, height, gsd_m
+        )
+        tiles.append({
+            "row": row,
+            "col": col,
+            "box": [left, top, right, bottom],
+            "lat": round(t_lat, 7),
+            "lon": round(t_lon, 7),
+            "disease": disease,
+            "confidence": round(confidence, 2),
+        })
+
+    summary = summarize(tiles)
+
+    return {
+        "mode": "tiled",
+        "label": summary["dominant_disease"],
+        "confidence": summary["confidence"],
+        "severity": summary["severity"],
+        "bbox": summary["infected_bbox"],
+        "model_version": model_version,
+        "summary": summary,
+        "grid": {
+            "rows": boxes[-1][0] + 1,
+            "cols": boxes[-1][1] + 1,
+            "tile_size": tile_size,
+            "overlap": overlap,
+            "gsd_cm": gsd_cm,
+            "image_size": [width, height],
+        },
+        "tiles": tiles,
+    }
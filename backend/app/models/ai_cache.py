@@ -0,0 +1,22 @@
+# app/models/ai_cache.py
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint
+from datetime import datetime
+from app.db.database import Base
+
+class AICacheEntry(Base):
+    __tablename__ = "ai_cache"
+    __table_args__ = (
+        UniqueConstraint(
+            "kind", "disease", "language", "season", "prompt_version",
+            name="uq_ai_cache_key",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(30), nullable=False)          # remedy | explanation
+    disease = Column(String(80), nullable=False)
+    language = Column(String(10), nullable=False)
+    season = Column(String(40), nullable=False)
+    prompt_version = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
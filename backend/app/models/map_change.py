@@ -0,0 +1,32 @@
+# app/models/map_change.py
+from sqlalchemy import Column, Integer, Float, String, DateTime, Index
+from datetime import datetime
+from app.db.database import Base
+
+class MapChange(Base):
+    """
+    Rows of a map layer deleted or edited in place (inserts are picked
+    up by id). Read by every worker's cluster cache and tile cache.
+    """
+    __tablename__ = "map_changes"
+    __table_args__ = (
+        Index("ix_map_changes_layer_id", "layer", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    layer = Column(String(20), nullable=False)          # detections | alerts | fields
+    row_id = Column(Integer, nullable=False)
+
+    # area the row covered (a point for detections / alerts)
+    min_lat = Column(Float, nullable=False)
+    min_lon = Column(Float, nullable=False)
+    max_lat = Column(Float, nullable=False)
+    max_lon = Column(Float, nullable=False)
+
+    # detections: -1 for the old values of a removed / edited row, +1
+    # for the new values of an edited one
+    delta = Column(Integer, nullable=False, default=0)
+    disease = Column(String(80), nullable=True)
+    severity = Column(String(30), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
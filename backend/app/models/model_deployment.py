@@ -0,0 +1,18 @@
+# app/models/model_deployment.py
+from sqlalchemy import Column, String, Float, Boolean, DateTime
+from datetime import datetime
+from app.db.database import Base
+
+class ModelDeployment(Base):
+    """
+    Model versions loaded through /models, as every worker should have
+    them (see app.ml.model_sync). Empty until the first change there.
+    """
+    __tablename__ = "model_deployments"
+
+    version = Column(String(40), primary_key=True)
+    path = Column(String(255), nullable=False)
+    is_default = Column(Boolean, nullable=False, default=False)
+    is_candidate = Column(Boolean, nullable=False, default=False)
+    shadow_percent = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
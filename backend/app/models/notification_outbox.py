@@ -0,0 +1,31 @@
+# app/models/notification_outbox.py
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Float, Index, UniqueConstraint
+from datetime import datetime
+from app.db.database import Base
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        # one push per device and alert, however often the alert is dispatched
+        UniqueConstraint("device_id", "alert_id", name="uq_outbox_device_alert"),
+        Index("ix_outbox_status_due", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, nullable=False, index=True)    # fcm_devices.id
+    alert_id = Column(Integer, nullable=True)                  # NULL for test pushes
+    token = Column(Text, nullable=False)
+    title = Column(String(200), nullable=False)
+    body = Column(Text, nullable=False)
+    data = Column(JSON, nullable=True)
+
+    # pending -> sending -> sent | pending (retry) | dead | invalid
+    status = Column(String(10), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    send_ms = Column(Float, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
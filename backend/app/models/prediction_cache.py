@@ -0,0 +1,15 @@
+# app/models/prediction_cache.py
+from sqlalchemy import Column, Float, String, Text, DateTime
+from datetime import datetime
+from app.db.database import Base
+
+class PredictionCacheEntry(Base):
+    __tablename__ = "prediction_cache"
+
+    content_hash = Column(String(64), primary_key=True)   # sha256 of raw upload bytes
+    disease = Column(String(80), nullable=True)
+    confidence = Column(Float, nullable=True)
+    backend = Column(String(60), nullable=True)
+    model_version = Column(String(40), nullable=True)
+    image_url = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,19 @@
+# app/models/remedy_result.py
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from datetime import datetime
+from app.db.database import Base
+
+class RemedyResult(Base):
+    """
+    Remedy / explanation generated after /detections/predict, shared by
+    all workers (see app.ml.remedy_jobs).
+    """
+    __tablename__ = "remedy_results"
+
+    detection_id = Column(Integer, primary_key=True)
+    disease = Column(String(80), nullable=False)
+    language = Column(String(10), nullable=False)
+    status = Column(String(10), nullable=False, default="pending")    # pending | ready | failed
+    remedy = Column(Text, nullable=True)
+    ai_explanation = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,18 @@
+# app/models/survey_job.py
+from sqlalchemy import Column, String, Text, DateTime
+from datetime import datetime
+from app.db.database import Base
+
+class SurveyJob(Base):
+    """
+    Latest public state of a bulk drone survey, written by the worker
+    running it so any worker can answer for it (see app.ml.survey_jobs).
+    """
+    __tablename__ = "survey_jobs"
+
+    job_id = Column(String(32), primary_key=True)
+    status = Column(String(10), nullable=False)
+    view = Column(Text, nullable=False)             # JSON, without frames
+    frames = Column(Text, nullable=False)           # JSON list
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
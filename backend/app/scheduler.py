@@ -1,3 +1,5 @@
+import asyncio
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy.orm import Session
@@ -5,12 +7,12 @@ from app.db.database import SessionLocal
 from app.ndvi_stress import scan_ndvi_stress
 from app.utils.socket_manager import broadcast_ndvi_stress_updates
 from app.crud import get_active_ndvi_stress_alerts
+from app.utils import map_changes
+from app.ml import remedy_jobs
 
 scheduler = AsyncIOScheduler()
 
-def run_ndvi_stress_job():
-    print(" Running scheduled NDVI Stress Scan")
-
+def _scan_ndvi_stress() -> list:
     db: Session = SessionLocal()
     try:
         scan_ndvi_stress(db)
@@ -18,9 +20,7 @@ def run_ndvi_stress_job():
         
         alerts = get_active_ndvi_stress_alerts(db)
 
-        
-        import asyncio
-        asyncio.run(broadcast_ndvi_stress_updates([
+        return [
             {
                 "id": a.id,
                 "lat": a.lat,
@@ -32,23 +32,86 @@ def run_ndvi_stress_job():
                 "created_at": str(a.created_at),
             }
             for a in alerts
-        ]))
+        ]
+    finally:
+        db.close()
+
+
+async def run_ndvi_stress_job():
+    # runs on the app's event loop (AsyncIOScheduler awaits coroutine
+    # jobs there), so the emit uses the loop the Socket.IO manager is
+    # bound to; the scan itself goes to a thread
+    print(" Running scheduled NDVI Stress Scan")
+
+    try:
+        alerts = await asyncio.to_thread(_scan_ndvi_stress)
+        await broadcast_ndvi_stress_updates(alerts)
 
         print(" NDVI stress broadcast completed")
 
     except Exception as e:
         print(" NDVI stress scan error:", e)
+
+
+def prune_map_changes_job():
+    db: Session = SessionLocal()
+    try:
+        pruned = map_changes.prune(db)
+        if pruned:
+            print(f" Pruned {pruned} map change log entries")
+    except Exception as e:
+        print(" map change prune error:", e)
+    finally:
+        db.close()
+
+
+def prune_remedy_results_job():
+    db: Session = SessionLocal()
+    try:
+        pruned = remedy_jobs.prune(db)
+        if pruned:
+            print(f" Pruned {pruned} remedy results")
+    except Exception as e:
+        print(" remedy result prune error:", e)
     finally:
         db.close()
 
 
 def start_scheduler():
+    # leadership can come back after stop_scheduler(): resume instead
+    if scheduler.running:
+        scheduler.resume()
+        print(" Scheduler resumed")
+        return
+
     # Run every day at 2 AM
     scheduler.add_job(
         run_ndvi_stress_job,
         CronTrigger(hour=2, minute=0),
-        id="daily_ndvi_stress_scan"
+        id="daily_ndvi_stress_scan",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        prune_map_changes_job,
+        CronTrigger(hour=3, minute=0),
+        id="prune_map_changes",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        prune_remedy_results_job,
+        CronTrigger(hour=3, minute=15),
+        id="prune_remedy_results",
+        replace_existing=True
     )
 
     scheduler.start()
     print(" Scheduler started: NDVI scan at 2:00 AM daily")
+
+
+def stop_scheduler():
+    """
+    Called when this worker loses leadership (see app.utils.leader).
+    """
+    if scheduler.running:
+        scheduler.pause()
+        print(" Scheduler paused")
@@ -0,0 +1,305 @@
+# app/utils/clusters.py
+"""
+Zoom-aware aggregation of detections for the outbreak map.
+
+The map is cut into a lat/lon grid per zoom level: at zoom z a web-map
+tile spans 360 / 2^z degrees and holds CLUSTER_CELLS_PER_TILE cells per
+side (~64 px cells with the default of 4). For every level up to
+CLUSTER_MAX_ZOOM the per-cell counts (total, per disease, per severity
+and a position sum for the centroid) are kept in memory. They are
+built once and then updated incrementally with the detections added
+since the last query (map_changes.Cursor, which also catches rows that
+commit late) and with the deletes / edits logged in map_changes, so a
+viewport request only reads the handful of cells it covers. Memory is capped at CLUSTER_CACHE_MAX_CELLS cells per worker.
+Beyond CLUSTER_MAX_ZOOM the viewport is small and individual detections
+are returned instead.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import DateTime, text
+
+from app.utils import map_changes
+
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", "12"))
+CLUSTER_CELLS_PER_TILE = int(os.getenv("CLUSTER_CELLS_PER_TILE", "4"))
+CLUSTER_MAX_POINTS = int(os.getenv("CLUSTER_MAX_POINTS", "2000"))
+CLUSTER_CACHE_MAX_CELLS = int(os.getenv("CLUSTER_CACHE_MAX_CELLS", "500000"))
+
+UNKNOWN = "Unknown"
+
+
+def cell_deg(zoom: int) -> float:
+    return 360.0 / (2 ** zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def _encode(labels):
+    names, codes = np.unique(np.array([x or UNKNOWN for x in labels], dtype=str), return_inverse=True)
+    return names.tolist(), codes.reshape(-1).astype(np.int64)
+
+
+class _Cell:
+    __slots__ = ("count", "sum_lat", "sum_lon", "diseases", "severity")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_lat = 0.0
+        self.sum_lon = 0.0
+        self.diseases = Counter()
+        self.severity = Counter()
+
+
+class ClusterCache:
+    """
+    Per-zoom grid aggregates of detections (joined with their report
+    position), refreshed from rows not seen yet and from the
+    map_changes log (deletes / edits, whichever worker made them).
+
+    Levels are dropped from the top while the cache holds more than
+    CLUSTER_CACHE_MAX_CELLS cells; those zooms are then aggregated per
+    request from the detections in the viewport.
+    """
+
+    def __init__(self, max_zoom: int = CLUSTER_MAX_ZOOM, max_cells: int = CLUSTER_CACHE_MAX_CELLS):
+        self.max_zoom = max_zoom
+        self.max_cells = max_cells
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._levels = [dict() for _ in range(self.max_zoom + 1)]   # zoom -> {(i, j): _Cell}
+            self._detections = map_changes.Cursor()
+            self._changes = map_changes.Cursor()
+            self._rows = 0
+            self._refreshed_at = None
+
+    @staticmethod
+    def _snapshot(db):
+        # new rows and log entries are read in one snapshot, or a delete
+        # committed between the two reads would be subtracted twice
+        conn = db.get_bind().connect()
+        if conn.dialect.name == "postgresql":
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        return conn
+
+    def refresh(self, db) -> int:
+        with self._refresh_lock:
+            now = time.monotonic()
+            if self._refreshed_at is not None and now - self._refreshed_at > map_changes.RETENTION_S:
+                # the log may have been pruned past what was applied here
+                self.reset()
+
+            with self._snapshot(db) as conn, conn.begin():
+                rows = conn.execute(text(
+                    "SELECT d.id, d.created_at, r.lat, r.lon, d.disease_label, d.severity "
+                    "FROM detections d JOIN reports r ON r.id = d.report_id "
+                    "WHERE d.id > :after AND r.lat IS NOT NULL AND r.lon IS NOT NULL "
+                    "ORDER BY d.id"
+                ).columns(created_at=DateTime), {"after": self._detections.after}).fetchall()
+
+                if self._refreshed_at is None:
+                    # full load: already reflects every logged change
+                    changes = []
+                    self._changes = map_changes.cursor_at_end(conn, "detections")
+                else:
+                    changes = self._changes.take(map_changes.since(conn, "detections", self._changes.after))
+
+            # edits of rows not loaded before are already in `rows`
+            loaded = self._detections.seen
+            removed = [c for c in changes if c.delta < 0 and loaded(c.row_id)]
+            added = [c for c in changes if c.delta > 0 and loaded(c.row_id)]
+
+            with self._lock:
+                rows = self._detections.take(rows)
+                if rows:
+                    self._apply([(r.lat, r.lon, r.disease_label, r.severity) for r in rows], 1)
+                    self._rows += len(rows)
+                if removed:
+                    self._apply([(c.min_lat, c.min_lon, c.disease, c.severity) for c in removed], -1)
+                    self._rows -= len(removed)
+                if added:
+                    self._apply([(c.min_lat, c.min_lon, c.disease, c.severity) for c in added], 1)
+                    self._rows += len(added)
+                self._refreshed_at = now
+                self._trim()
+
+            return len(rows) + len(removed) + len(added)
+
+    def _apply(self, rows, sign: int):
+        lats, lons, diseases, severities = zip(*rows)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        # labels as small integer codes, shared by every level
+        diseases = _encode(diseases)
+        severities = _encode(severities)
+
+        for zoom, cells in enumerate(self._levels):
+            self._add(cells, cell_deg(zoom), lats, lons, diseases, severities, sign)
+
+    def _trim(self):
+        total = sum(len(cells) for cells in self._levels)
+        if total <= self.max_cells:
+            return
+        while total > self.max_cells and len(self._levels) > 1:
+            total -= len(self._levels.pop())
+        print(f" Cluster cache over {self.max_cells} cells: zoom {len(self._levels)}+ aggregated per request")
+
+    @staticmethod
+    def _add(cells, size, lats, lons, diseases, severities, sign: int = 1):
+        """
+        Add (sign=1) or subtract (sign=-1) rows from the cells of one level.
+        """
+        ci = np.floor(lats / size).astype(np.int64)
+        cj = np.floor(lons / size).astype(np.int64)
+
+        # group rows by cell first, so the Python loop runs per cell
+        packed = (ci << 32) + (cj & 0xFFFFFFFF)
+        uniq, inverse = np.unique(packed, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse)
+        sum_lat = np.bincount(inverse, weights=lats)
+        sum_lon = np.bincount(inverse, weights=lons)
+
+        keys = [(key >> 32, ((key & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000) for key in uniq.tolist()]
+        for k, key in enumerate(keys):
+            cell = cells.get(key)
+            if cell is None:
+                if sign < 0:
+                    continue
+                cell = cells[key] = _Cell()
+            cell.count += sign * int(counts[k])
+            cell.sum_lat += sign * float(sum_lat[k])
+            cell.sum_lon += sign * float(sum_lon[k])
+
+        for attr, (names, codes) in (("diseases", diseases), ("severity", severities)):
+            combos, n = np.unique(inverse * len(names) + codes, return_counts=True)
+            for combo, count in zip(combos.tolist(), n.tolist()):
+                k, code = divmod(combo, len(names))
+                cell = cells.get(keys[k])
+                if cell is None:
+                    continue
+                counter = getattr(cell, attr)
+                counter[names[code]] += sign * count
+                if counter[names[code]] <= 0:
+                    del counter[names[code]]
+
+        if sign < 0:
+            for key in keys:
+                cell = cells.get(key)
+                if cell is not None and cell.count <= 0:
+                    del cells[key]
+
+    @staticmethod
+    def _aggregate(db, size, i0, i1, j0, j1):
+        """
+        Cells of a level that isn't cached, from the rows inside them.
+        """
+        rows = db.execute(text(
+            "SELECT r.lat, r.lon, d.disease_label, d.severity "
+            "FROM detections d JOIN reports r ON r.id = d.report_id "
+            "WHERE r.lat >= :south AND r.lat < :north AND r.lon >= :west AND r.lon < :east"
+        ), {"south": i0 * size, "north": (i1 + 1) * size, "west": j0 * size, "east": (j1 + 1) * size}).fetchall()
+
+        cells = {}
+        if rows:
+            lats, lons, diseases, severities = zip(*rows)
+            ClusterCache._add(
+                cells, size,
+                np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64),
+                _encode(diseases), _encode(severities),
+            )
+        return cells
+
+    def clusters(self, db, west: float, south: float, east: float, north: float, zoom: int):
+        """
+        Aggregated cells intersecting the bbox at `zoom` (<= max_zoom).
+        """
+        self.refresh(db)
+
+        size = cell_deg(zoom)
+        i0, i1 = int(np.floor(south / size)), int(np.floor(north / size))
+        j0, j1 = int(np.floor(west / size)), int(np.floor(east / size))
+
+        with self._lock:
+            cached = zoom < len(self._levels)
+            if cached:
+                cells = self._levels[zoom]
+                if (i1 - i0 + 1) * (j1 - j0 + 1) <= len(cells):
+                    found = [
+                        ((i, j), cells[(i, j)])
+                        for i in range(i0, i1 + 1)
+                        for j in range(j0, j1 + 1)
+                        if (i, j) in cells
+                    ]
+                else:
+                    found = [
+                        (key, c) for key, c in cells.items()
+                        if i0 <= key[0] <= i1 and j0 <= key[1] <= j1
+                    ]
+                items = [self._cluster(zoom, size, key, c) for key, c in found]
+
+        if not cached:
+            items = [
+                self._cluster(zoom, size, key, c)
+                for key, c in self._aggregate(db, size, i0, i1, j0, j1).items()
+            ]
+        return items
+
+    @staticmethod
+    def _cluster(zoom, size, key, c):
+        i, j = key
+        return {
+            "id": f"{zoom}/{i}/{j}",
+            "count": c.count,
+            "lat": round(c.sum_lat / c.count, 6),
+            "lon": round(c.sum_lon / c.count, 6),
+            "bounds": [j * size, i * size, (j + 1) * size, (i + 1) * size],
+            "diseases": dict(c.diseases),
+            "severity": dict(c.severity),
+            "top_disease": c.diseases.most_common(1)[0][0],
+        }
+
+    def stats(self):
+        return {
+            "max_zoom": self.max_zoom,
+            "cached_zoom": len(self._levels) - 1,
+            "detections": self._rows,
+            "cells": [len(level) for level in self._levels],
+            "max_cells": self.max_cells,
+            "change_id": self._changes.after,
+        }
+
+
+def points(db, west: float, south: float, east: float, north: float, limit: int = CLUSTER_MAX_POINTS):
+    """
+    Individual detections in the bbox (zoomed in past the clusters).
+    """
+    rows = db.execute(text(
+        "SELECT d.id, r.lat, r.lon, d.disease_label, d.severity "
+        "FROM detections d JOIN reports r ON r.id = d.report_id "
+        "WHERE r.lat BETWEEN :south AND :north AND r.lon BETWEEN :west AND :east "
+        "ORDER BY d.id DESC LIMIT :limit"
+    ), {"south": south, "north": north, "west": west, "east": east, "limit": limit}).fetchall()
+
+    return [
+        {
+            "id": f"d{r.id}",
+            "detection_id": r.id,
+            "count": 1,
+            "lat": r.lat,
+            "lon": r.lon,
+            "diseases": {r.disease_label or UNKNOWN: 1},
+            "severity": {r.severity or UNKNOWN: 1},
+            "top_disease": r.disease_label or UNKNOWN,
+        }
+        for r in rows
+    ]
+
+
+detection_clusters = ClusterCache()
@@ -0,0 +1,150 @@
+# app/utils/fcm_dispatch.py
+"""
+Push notification fan-out for outbreak alerts.
+
+Recipients are the devices within ALERT_PUSH_RADIUS_KM of the alert,
+found through the spatial index over fcm_devices instead of a scan of
+every device. One outbox row is written per recipient (a device is never
+queued twice for the same alert) and app.utils.notification_outbox
+delivers them: grouped by message into FCM multicast batches, rate
+limited, retried and dead-lettered. `schedule_alert_push` runs the
+recipient lookup as a background task, so creating an alert never waits
+on it.
+"""
+
+import asyncio
+import math
+import os
+import time
+
+from sqlalchemy import select
+
+from app.db.database import SessionLocal
+from app.models.fcm_device import FCMDevice
+from app.utils import notification_outbox, spatial
+
+ALERT_PUSH_RADIUS_KM = float(os.getenv("ALERT_PUSH_RADIUS_KM", "5"))
+
+_pending = set()
+
+stats = {
+    "alerts": 0,
+    "recipients": 0,
+    "queued": 0,
+    "duplicates": 0,
+    "last_enqueue_s": None,
+}
+
+
+def find_recipients(lat: float, lon: float, radius_km: float = ALERT_PUSH_RADIUS_KM):
+    """
+    [(device_id, token, distance_km)] of the devices within radius_km.
+    """
+    db = SessionLocal()
+    try:
+        hits = spatial.device_index.nearby(db, lat, lon, radius_km, limit=None)
+        if not hits:
+            return []
+
+        ids = [row_id for row_id, _ in hits]
+        recipients = []
+        # IN lists are chunked to stay under SQLite's variable limit
+        for i in range(0, len(ids), 5000):
+            rows = db.execute(
+                select(FCMDevice.id, FCMDevice.token, FCMDevice.lat, FCMDevice.lon)
+                .where(FCMDevice.id.in_(ids[i:i + 5000]))
+                .where(FCMDevice.lat.isnot(None), FCMDevice.lon.isnot(None))
+            ).all()
+            if not rows:
+                continue
+            # re-checked on the current row: the in-process grid can lag
+            # behind a device that moved
+            km = spatial.haversine_km(lat, lon, [r.lat for r in rows], [r.lon for r in rows])
+            recipients.extend(
+                (r.id, r.token, float(d)) for r, d in zip(rows, km.tolist()) if d <= radius_km
+            )
+        return recipients
+    finally:
+        db.close()
+
+
+def alert_message(alert: dict, km: int):
+    """
+    (title, body, data) pushed for `alert` to a device km away.
+    """
+    title = f"Disease Alert: {alert['disease']}"
+    body = f"{alert['severity']} severity within {km} km of your area"
+    # FCM data values must be strings
+    data = {
+        "alert_id": str(alert.get("id", "")),
+        "lat": str(alert["lat"]),
+        "lon": str(alert["lon"]),
+        "disease": str(alert["disease"]),
+        "severity": str(alert["severity"]),
+    }
+    return title, body, data
+
+
+async def dispatch_alert(alert: dict, radius_km: float = ALERT_PUSH_RADIUS_KM) -> dict:
+    """
+    Queue `alert` (id, disease, severity, lat, lon) for every device in
+    range and return the counts for this alert.
+    """
+    started = time.perf_counter()
+    recipients = await asyncio.to_thread(find_recipients, alert["lat"], alert["lon"], radius_km)
+
+    messages = []
+    for device_id, token, km in recipients:
+        # rounded up so the "x km" text stays right and messages group well
+        title, body, data = alert_message(alert, max(1, math.ceil(km)))
+        messages.append({
+            "device_id": device_id,
+            "alert_id": alert.get("id"),
+            "token": token,
+            "title": title,
+            "body": body,
+            "data": data,
+        })
+
+    queued = await asyncio.to_thread(notification_outbox.enqueue, messages)
+    if queued:
+        notification_outbox.wake()
+
+    totals = {
+        "recipients": len(recipients),
+        "queued": queued,
+        "duplicates": len(messages) - queued,
+    }
+
+    stats["alerts"] += 1
+    stats["recipients"] += totals["recipients"]
+    stats["queued"] += totals["queued"]
+    stats["duplicates"] += totals["duplicates"]
+    stats["last_enqueue_s"] = round(time.perf_counter() - started, 3)
+    print(f" Alert {alert.get('id')} queued for {queued}/{len(recipients)} devices")
+    return totals
+
+
+async def _run(alert: dict):
+    try:
+        await dispatch_alert(alert)
+    except Exception as e:
+        print(f" Alert push error ({alert.get('id')}):", e)
+
+
+def schedule_alert_push(alert: dict) -> asyncio.Task:
+    """
+    Fire-and-forget dispatch_alert from a request handler.
+    """
+    task = asyncio.create_task(_run(alert))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    return task
+
+
+def get_stats():
+    return {
+        **stats,
+        "pending": len(_pending),
+        "index": spatial.device_index.stats(),
+    }
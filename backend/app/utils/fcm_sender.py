@@ -1,15 +1,32 @@
+import asyncio
 import os
 import requests
 import math
 
+import httpx
+
 FCM_SERVER_KEY = os.getenv("FCM_SERVER_KEY")
+FCM_URL = os.getenv("FCM_URL", "https://fcm.googleapis.com/fcm/send")
+FCM_BATCH_SIZE = min(int(os.getenv("FCM_BATCH_SIZE", "500")), 1000)   # FCM max is 1000
+FCM_CONCURRENCY = int(os.getenv("FCM_CONCURRENCY", "16"))
+FCM_TIMEOUT_S = float(os.getenv("FCM_TIMEOUT_S", "10"))
 
-def send_fcm(token: str, title: str, body: str, data=None):
-    headers = {
+# FCM errors meaning the token will never work again
+INVALID_TOKEN_ERRORS = {"NotRegistered", "InvalidRegistration", "MismatchSenderId"}
+
+_client = None
+_client_lock = asyncio.Lock()
+_slots = None
+
+
+def _headers():
+    return {
         "Authorization": f"key={FCM_SERVER_KEY}",
         "Content-Type": "application/json",
     }
 
+
+def send_fcm(token: str, title: str, body: str, data=None):
     payload = {
         "to": token,
         "notification": {"title": title, "body": body, "sound": "default"},
@@ -17,11 +34,70 @@ def send_fcm(token: str, title: str, body: str, data=None):
     }
 
     requests.post(
-        "https://fcm.googleapis.com/fcm/send",
-        headers=headers,
+        FCM_URL,
+        headers=_headers(),
         json=payload,
+        timeout=FCM_TIMEOUT_S,
     )
 
+
+# -------------------------------------------------
+# Async multicast (pooled client, bounded concurrency)
+# -------------------------------------------------
+async def _get_client() -> httpx.AsyncClient:
+    global _client, _slots
+    async with _client_lock:
+        if _client is None:
+            # building the SSL context takes ~250 ms, keep it off the event loop
+            _client = await asyncio.to_thread(
+                httpx.AsyncClient,
+                timeout=FCM_TIMEOUT_S,
+                limits=httpx.Limits(max_connections=FCM_CONCURRENCY, max_keepalive_connections=FCM_CONCURRENCY),
+            )
+            _slots = asyncio.Semaphore(FCM_CONCURRENCY)
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def send_multicast(tokens: list, title: str, body: str, data=None) -> list:
+    """
+    One FCM request for up to FCM_BATCH_SIZE tokens sharing a message.
+    Returns one {"ok", "error", "canonical"} per token, in order; a
+    failed request marks every token with the request error.
+    """
+    client = await _get_client()
+    payload = {
+        "registration_ids": tokens,
+        "notification": {"title": title, "body": body, "sound": "default"},
+        "data": data or {},
+    }
+
+    async with _slots:
+        try:
+            r = await client.post(FCM_URL, headers=_headers(), json=payload)
+            r.raise_for_status()
+            results = r.json().get("results", [])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            return [{"ok": False, "error": error, "canonical": None} for _ in tokens]
+
+    out = []
+    for i in range(len(tokens)):
+        result = results[i] if i < len(results) else {"error": "MissingResult"}
+        out.append({
+            "ok": "error" not in result,
+            "error": result.get("error"),
+            "canonical": result.get("registration_id"),
+        })
+    return out
+
+
 def haversine(lat1, lon1, lat2, lon2):
     R = 6371
     dlat = math.radians(lat2 - lat1)
@@ -0,0 +1,81 @@
+# app/utils/geohash.py
+"""
+Geohash encoding and cell covers, used to name Socket.IO location rooms.
+
+A geohash of precision p splits the world into 32^p cells; each extra
+character divides a cell in 32, so a prefix of a hash is the larger cell
+containing it. Approximate cell sizes at the equator:
+
+    p=2  1250 x 625 km
+    p=3   156 x 156 km
+    p=4    39 x 19.5 km
+    p=5   4.9 x 4.9 km
+"""
+
+import math
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(lat: float, lon: float, precision: int) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    out = []
+    bits, ch, even = 0, 0, True
+
+    while len(out) < precision:
+        # bits alternate, starting with longitude
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = ch * 2 + 1
+                lon_lo = mid
+            else:
+                ch = ch * 2
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = ch * 2 + 1
+                lat_lo = mid
+            else:
+                ch = ch * 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+
+    return "".join(out)
+
+
+def cell_size(precision: int):
+    """
+    (height, width) of a cell in degrees.
+    """
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def cover(west: float, south: float, east: float, north: float, precision: int, max_cells: int = None):
+    """
+    Hashes of the cells overlapping the box (no antimeridian wrap), or
+    None if there would be more than max_cells of them.
+    """
+    south, north = max(-90.0, south), min(90.0, north)
+    west, east = max(-180.0, west), min(180.0, east)
+    h, w = cell_size(precision)
+
+    i0, i1 = math.floor((south + 90) / h), min(math.floor((north + 90) / h), 2 ** (precision * 5 // 2) - 1)
+    j0, j1 = math.floor((west + 180) / w), min(math.floor((east + 180) / w), 2 ** math.ceil(precision * 5 / 2) - 1)
+    if max_cells is not None and (i1 - i0 + 1) * (j1 - j0 + 1) > max_cells:
+        return None
+
+    # encode each cell by its centre
+    return [
+        encode(-90 + (i + 0.5) * h, -180 + (j + 0.5) * w, precision)
+        for i in range(i0, i1 + 1)
+        for j in range(j0, j1 + 1)
+    ]
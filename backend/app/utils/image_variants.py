@@ -0,0 +1,172 @@
+# app/utils/image_variants.py
+"""
+Downscaled copies of uploaded photos for the dashboard, map popups and
+the mobile app, so rural clients don't pull 4-12 MB originals.
+
+For an original stored under `fields/abc.jpg` the variants are stored
+next to it as `fields/abc.display.webp`, `fields/abc.thumb.webp` and
+`fields/abc.small.webp`, so their URLs follow from the original URL and
+no extra columns are needed. They are generated in the background right
+after ingest; clients should fall back to the original while they are
+missing.
+
+Backfill photos stored before this existed with:
+    python -m app.utils.image_variants backfill
+"""
+
+import asyncio
+import os
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageOps, features
+
+from app.utils import storage
+from app.utils.uploads import SpooledUpload
+
+# name -> (longest edge in pixels, quality)
+IMAGE_VARIANTS = {
+    "display": (1280, 80),
+    "thumb": (320, 70),
+    "small": (96, 60),
+}
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+if features.check("webp"):
+    VARIANT_EXT, VARIANT_FORMAT, VARIANT_TYPE = "webp", "WEBP", "image/webp"
+else:
+    VARIANT_EXT, VARIANT_FORMAT, VARIANT_TYPE = "jpg", "JPEG", "image/jpeg"
+
+_slots = None
+_pending = set()
+
+
+def variant_key(key: str, name: str) -> str:
+    stem = key.rsplit(".", 1)[0] if "." in os.path.basename(key) else key
+    return f"{stem}.{name}.{VARIANT_EXT}"
+
+
+def variant_urls(url: Optional[str]):
+    """
+    {"display": ..., "thumb": ..., "small": ...} for an original URL, or
+    None when the URL does not point into our storage (e.g. legacy
+    /fields/photo/... links).
+    """
+    if not url:
+        return None
+    key = storage.key_for_url(url)
+    if key is None:
+        return None
+    return {name: storage.public_url(variant_key(key, name)) for name in IMAGE_VARIANTS}
+
+
+def make_variants(source) -> dict:
+    """
+    Encode every variant from the original (bytes, file path or file
+    object):
+    {name: encoded bytes}. Phone photos are rotated according to their
+    EXIF orientation first.
+    """
+    largest = max(size for size, _ in IMAGE_VARIANTS.values())
+
+    img = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+    img.draft("RGB", (largest, largest))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    out = {}
+    # largest first, each smaller one is resized from the previous result
+    for name, (size, quality) in sorted(IMAGE_VARIANTS.items(), key=lambda kv: -kv[1][0]):
+        img.thumbnail((size, size), Image.LANCZOS)
+        buf = BytesIO()
+        img.save(buf, VARIANT_FORMAT, quality=quality)
+        out[name] = buf.getvalue()
+    return out
+
+
+async def _generate(key: str, data):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(IMAGE_VARIANT_WORKERS)
+
+    try:
+        async with _slots:
+            source = data.open() if isinstance(data, SpooledUpload) else data
+            variants = await asyncio.to_thread(make_variants, source)
+    except Exception as e:
+        print(f" Image variant error ({key}):", e)
+        return
+    finally:
+        if isinstance(data, SpooledUpload):
+            data.release()
+
+    for name, encoded in variants.items():
+        await storage.put_later(variant_key(key, name), encoded, VARIANT_TYPE)
+
+
+async def put_image_later(key: str, data, content_type: str = "image/jpeg") -> asyncio.Future:
+    """
+    storage.put_later for photos (bytes or SpooledUpload): queues the
+    original and generates its display / thumbnail variants in the
+    background.
+    """
+    upload = await storage.put_later(key, data, content_type)
+    if isinstance(data, SpooledUpload):
+        data.retain()
+
+    task = asyncio.create_task(_generate(key, data))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    return upload
+
+
+# -------------------------------------------------
+# Backfill
+# -------------------------------------------------
+def _read_original(url: str, key: str) -> bytes:
+    backend = storage.get_backend()
+    if isinstance(backend, storage.LocalStorage):
+        with open(backend.path(key), "rb") as f:
+            return f.read()
+
+    import requests
+    r = requests.get(url, timeout=30)
+    r.raise_for_status()
+    return r.content
+
+
+def backfill():
+    from app.db.database import SessionLocal
+    from app.models.report import Report
+    from app.models.fields import Field
+
+    db = SessionLocal()
+    try:
+        urls = [u for (u,) in db.query(Report.image_url).filter(Report.image_url.isnot(None))]
+        for photo, field_photo in db.query(Field.photo_url, Field.field_photo_url):
+            urls.extend(u for u in (photo, field_photo) if u)
+    finally:
+        db.close()
+
+    done = 0
+    for url in urls:
+        key = storage.key_for_url(url)
+        if key is None:
+            continue
+        try:
+            for name, encoded in make_variants(_read_original(url, key)).items():
+                storage.save(variant_key(key, name), encoded, VARIANT_TYPE)
+            done += 1
+        except Exception as e:
+            print(f" skipped {url}: {e}")
+
+    print(f" variants written for {done}/{len(urls)} images")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["backfill"]:
+        raise SystemExit("usage: python -m app.utils.image_variants backfill")
+    backfill()
@@ -0,0 +1,188 @@
+# app/utils/leader.py
+"""
+Leader election between API workers.
+
+With `uvicorn --workers N` (or several containers) every process runs
+the startup event, but the NDVI scheduler and the notification outbox
+worker must run once. Each process calls `start()`; the one holding the
+lock is the leader and runs `on_elected`, the others keep trying every
+LEADER_RETRY_S and take over when the leader goes away.
+
+  - REDIS_URL set: SET NX with a LEADER_TTL_S expiry, renewed every
+    TTL/3 (works across hosts; a crashed leader is replaced after TTL)
+  - otherwise: an exclusive flock on LEADER_LOCK_DIR/<name>.lock (same
+    host only; released by the OS when the process dies)
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+import uuid
+
+REDIS_URL = os.getenv("REDIS_URL")
+LEADER_TTL_S = float(os.getenv("LEADER_TTL_S", "15"))
+LEADER_RETRY_S = float(os.getenv("LEADER_RETRY_S", "5"))
+LEADER_LOCK_DIR = os.getenv("LEADER_LOCK_DIR", tempfile.gettempdir())
+
+try:
+    import fcntl
+except ImportError:      # Windows dev boxes: single process assumed
+    fcntl = None
+
+# only renew/release the key while it still holds our id
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _RedisLock:
+    def __init__(self, name: str):
+        import redis.asyncio as aioredis
+
+        self.key = f"wheatguard:leader:{name}"
+        self.redis = aioredis.Redis.from_url(REDIS_URL)
+        self.ident = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def acquire(self) -> bool:
+        return bool(await self.redis.set(self.key, self.ident, nx=True, px=int(LEADER_TTL_S * 1000)))
+
+    async def renew(self) -> bool:
+        return bool(await self.redis.eval(_RENEW, 1, self.key, self.ident, int(LEADER_TTL_S * 1000)))
+
+    async def release(self):
+        await self.redis.eval(_RELEASE, 1, self.key, self.ident)
+        await self.redis.aclose()
+
+
+class _FileLock:
+    def __init__(self, name: str):
+        self.path = os.path.join(LEADER_LOCK_DIR, f"wheatguard-{name}.lock")
+        self._fd = None
+
+    async def acquire(self) -> bool:
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    async def renew(self) -> bool:
+        # held until the process exits or releases it
+        return True
+
+    async def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class Leader:
+    """
+    Runs on_elected() while this process holds `name`, on_demoted() when
+    it loses it (Redis unreachable, key expired) or on stop().
+    """
+
+    def __init__(self, name: str, on_elected, on_demoted):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._lock = None
+        self._task = None
+
+    def _make_lock(self):
+        return _RedisLock(self.name) if REDIS_URL else _FileLock(self.name)
+
+    async def _step(self) -> float:
+        """
+        One acquire/renew round; returns the delay until the next one.
+        """
+        if self.is_leader:
+            try:
+                held = await self._lock.renew()
+            except Exception as e:
+                print(f" Leader lock '{self.name}' renew failed:", e)
+                held = False
+            if not held:
+                print(f" Lost leadership of '{self.name}' (pid {os.getpid()})")
+                await self._demote()
+                return LEADER_RETRY_S
+            return LEADER_TTL_S / 3
+
+        try:
+            acquired = await self._lock.acquire()
+        except Exception as e:
+            print(f" Leader lock '{self.name}' unavailable:", e)
+            acquired = False
+        if not acquired:
+            return LEADER_RETRY_S
+
+        self.is_leader = True
+        print(f" Elected leader for '{self.name}' (pid {os.getpid()}, {self.status()['backend']} lock)")
+        try:
+            await self.on_elected()
+        except Exception as e:
+            print(f" Leader '{self.name}' startup error:", e)
+        return LEADER_TTL_S / 3
+
+    async def _demote(self):
+        self.is_leader = False
+        try:
+            await self.on_demoted()
+        except Exception as e:
+            print(f" Leader '{self.name}' demotion error:", e)
+
+    async def _run(self, delay: float):
+        while True:
+            await asyncio.sleep(delay)
+            delay = await self._step()
+
+    async def start(self):
+        """
+        Try once right away (so a single worker starts its jobs during
+        startup), then keep trying/renewing in the background.
+        """
+        self._lock = self._make_lock()
+        delay = await self._step()
+        self._task = asyncio.create_task(self._run(delay))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.is_leader:
+            await self._demote()
+        if self._lock is not None:
+            try:
+                await self._lock.release()
+            except Exception as e:
+                print(f" Leader lock '{self.name}' release failed:", e)
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "leader": self.is_leader,
+            "pid": os.getpid(),
+            "backend": "redis" if REDIS_URL else "file",
+        }
@@ -0,0 +1,157 @@
+# app/utils/map_changes.py
+"""
+Log of in-place edits and deletes on the map layers.
+
+The in-memory cluster cache and the vector tile cache follow inserts
+by id (see Cursor). Deletes and edits can't be seen that way, so the code making them writes a MapChange row in the same
+transaction: the area the row covered and, for detections, its old
+(and new) label and severity. Every worker reads the log from where it
+last stopped, so a change made by one worker reaches the caches of all.
+
+Entries older than MAP_CHANGES_RETENTION_DAYS are pruned by the
+leader's scheduler; caches that haven't caught up for that long
+rebuild from scratch instead.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, bindparam, text
+
+from app.models.map_change import MapChange
+
+MAP_CHANGES_RETENTION_DAYS = float(os.getenv("MAP_CHANGES_RETENTION_DAYS", "7"))
+RETENTION_S = MAP_CHANGES_RETENTION_DAYS * 86400
+# Longest a transaction inserting map rows is expected to stay open.
+MAP_LATE_COMMIT_S = float(os.getenv("MAP_LATE_COMMIT_S", "60"))
+
+
+def settled_before() -> datetime:
+    """
+    Rows created before this are taken to be committed (or rolled back).
+    """
+    return datetime.utcnow() - timedelta(seconds=MAP_LATE_COMMIT_S)
+
+
+class Cursor:
+    """
+    How far a cache has read an append-only table. Ids are handed out at
+    INSERT but rows only show up at COMMIT, so on PostgreSQL a row can
+    appear after rows with higher ids were read. Reads therefore restart
+    after the newest row created before settled_before() (`after`), and
+    the rows read since then are skipped by id.
+    """
+
+    def __init__(self):
+        self.after = 0
+        self._seen = set()
+
+    def seen(self, row_id: int) -> bool:
+        return row_id <= self.after or row_id in self._seen
+
+    def take(self, rows):
+        """
+        The rows (with .id and .created_at, read with id > after) not
+        seen before. Moves the cursor.
+        """
+        cutoff = settled_before()
+        new = [r for r in rows if r.id not in self._seen]
+
+        settled = [r.id for r in rows if r.created_at is None or r.created_at < cutoff]
+        if settled:
+            self.after = max(self.after, max(settled))
+        self._seen = {i for i in self._seen.union(r.id for r in new) if i > self.after}
+        return new
+
+
+def _point(layer, row_id, lat, lon, **extra):
+    return MapChange(
+        layer=layer, row_id=row_id,
+        min_lat=lat, min_lon=lon, max_lat=lat, max_lon=lon,
+        **extra,
+    )
+
+
+def detections_removed(db, report_ids) -> int:
+    """
+    Log the detections of these reports before they are deleted. Call
+    before the DELETE, commit together with it.
+    """
+    if not report_ids:
+        return 0
+
+    rows = db.execute(text(
+        "SELECT d.id, r.lat, r.lon, d.disease_label, d.severity "
+        "FROM detections d JOIN reports r ON r.id = d.report_id "
+        "WHERE d.report_id IN :ids AND r.lat IS NOT NULL AND r.lon IS NOT NULL"
+    ).bindparams(bindparam("ids", expanding=True)), {"ids": list(report_ids)}).fetchall()
+
+    db.add_all([
+        _point("detections", r.id, r.lat, r.lon, delta=-1, disease=r.disease_label, severity=r.severity)
+        for r in rows
+    ])
+    return len(rows)
+
+
+def area_changed(db, layer: str, row_id: int, bounds):
+    """
+    Log an edit / delete of a row of `layer` covering
+    bounds = (west, south, east, north), e.g. a field polygon before
+    and after an update (call once for each).
+    """
+    west, south, east, north = bounds
+    db.add(MapChange(
+        layer=layer, row_id=row_id,
+        min_lat=south, min_lon=west, max_lat=north, max_lon=east,
+    ))
+
+
+def since(conn, layer: str, after_id: int):
+    return conn.execute(text(
+        "SELECT id, created_at, row_id, min_lat, min_lon, delta, disease, severity FROM map_changes "
+        "WHERE layer = :layer AND id > :after ORDER BY id"
+    ).columns(created_at=DateTime), {"layer": layer, "after": after_id}).fetchall()
+
+
+def settled_id(conn, layer: str) -> int:
+    """
+    Newest entry of `layer` created before settled_before(): every entry
+    up to it is committed.
+    """
+    return conn.execute(text(
+        "SELECT COALESCE(MAX(id), 0) FROM map_changes WHERE layer = :layer AND created_at < :cutoff"
+    ).bindparams(bindparam("cutoff", type_=DateTime)), {
+        "layer": layer, "cutoff": settled_before(),
+    }).scalar()
+
+
+def cursor_at_end(conn, layer: str) -> Cursor:
+    """
+    A Cursor past every entry of `layer` visible now, for a cache loaded
+    from scratch (its rows already reflect them).
+    """
+    cursor = Cursor()
+    cursor.after = settled_id(conn, layer)
+    cursor.take(since(conn, layer, cursor.after))
+    return cursor
+
+
+def touching(conn, layer: str, after_id: int, bounds) -> int:
+    """
+    Number of entries newer than after_id overlapping bounds.
+    """
+    west, south, east, north = bounds
+    return conn.execute(text(
+        "SELECT COUNT(*) FROM map_changes WHERE layer = :layer AND id > :after "
+        "AND min_lat <= :north AND max_lat >= :south AND min_lon <= :east AND max_lon >= :west"
+    ), {
+        "layer": layer, "after": after_id,
+        "south": south, "north": north, "west": west, "east": east,
+    }).scalar()
+
+
+def prune(db) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=RETENTION_S)
+    deleted = db.query(MapChange).filter(MapChange.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,448 @@
+# app/utils/notification_outbox.py
+"""
+Durable queue for outgoing push notifications.
+
+Every push is first written to the notification_outbox table (one row
+per device and alert, duplicates are ignored), then a background worker
+drains it:
+
+  - rows are claimed in batches and sent as FCM multicasts, grouped by
+    identical message, through app.utils.fcm_sender
+  - a token bucket caps the rate at FCM_RATE_PER_S messages (bursts up
+    to FCM_BURST), however many alerts arrive at once
+  - failures are retried with exponential backoff; after
+    OUTBOX_MAX_ATTEMPTS the row is dead-lettered (status "dead") and can
+    be requeued from /fcm/outbox/requeue
+  - tokens FCM reports as unregistered/invalid are deleted from
+    fcm_devices (row status "invalid"); canonical ids replace old tokens
+
+Rows left in "sending" by a crashed worker are retried after
+OUTBOX_CLAIM_TIMEOUT_S. Sent rows are deleted after
+OUTBOX_RETENTION_DAYS.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, select, update
+
+from app.db.database import SessionLocal, engine
+from app.models.fcm_device import FCMDevice
+from app.models.notification_outbox import NotificationOutbox
+from app.utils import fcm_sender
+
+FCM_RATE_PER_S = float(os.getenv("FCM_RATE_PER_S", "2000"))
+FCM_BURST = int(os.getenv("FCM_BURST", "4000"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE_S = float(os.getenv("OUTBOX_BACKOFF_BASE_S", "5"))
+OUTBOX_BACKOFF_MAX_S = float(os.getenv("OUTBOX_BACKOFF_MAX_S", "3600"))
+OUTBOX_CLAIM_TIMEOUT_S = float(os.getenv("OUTBOX_CLAIM_TIMEOUT_S", "300"))
+OUTBOX_POLL_S = float(os.getenv("OUTBOX_POLL_S", "2"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+# per-message errors that no retry will fix; dead-lettered straight away.
+# Anything else (timeouts, 5xx, Unavailable, ...) is retried with backoff.
+PERMANENT_ERRORS = {"MessageTooBig", "InvalidDataKey", "InvalidTtl", "InvalidPackageName", "InvalidParameters"}
+
+_worker = None
+_wakeup = None
+_last_cleanup = 0.0
+
+stats = {
+    "enqueued": 0,
+    "duplicates": 0,
+    "sent": 0,
+    "retried": 0,
+    "dead": 0,
+    "invalid_tokens_removed": 0,
+    "tokens_updated": 0,
+    "requests": 0,
+}
+_send_ms = deque(maxlen=1000)        # FCM request latency per batch
+_delivery_ms = deque(maxlen=5000)    # enqueue -> sent per message
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, at most `capacity` banked.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, n: int):
+        n = min(n, self.capacity)
+        while True:
+            self._refill()
+            if self._tokens >= n:
+                self._tokens -= n
+                return
+            await asyncio.sleep((n - self._tokens) / self.rate)
+
+
+_bucket = TokenBucket(FCM_RATE_PER_S, FCM_BURST)
+
+
+# -------------------------------------------------
+# Enqueue
+# -------------------------------------------------
+def _insert_ignore():
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return (
+        insert(NotificationOutbox)
+        .on_conflict_do_nothing(index_elements=["device_id", "alert_id"])
+        .returning(NotificationOutbox.id)
+    )
+
+
+def enqueue(messages: list) -> int:
+    """
+    messages: dicts with device_id, alert_id, token, title, body, data.
+    Returns how many were new; a (device, alert) pair already in the
+    outbox is skipped.
+    """
+    if not messages:
+        return 0
+
+    now = datetime.utcnow()
+    rows = [
+        {**m, "status": "pending", "attempts": 0, "next_attempt_at": now, "created_at": now}
+        for m in messages
+    ]
+
+    added = 0
+    db = SessionLocal()
+    try:
+        for i in range(0, len(rows), 1000):
+            added += len(db.execute(_insert_ignore(), rows[i:i + 1000]).all())
+        db.commit()
+    finally:
+        db.close()
+
+    stats["enqueued"] += added
+    stats["duplicates"] += len(rows) - added
+    return added
+
+
+def wake():
+    """
+    Let a running worker look at the queue now instead of at its next
+    poll. Rows queued elsewhere (scripts, workers that are not the
+    leader, see app.utils.leader) wait for the leader's next poll.
+    """
+    if _worker is not None and not _worker.done() and _worker.get_loop() is asyncio.get_running_loop():
+        _wakeup.set()
+
+
+# -------------------------------------------------
+# Worker
+# -------------------------------------------------
+def start():
+    """
+    Start the delivery worker on the running loop (app startup).
+    """
+    global _worker, _wakeup
+    if _worker is None or _worker.done():
+        _wakeup = asyncio.Event()
+        _worker = asyncio.create_task(_run())
+    return _worker
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
+    await fcm_sender.close()
+
+
+def _claim(limit: int) -> list:
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        # rows a crashed worker left behind
+        db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.status == "sending")
+            .where(NotificationOutbox.claimed_at < now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT_S))
+            .values(status="pending")
+        )
+
+        rows = db.execute(
+            select(
+                NotificationOutbox.id,
+                NotificationOutbox.device_id,
+                NotificationOutbox.token,
+                NotificationOutbox.title,
+                NotificationOutbox.body,
+                NotificationOutbox.data,
+                NotificationOutbox.attempts,
+                NotificationOutbox.created_at,
+            )
+            .where(NotificationOutbox.status == "pending")
+            .where(NotificationOutbox.next_attempt_at <= now)
+            .order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+        if rows:
+            db.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_([r.id for r in rows]))
+                .values(status="sending", claimed_at=now)
+            )
+        db.commit()
+        return rows
+    finally:
+        db.close()
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_BACKOFF_BASE_S * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_S))
+
+
+def _record(outcomes: list):
+    """
+    outcomes: (claimed row, result from send_multicast, send_ms).
+    """
+    now = datetime.utcnow()
+    # rows with the same outcome share one UPDATE ... WHERE id IN (...)
+    groups, invalid_devices, new_tokens = {}, [], []
+
+    for row, result, send_ms in outcomes:
+        attempts = row.attempts + 1
+        values = {"send_ms": send_ms, "last_error": result["error"]}
+
+        if result["ok"]:
+            values.update(status="sent", sent_at=now)
+            stats["sent"] += 1
+            _delivery_ms.append(round((now - row.created_at).total_seconds() * 1000, 1))
+            if result["canonical"]:
+                new_tokens.append({"b_id": row.device_id, "b_token": result["canonical"]})
+        elif result["error"] in fcm_sender.INVALID_TOKEN_ERRORS:
+            values.update(status="invalid")
+            invalid_devices.append({"b_id": row.device_id, "b_token": row.token})
+        elif attempts >= OUTBOX_MAX_ATTEMPTS or result["error"] in PERMANENT_ERRORS:
+            values.update(status="dead")
+            stats["dead"] += 1
+        else:
+            values.update(status="pending", next_attempt_at=now + _backoff(attempts))
+            stats["retried"] += 1
+        groups.setdefault(tuple(sorted(values.items())), []).append(row.id)
+
+    db = SessionLocal()
+    try:
+        for values, ids in groups.items():
+            for i in range(0, len(ids), 5000):
+                db.execute(
+                    update(NotificationOutbox)
+                    .where(NotificationOutbox.id.in_(ids[i:i + 5000]))
+                    .values(attempts=NotificationOutbox.attempts + 1, **dict(values))
+                )
+
+        devices = FCMDevice.__table__
+        if invalid_devices:
+            # only if the device hasn't registered a new token meanwhile
+            db.connection().execute(
+                delete(devices).where(devices.c.id == bindparam("b_id"), devices.c.token == bindparam("b_token")),
+                invalid_devices,
+            )
+            stats["invalid_tokens_removed"] += len(invalid_devices)
+
+        if new_tokens:
+            db.connection().execute(
+                update(devices).where(devices.c.id == bindparam("b_id")).values(token=bindparam("b_token")),
+                new_tokens,
+            )
+            stats["tokens_updated"] += len(new_tokens)
+
+        db.commit()
+    finally:
+        db.close()
+
+
+def _cleanup():
+    cutoff = datetime.utcnow() - timedelta(days=OUTBOX_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        db.execute(
+            delete(NotificationOutbox)
+            .where(NotificationOutbox.status.in_(("sent", "invalid")))
+            .where(NotificationOutbox.created_at < cutoff)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _send_group(rows: list):
+    first = rows[0]
+    await _bucket.acquire(len(rows))
+
+    started = time.perf_counter()
+    results = await fcm_sender.send_multicast([r.token for r in rows], first.title, first.body, first.data)
+    send_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    stats["requests"] += 1
+    _send_ms.append(send_ms)
+    return [(row, result, send_ms) for row, result in zip(rows, results)]
+
+
+async def drain_once() -> int:
+    """
+    Claim and send one round of due messages; returns how many.
+    """
+    rows = await asyncio.to_thread(_claim, fcm_sender.FCM_BATCH_SIZE * fcm_sender.FCM_CONCURRENCY)
+    if not rows:
+        return 0
+
+    groups = {}
+    for r in rows:
+        key = (r.title, r.body, tuple(sorted((r.data or {}).items())))
+        groups.setdefault(key, []).append(r)
+
+    batches = [
+        group[i:i + fcm_sender.FCM_BATCH_SIZE]
+        for group in groups.values()
+        for i in range(0, len(group), fcm_sender.FCM_BATCH_SIZE)
+    ]
+    outcomes = await asyncio.gather(*(_send_group(b) for b in batches))
+    await asyncio.to_thread(_record, [o for batch in outcomes for o in batch])
+    return len(rows)
+
+
+async def _run():
+    global _last_cleanup
+    print(" Notification outbox worker started")
+
+    while True:
+        try:
+            if not fcm_sender.FCM_SERVER_KEY:
+                # nothing can be sent; keep the rows for when a key is set
+                await asyncio.sleep(60)
+                continue
+
+            sent = await drain_once()
+
+            if time.monotonic() - _last_cleanup > 3600:
+                _last_cleanup = time.monotonic()
+                await asyncio.to_thread(_cleanup)
+
+            if sent:
+                continue
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(" Notification outbox worker error:", e)
+            await asyncio.sleep(OUTBOX_POLL_S)
+
+
+# -------------------------------------------------
+# Metrics / dead letters
+# -------------------------------------------------
+def _percentiles(values) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def get_stats() -> dict:
+    db = SessionLocal()
+    try:
+        depth = dict(db.execute(
+            select(NotificationOutbox.status, func.count()).group_by(NotificationOutbox.status)
+        ).all())
+        oldest = db.scalar(
+            select(func.min(NotificationOutbox.created_at)).where(NotificationOutbox.status == "pending")
+        )
+    finally:
+        db.close()
+
+    return {
+        **stats,
+        "queue": {
+            "pending": depth.get("pending", 0),
+            "sending": depth.get("sending", 0),
+            "dead": depth.get("dead", 0),
+            "sent": depth.get("sent", 0),
+            "invalid": depth.get("invalid", 0),
+            "oldest_pending_s": round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else None,
+        },
+        "send_ms": _percentiles(_send_ms),
+        "delivery_ms": _percentiles(_delivery_ms),
+        "rate_per_s": FCM_RATE_PER_S,
+        "burst": FCM_BURST,
+        "worker_running": _worker is not None and not _worker.done(),
+    }
+
+
+def dead_letters(limit: int = 100) -> list:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(NotificationOutbox)
+            .where(NotificationOutbox.status == "dead")
+            .order_by(NotificationOutbox.id.desc())
+            .limit(limit)
+        ).scalars().all()
+        return [
+            {
+                "id": r.id,
+                "device_id": r.device_id,
+                "alert_id": r.alert_id,
+                "title": r.title,
+                "attempts": r.attempts,
+                "last_error": r.last_error,
+                "created_at": r.created_at.isoformat(),
+            }
+            for r in rows
+        ]
+    finally:
+        db.close()
+
+
+def requeue_dead(ids=None) -> int:
+    """
+    Put dead-lettered rows (all, or the given ids) back in the queue.
+    """
+    db = SessionLocal()
+    try:
+        q = update(NotificationOutbox).where(NotificationOutbox.status == "dead")
+        if ids:
+            q = q.where(NotificationOutbox.id.in_(ids))
+        count = db.execute(
+            q.values(status="pending", attempts=0, next_attempt_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        return count
+    finally:
+        db.close()
@@ -1,31 +1,25 @@
-from sqlalchemy.orm import Session
-from app.db.database import SessionLocal
-from app.models.fcm_token import FCMToken
-from app.utils.fcm_sender import send_fcm, haversine
+import asyncio
 
+from app.utils.fcm_dispatch import dispatch_alert, schedule_alert_push
 
-def send_alert_push(alert):
-    db: Session = SessionLocal()
-
-    farmers = db.query(FCMToken).all()
-
-    for f in farmers:
-        # If farmer has no location saved
-        if f.lat is None or f.lon is None:
-            continue
 
-        dist = haversine(alert.lat, alert.lon, f.lat, f.lon)
-
-        if dist <= 5:
-            send_fcm(
-                token=f.token,
-                title=f"🚨 {alert.disease} Alert Nearby!",
-                body=f"{alert.severity} outbreak detected {dist:.1f} km from your location.",
-                data={
-                    "lat": str(alert.lat),
-                    "lon": str(alert.lon),
-                    "disease": alert.disease
-                }
-            )
+def send_alert_push(alert):
+    """
+    Notify the farmers near `alert` (an Alert row or dict). Scheduled in
+    the background when called from the event loop, run to completion
+    otherwise (scripts, scheduler threads).
+    """
+    if not isinstance(alert, dict):
+        alert = {
+            "id": alert.id,
+            "disease": alert.disease,
+            "severity": alert.severity,
+            "lat": alert.lat,
+            "lon": alert.lon,
+        }
 
-    db.close()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(dispatch_alert(alert))
+    return schedule_alert_push(alert)
@@ -0,0 +1,87 @@
+# utils/single_flight.py
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs
+    the function, everyone who arrives while it is still running waits
+    for that result instead of issuing their own call.
+    do() is for worker threads, do_async() for coroutines; both share
+    the calls in flight. Async waiters await on the loop and hold no
+    thread.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        self.issued = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+                self.issued += 1
+            else:
+                self.coalesced += 1
+        return fut, leader
+
+    def do(self, key, fn):
+        fut, leader = self._join(key)
+
+        if not leader:
+            return fut.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def do_async(self, key, fn):
+        """
+        do() for a coroutine function.
+        """
+        fut, leader = self._join(key)
+
+        if not leader:
+            return await asyncio.wrap_future(fut)
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # waiters get an error of their own, not our cancellation
+            fut.set_exception(RuntimeError(f"{self.name} call cancelled"))
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self):
+        total = self.issued + self.coalesced
+        return {
+            "issued": self.issued,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+            "coalesced_ratio": round(self.coalesced / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,234 @@
+# app/utils/socket_feed.py
+"""
+Batched, back-pressured delivery of high-rate Socket.IO feeds.
+
+Emit side (`FeedBatcher`): events are buffered per room for
+SOCKET_BATCH_WINDOW_MS and sent as one batch event per room,
+    {"items": [...], "count": n, "room": r, "src": s, "seq": k}
+Items with the same key (detection id) inside one window are coalesced
+to the latest. SOCKET_BATCH_MAX_ITEMS distinct items pending (however
+many rooms each goes to) flush early. seq numbers the batches one
+process (src) sent to one room, so a client seeing a jump knows
+batches were dropped for it and reloads.
+
+Delivery side (`FeedManager` / `FeedRedisManager`, the client managers
+used by main.py): batch events are encoded once and queued per
+recipient, looking at that client's Engine.IO send queue first:
+
+  - queue <= SOCKET_MAX_QUEUE: the batch as is
+  - up to 2x that: a summary instead (counts by disease/severity,
+    "summary": true, same room/src/seq) so a slow dashboard still sees
+    that things happen and knows to reload
+  - beyond: dropped (the client notices from the next seq)
+
+Clients connecting with auth {"msgpack": true} get batches as one
+binary msgpack attachment instead of JSON (when msgpack is installed).
+With the Redis manager the checks run in the worker that owns the
+socket, after the pub/sub hop.
+"""
+
+import asyncio
+import os
+import uuid
+from collections import Counter
+
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SOCKET_BATCH_WINDOW_MS = float(os.getenv("SOCKET_BATCH_WINDOW_MS", "250"))
+SOCKET_BATCH_MAX_ITEMS = int(os.getenv("SOCKET_BATCH_MAX_ITEMS", "500"))
+SOCKET_MAX_QUEUE = int(os.getenv("SOCKET_MAX_QUEUE", "32"))
+
+# batch events handled by the managers below; anything else is emitted
+# the normal python-socketio way
+BATCH_EVENTS = {"new_detections"}
+
+stats = {
+    "events_in": 0,
+    "coalesced": 0,
+    "batches_out": 0,
+    "deliveries": 0,
+    "summarized": 0,
+    "dropped": 0,
+    "msgpack_deliveries": 0,
+}
+
+
+# -------------------------------------------------
+# Emit side
+# -------------------------------------------------
+class FeedBatcher:
+    """
+    add() from the event loop; batches go out through sio.emit.
+    """
+
+    def __init__(self, get_sio, batch_event: str, window_ms: float = SOCKET_BATCH_WINDOW_MS):
+        self.get_sio = get_sio
+        self.batch_event = batch_event
+        self.window_s = window_ms / 1000
+        self._rooms = {}            # room -> {key: item}
+        self._keys = set()          # distinct items pending, whatever their rooms
+        self._flusher = None
+        self.src = uuid.uuid4().hex[:8]
+        self._seq = {}              # room -> last batch number
+
+    async def add(self, item: dict, rooms: list, key=None):
+        stats["events_in"] += 1
+        key = key if key is not None else id(item)
+        if key in self._keys:
+            stats["coalesced"] += 1
+        self._keys.add(key)
+        for room in rooms:
+            items = self._rooms.setdefault(room, {})
+            items.pop(key, None)        # re-insert: latest value, latest position
+            items[key] = item
+
+        if self.window_s <= 0 or len(self._keys) >= SOCKET_BATCH_MAX_ITEMS:
+            await self.flush()
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window_s)
+        self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+
+        rooms, self._rooms, self._keys = self._rooms, {}, set()
+        sio = self.get_sio()
+        if sio is None or not rooms:
+            return
+
+        for room, items in rooms.items():
+            batch = list(items.values())
+            seq = self._seq[room] = self._seq.get(room, 0) + 1
+            stats["batches_out"] += 1
+            await sio.emit(self.batch_event, {
+                "items": batch, "count": len(batch), "room": room, "src": self.src, "seq": seq,
+            }, room=room)
+
+
+# -------------------------------------------------
+# Delivery side
+# -------------------------------------------------
+def _summary(data: dict) -> dict:
+    items = data.get("items") or []
+    return {
+        "items": [],
+        "count": len(items),
+        "room": data.get("room"),
+        "src": data.get("src"),
+        "seq": data.get("seq"),
+        "summary": True,
+        "by_disease": dict(Counter(i.get("disease") for i in items)),
+        "by_severity": dict(Counter(i.get("severity") for i in items)),
+    }
+
+
+class _FeedDelivery(socketio.AsyncManager):
+    """
+    Local delivery of BATCH_EVENTS with per-client backpressure. Sits
+    below AsyncPubSubManager in the MRO, so Redis-relayed emits land here
+    too.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.msgpack_sids = set()
+
+    def use_msgpack(self, sid, enabled: bool):
+        if enabled and msgpack is not None:
+            self.msgpack_sids.add(sid)
+        else:
+            self.msgpack_sids.discard(sid)
+
+    def _encode(self, event, data, namespace, binary=False):
+        if binary:
+            data = msgpack.packb(data, use_bin_type=True)
+        pkt = self.server.packet_class(packet.EVENT, namespace=namespace, data=[event, data])
+        encoded = pkt.encode()
+        if not isinstance(encoded, list):
+            encoded = [encoded]
+        return [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+
+    def _queue_size(self, eio_sid) -> int:
+        s = self.server.eio.sockets.get(eio_sid)
+        return s.queue.qsize() if s is not None else 0
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        if event not in BATCH_EVENTS or callback is not None or not isinstance(data, dict):
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, to=to, **kwargs)
+
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        # encoded lazily, once per variant, whatever the number of clients
+        encoded = {}
+
+        def packets(kind):
+            if kind not in encoded:
+                payload = _summary(data) if kind[0] == "summary" else data
+                encoded[kind] = self._encode(event, payload, namespace, binary=kind[1])
+            return encoded[kind]
+
+        for sid, eio_sid in list(self.get_participants(namespace, room)):
+            if sid in skip_sid:
+                continue
+
+            backlog = self._queue_size(eio_sid)
+            if backlog > 2 * SOCKET_MAX_QUEUE:
+                stats["dropped"] += 1
+                continue
+            shape = "summary" if backlog > SOCKET_MAX_QUEUE else "full"
+            if shape == "summary":
+                stats["summarized"] += 1
+
+            binary = sid in self.msgpack_sids
+            if binary:
+                stats["msgpack_deliveries"] += 1
+            stats["deliveries"] += 1
+
+            # a queue put per packet; no task per recipient
+            for p in packets((shape, binary)):
+                await self.server._send_eio_packet(eio_sid, p)
+
+    async def disconnect(self, sid, namespace, **kwargs):
+        self.msgpack_sids.discard(sid)
+        return await super().disconnect(sid, namespace, **kwargs)
+
+
+class FeedManager(_FeedDelivery):
+    """
+    In-process manager (single worker).
+    """
+
+
+class FeedRedisManager(socketio.AsyncRedisManager, _FeedDelivery):
+    """
+    Redis pub/sub manager; MRO: AsyncRedisManager -> AsyncPubSubManager
+    -> _FeedDelivery -> AsyncManager.
+    """
+
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "window_ms": SOCKET_BATCH_WINDOW_MS,
+        "max_items": SOCKET_BATCH_MAX_ITEMS,
+        "max_queue": SOCKET_MAX_QUEUE,
+        "msgpack_available": msgpack is not None,
+    }
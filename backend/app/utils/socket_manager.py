@@ -1,21 +1,128 @@
+import math
+import os
 from typing import Optional
 import socketio
 
+from app.utils import geohash
+from app.utils.socket_feed import FeedBatcher, FeedManager, FeedRedisManager
+
 # Global Socket.IO server instance (created in main.py)
 sio: Optional[socketio.AsyncServer] = None
 
+# "redis": emits are published on Redis pub/sub so every worker/host
+# delivers them to its own sockets (needed for uvicorn --workers > 1).
+# "local": in-process only, for single-worker dev and tests.
+SOCKETIO_MANAGER = os.getenv("SOCKETIO_MANAGER", "redis" if os.getenv("REDIS_URL") else "local")
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "wheatguard-socketio")
+
+# Location events (detections, alerts, NDVI stress) go to the admin room
+# and to the geohash rooms containing the event, one per precision.
+# Clients join the cells covering their area of interest (see
+# subscribe_area) at the finest precision that needs at most
+# GEO_ROOM_MAX_CELLS rooms, so a farmer's 25 km radius and a zoomed-out
+# map both stay a handful of rooms.
+ADMIN_ROOM = "admin"
+GEO_ROOM_PRECISIONS = sorted(int(p) for p in os.getenv("GEO_ROOM_PRECISIONS", "2,3,4,5").split(","))
+GEO_ROOM_MAX_CELLS = int(os.getenv("GEO_ROOM_MAX_CELLS", "16"))
+GEO_SUBSCRIBE_RADIUS_KM = float(os.getenv("GEO_SUBSCRIBE_RADIUS_KM", "25"))
+
+
+def create_client_manager():
+    """
+    client_manager for the AsyncServer in main.py.
+    """
+    if SOCKETIO_MANAGER == "redis":
+        print(f" Socket.IO: Redis client manager (channel {SOCKETIO_CHANNEL})")
+        return FeedRedisManager(os.getenv("REDIS_URL", "redis://localhost:6379/0"), channel=SOCKETIO_CHANNEL)
+
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        print("⚠️ Socket.IO is in-process but WEB_CONCURRENCY > 1: "
+              "broadcasts only reach clients of the emitting worker. Set REDIS_URL.")
+    return FeedManager()
+
+
+def geo_room(cell: str) -> str:
+    return f"geo_{cell}"
+
+
+def event_rooms(lat, lon) -> list:
+    """
+    Rooms an event at lat/lon is emitted to.
+    """
+    if lat is None or lon is None:
+        return [ADMIN_ROOM]
+    return [ADMIN_ROOM] + [geo_room(geohash.encode(lat, lon, p)) for p in GEO_ROOM_PRECISIONS]
+
+
+def area_rooms(west: float, south: float, east: float, north: float) -> list:
+    """
+    Geohash rooms covering the box, finest precision first that fits in
+    GEO_ROOM_MAX_CELLS (coarsest precision, capped, for huge boxes).
+    """
+    for p in reversed(GEO_ROOM_PRECISIONS):
+        cells = geohash.cover(west, south, east, north, p, GEO_ROOM_MAX_CELLS)
+        if cells is not None:
+            return [geo_room(c) for c in cells]
+
+    cells = geohash.cover(west, south, east, north, GEO_ROOM_PRECISIONS[0])
+    return [geo_room(c) for c in cells[:GEO_ROOM_MAX_CELLS]]
+
+
+def parse_area(data) -> Optional[tuple]:
+    """
+    (west, south, east, north) from {"bbox": [w, s, e, n]} or
+    {"lat", "lon", "radius_km"}; None if neither is given.
+    """
+    data = data or {}
+    try:
+        if data.get("bbox") is not None:
+            west, south, east, north = (float(v) for v in data["bbox"])
+            return west, south, east, north
+
+        if data.get("lat") is None or data.get("lon") is None:
+            return None
+        lat, lon = float(data["lat"]), float(data["lon"])
+        radius_km = min(float(data.get("radius_km") or GEO_SUBSCRIBE_RADIUS_KM), 2000.0)
+    except (TypeError, ValueError):
+        raise ValueError("expected bbox [w, s, e, n] or lat, lon[, radius_km]")
+
+    dlat = radius_km / 111.32
+    dlon = radius_km / (111.32 * max(math.cos(math.radians(lat)), 1e-6))
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+async def subscribe_area(sid, data) -> list:
+    """
+    Move `sid` to the geohash rooms of the area in `data`, replacing its
+    previous subscription. Returns the rooms joined.
+    """
+    area = parse_area(data)
+    rooms = area_rooms(*area) if area else []
+
+    current = {r for r in sio.rooms(sid) if r.startswith("geo_")}
+    for room in current - set(rooms):
+        await sio.leave_room(sid, room)
+    for room in set(rooms) - current:
+        await sio.enter_room(sid, room)
+    return rooms
+
 
 # -------------------------------------------------
 # 🔴 REALTIME DISEASE DETECTIONS (Mobile / Drone)
 # -------------------------------------------------
+# detections arrive in bursts (drone surveys, sync of offline phones):
+# they go out as "new_detections" batches, see app.utils.socket_feed
+detection_feed = FeedBatcher(lambda: sio, "new_detections")
+
+
 async def broadcast_new_detection(data):
     """
-    Emits a new_detection event to all connected clients.
+    Queues a detection for the next "new_detections" batch of the admin
+    room and the clients subscribed to its location.
     Safe to import anywhere (no circular imports).
     """
     if sio:
-        print("📡 Broadcasting NEW DETECTION:", data)
-        await sio.emit("new_detection", data)
+        await detection_feed.add(data, event_rooms(data.get("lat"), data.get("lon")), key=data.get("id"))
     else:
         print("⚠️ SocketIO not initialized yet (detection).")
 
@@ -25,22 +132,67 @@ async def broadcast_new_detection(data):
 # -------------------------------------------------
 async def broadcast_new_alert(data):
     """
-    Emits a new_alert event for farmer apps.
+    Emits a new_alert event for farmer apps near the alert (and the
+    admin room).
     Includes source: admin | drone | mobile
     """
     if sio:
-        print("📡 Broadcasting NEW ALERT:", data)
-        await sio.emit("new_alert", data)
+        await sio.emit("new_alert", data, room=event_rooms(data.get("lat"), data.get("lon")))
     else:
         print("⚠️ SocketIO not initialized yet (alerts).")
 
 async def broadcast_ndvi_stress_updates(alerts):
     """
-    Emits updated NDVI stress alerts to all clients.
+    Emits updated NDVI stress alerts. The admin room gets the full list;
+    each geohash room gets the alerts inside its cell, so a client
+    subscribed to several cells receives one update per cell.
     The frontend listens to 'ndvi_stress_update'.
     """
     if sio:
         print("📡 Broadcasting NDVI STRESS UPDATE:", len(alerts))
-        await sio.emit("ndvi_stress_update", alerts)
+        await sio.emit("ndvi_stress_update", alerts, room=ADMIN_ROOM)
+
+        by_room = {}
+        for a in alerts:
+            for room in event_rooms(a.get("lat"), a.get("lon"))[1:]:
+                by_room.setdefault(room, []).append(a)
+        for room, items in by_room.items():
+            await sio.emit("ndvi_stress_update", items, room=room)
     else:
         print("⚠️ SocketIO not initialized yet (NDVI).")
+
+
+# -------------------------------------------------
+# 🟢 REMEDY READY (follow-up to /detections/predict)
+# -------------------------------------------------
+def detection_room(detection_id: int) -> str:
+    return f"detection_{detection_id}"
+
+
+async def broadcast_remedy_ready(data):
+    """
+    Emits remedy_ready to clients watching this detection_id
+    (they join via the 'watch_detection' event).
+    """
+    if sio:
+        await sio.emit("remedy_ready", data, room=detection_room(data["detection_id"]))
+    else:
+        print("⚠️ SocketIO not initialized yet (remedy).")
+
+
+# -------------------------------------------------
+# 🔵 DRONE SURVEY PROGRESS (bulk flight uploads)
+# -------------------------------------------------
+def survey_room(job_id: str) -> str:
+    return f"survey_{job_id}"
+
+
+async def broadcast_survey_progress(data):
+    """
+    Emits survey_progress to clients watching this job
+    (they join via the 'watch_survey' event).
+    """
+    if sio:
+        await sio.emit("survey_progress", data, room=survey_room(data["job_id"]))
+    else:
+        print("⚠️ SocketIO not initialized yet (survey).")
@@ -0,0 +1,244 @@
+# app/utils/spatial.py
+"""
+Radius queries ("what is within 5 km of me") without scanning every row.
+
+On PostgreSQL with PostGIS (docker-compose uses the postgis image) the
+tables get functional GiST indexes on
+    geography(ST_MakePoint(lon, lat))
+and queries use ST_DWithin, which is answered from the index. Indexing
+an expression over the existing lat/lon columns avoids a schema
+migration (tables are created with create_all).
+
+Elsewhere (SQLite in dev) a SpatialIndex keeps an in-process grid of
+GEO_GRID_DEG-sized cells. It loads rows incrementally (see
+map_changes.Cursor), so only new rows are read on each query, and checks
+exact haversine distances for the candidates of the covering cells only.
+"""
+
+import math
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import DateTime, text
+
+from app.db.database import engine
+from app.utils.map_changes import Cursor
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+
+GEO_GRID_DEG = float(os.getenv("GEO_GRID_DEG", "0.05"))       # ~5.5 km cells
+NEARBY_RADIUS_KM = float(os.getenv("NEARBY_RADIUS_KM", "5"))
+NEARBY_LIMIT = int(os.getenv("NEARBY_LIMIT", "100"))
+NEARBY_MAX_LIMIT = 1000
+
+_postgis = None
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance; lat2/lon2 may be numpy arrays.
+    """
+    lat1, lon1 = math.radians(lat1), math.radians(lon1)
+    lat2, lon2 = np.radians(lat2), np.radians(lon2)
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _geog(lon_col: str, lat_col: str) -> str:
+    # must match the indexed expression exactly for the planner to use it
+    return f"(ST_SetSRID(ST_MakePoint({lon_col}, {lat_col}), 4326)::geography)"
+
+
+def postgis_available() -> bool:
+    global _postgis
+    if _postgis is None:
+        _postgis = False
+        if engine.dialect.name == "postgresql":
+            try:
+                with engine.connect() as conn:
+                    _postgis = conn.execute(
+                        text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+                    ).first() is not None
+            except Exception as e:
+                print(" PostGIS check failed:", e)
+    return _postgis
+
+
+class SpatialIndex:
+    """
+    Radius search over `table` (primary key `id`, float lat/lon columns,
+    `created_at`).
+    """
+
+    def __init__(self, table: str, lat_col: str = "lat", lon_col: str = "lon", cell_deg: float = GEO_GRID_DEG):
+        self.table = table
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.cell_deg = cell_deg
+
+        self._cells = {}            # (i, j) -> list of row positions
+        self._pos = {}              # id -> row position
+        self._ids = []
+        self._lats = []
+        self._lons = []
+        self._cursor = Cursor()
+        self._lock = threading.Lock()
+
+    # ---------------- PostGIS ----------------
+    def create_db_index(self, conn):
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{self.table}_geog "
+            f"ON {self.table} USING GIST ({_geog(self.lon_col, self.lat_col)})"
+        ))
+
+    def _nearby_postgis(self, db, lat, lon, radius_km, limit):
+        geog = _geog(self.lon_col, self.lat_col)
+        point = "(ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography)"
+        rows = db.execute(text(
+            f"SELECT id, ST_Distance({geog}, {point}) / 1000.0 AS km "
+            f"FROM {self.table} "
+            f"WHERE ST_DWithin({geog}, {point}, :radius_m) "
+            f"ORDER BY km" + (" LIMIT :limit" if limit is not None else "")
+        ), {"lat": lat, "lon": lon, "radius_m": radius_km * 1000.0, "limit": limit})
+        return [(r.id, float(r.km)) for r in rows]
+
+    # ---------------- grid fallback ----------------
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def refresh(self, db):
+        """
+        Pull rows added since the last call. Rows are only ever appended
+        here; deleted rows drop out when callers load them by id.
+        """
+        rows = db.execute(text(
+            f"SELECT id, created_at, {self.lat_col} AS lat, {self.lon_col} AS lon FROM {self.table} "
+            f"WHERE id > :after AND {self.lat_col} IS NOT NULL AND {self.lon_col} IS NOT NULL "
+            f"ORDER BY id"
+        ).columns(created_at=DateTime), {"after": self._cursor.after}).fetchall()
+
+        with self._lock:
+            # also drops rows another request refreshed concurrently
+            rows = self._cursor.take(rows)
+            if not rows:
+                return 0
+
+            ids = [r.id for r in rows]
+            lats = [r.lat for r in rows]
+            lons = [r.lon for r in rows]
+            ci = np.floor(np.asarray(lats) / self.cell_deg).astype(np.int64).tolist()
+            cj = np.floor(np.asarray(lons) / self.cell_deg).astype(np.int64).tolist()
+
+            start = len(self._ids)
+            self._ids.extend(ids)
+            self._lats.extend(lats)
+            self._lons.extend(lons)
+            for pos, cell in enumerate(zip(ci, cj), start):
+                self._cells.setdefault(cell, []).append(pos)
+            self._pos.update(zip(ids, range(start, start + len(ids))))
+        return len(rows)
+
+    def upsert(self, row_id: int, lat: float, lon: float):
+        """
+        Record a row whose position was set or changed in place (e.g. a
+        device re-registering from a new location). Other processes only
+        see it after their next restart; PostGIS needs no bookkeeping.
+        """
+        if lat is None or lon is None or not self._cursor.seen(row_id):
+            # unknown yet: picked up by the next refresh
+            return
+
+        with self._lock:
+            pos = self._pos.get(row_id)
+            if pos is None:
+                pos = self._pos[row_id] = len(self._ids)
+                self._ids.append(row_id)
+                self._lats.append(lat)
+                self._lons.append(lon)
+            else:
+                self._cells[self._cell(self._lats[pos], self._lons[pos])].remove(pos)
+                self._lats[pos] = lat
+                self._lons[pos] = lon
+            self._cells.setdefault(self._cell(lat, lon), []).append(pos)
+
+    def _nearby_grid(self, lat, lon, radius_km, limit):
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+
+        i0, j0 = self._cell(lat - dlat, lon - dlon)
+        i1, j1 = self._cell(lat + dlat, lon + dlon)
+
+        with self._lock:
+            positions = []
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    positions.extend(self._cells.get((i, j), ()))
+            if not positions:
+                return []
+
+            ids = [self._ids[p] for p in positions]
+            lats = np.array([self._lats[p] for p in positions])
+            lons = np.array([self._lons[p] for p in positions])
+
+        km = haversine_km(lat, lon, lats, lons)
+        inside = np.nonzero(km <= radius_km)[0]
+        order = inside[np.argsort(km[inside], kind="stable")][:limit]
+        return [(ids[k], float(km[k])) for k in order]
+
+    # ---------------- public ----------------
+    def nearby(self, db, lat: float, lon: float, radius_km: float = NEARBY_RADIUS_KM, limit: Optional[int] = NEARBY_LIMIT):
+        """
+        [(id, distance_km)] within radius_km, nearest first. limit=None
+        returns every match (internal fan-out, not for API requests).
+        """
+        if limit is not None:
+            limit = max(1, min(int(limit), NEARBY_MAX_LIMIT))
+        if postgis_available():
+            return self._nearby_postgis(db, lat, lon, radius_km, limit)
+
+        self.refresh(db)
+        return self._nearby_grid(lat, lon, radius_km, limit)
+
+    def stats(self):
+        return {
+            "table": self.table,
+            "backend": "postgis" if postgis_available() else "grid",
+            "rows": len(self._ids),
+            "cells": len(self._cells),
+            "cell_deg": self.cell_deg,
+        }
+
+
+report_index = SpatialIndex("reports")
+alert_index = SpatialIndex("alerts")
+device_index = SpatialIndex("fcm_devices")
+
+
+def ensure_spatial_indexes():
+    """
+    Called from init_db: GiST indexes when PostGIS is there, nothing to
+    do for the in-process grid (it fills itself on first query).
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+    except Exception as e:
+        print(" PostGIS extension not available, using in-process grid index:", e)
+        return
+
+    global _postgis
+    _postgis = None
+    if not postgis_available():
+        return
+
+    with engine.begin() as conn:
+        for index in (report_index, alert_index, device_index):
+            index.create_db_index(conn)
+    print(" Spatial (GiST) indexes ready")
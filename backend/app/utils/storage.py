@@ -0,0 +1,258 @@
+# app/utils/storage.py
+"""
+Object storage for uploaded images.
+
+    STORAGE_BACKEND=local     files under LOCAL_STORAGE_DIR, served at /uploads
+    STORAGE_BACKEND=supabase  Supabase Storage bucket (SUPABASE_BUCKET)
+
+Without STORAGE_BACKEND, Supabase is used when its credentials are set
+and the local disk otherwise (offline / dev / tests).
+
+Request handlers don't wait for the network: `put_later` queues the
+bytes for a pool of background workers that retry with backoff, and
+the final public URL is known up front via `public_url`.
+"""
+
+import asyncio
+import os
+import shutil
+import threading
+import uuid
+from typing import Optional
+
+from app.utils.uploads import SpooledUpload
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "detections")
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND") or ("supabase" if SUPABASE_URL and SUPABASE_KEY else "local")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "uploads")
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL", "/uploads")
+
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "4"))
+STORAGE_MAX_PENDING = int(os.getenv("STORAGE_MAX_PENDING", "256"))
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "3"))
+UPLOAD_RETRY_BASE_S = float(os.getenv("UPLOAD_RETRY_BASE_S", "1.0"))
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR, base_url: str = LOCAL_STORAGE_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str = "image/jpeg"):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write + rename so readers never see a half-written file
+        tmp = f"{path}.{uuid.uuid4().hex}.part"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put_file(self, key: str, src, content_type: str = "image/jpeg"):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp = f"{path}.{uuid.uuid4().hex}.part"
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(src, f)
+        os.replace(tmp, path)
+
+    def public_url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+
+class SupabaseStorage:
+    name = "supabase"
+
+    def __init__(self, url: str = SUPABASE_URL, key: str = SUPABASE_KEY, bucket: str = SUPABASE_BUCKET):
+        self.url = url
+        self.key = key
+        self.bucket = bucket
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _bucket(self):
+        # created on first use, so importing the app needs no network/credentials
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(self.url, self.key)
+        return self._client.storage.from_(self.bucket)
+
+    def put(self, key: str, data: bytes, content_type: str = "image/jpeg"):
+        self._bucket().upload(
+            key,
+            data,
+            file_options={
+                "content-type": content_type,
+                "upsert": "true",
+            },
+        )
+
+    def put_file(self, key: str, src, content_type: str = "image/jpeg"):
+        # streamed from the file object by httpx instead of read into memory
+        self._bucket().upload(
+            key,
+            src,
+            file_options={
+                "content-type": content_type,
+                "upsert": "true",
+            },
+        )
+
+    def public_url(self, key: str) -> str:
+        # pure string formatting in supabase-py, no request
+        return self._bucket().get_public_url(key)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = SupabaseStorage() if STORAGE_BACKEND == "supabase" else LocalStorage()
+    return _backend
+
+
+def new_key(filename: Optional[str] = None, prefix: str = "", default_ext: str = "jpg") -> str:
+    ext = (filename or "").rsplit(".", 1)[-1].lower() if filename and "." in filename else default_ext
+    key = f"{uuid.uuid4()}.{ext}"
+    return f"{prefix.strip('/')}/{key}" if prefix else key
+
+
+def public_url(key: str) -> str:
+    return get_backend().public_url(key)
+
+
+def key_for_url(url: str) -> Optional[str]:
+    """
+    Storage key of a public URL produced by this backend, else None.
+    """
+    prefix = public_url("__key__").split("__key__")[0]
+    if not url or not url.startswith(prefix):
+        return None
+    return url[len(prefix):].split("?", 1)[0] or None
+
+
+def save(key: str, data: bytes, content_type: str = "image/jpeg") -> Optional[str]:
+    """
+    Blocking upload; returns the public URL or None on failure.
+    """
+    try:
+        get_backend().put(key, data, content_type)
+        return public_url(key)
+    except Exception as e:
+        print(f"❌ Storage upload error ({key}):", e)
+        return None
+
+
+# -------------------------------------------------
+# Write-behind queue
+# -------------------------------------------------
+_queue = None
+_workers = []
+
+stats = {
+    "queued": 0,
+    "uploaded": 0,
+    "retries": 0,
+    "failed": 0,
+}
+
+
+def _ensure_workers():
+    global _queue, _workers
+
+    if _workers and not any(t.done() for t in _workers):
+        return
+
+    for t in _workers:
+        t.cancel()
+
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=STORAGE_MAX_PENDING)
+    _workers = [asyncio.create_task(_worker()) for _ in range(STORAGE_WORKERS)]
+
+
+async def put_later(key: str, data, content_type: str = "image/jpeg") -> asyncio.Future:
+    """
+    Queue an upload and return a future resolving to the public URL
+    (None once all retries failed). Only waits if STORAGE_MAX_PENDING
+    uploads are already queued. `data` is bytes or a SpooledUpload
+    (uploaded from its spooled file, kept alive until then).
+    """
+    _ensure_workers()
+
+    if isinstance(data, SpooledUpload):
+        data.retain()
+
+    fut = asyncio.get_running_loop().create_future()
+    await _queue.put((key, data, content_type, fut))
+    stats["queued"] += 1
+    return fut
+
+
+def _put_spooled(backend, key: str, data: SpooledUpload, content_type: str):
+    with data.open() as f:
+        backend.put_file(key, f, content_type)
+
+
+async def _upload(key: str, data, content_type: str) -> Optional[str]:
+    backend = get_backend()
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            if isinstance(data, SpooledUpload):
+                await asyncio.to_thread(_put_spooled, backend, key, data, content_type)
+            else:
+                await asyncio.to_thread(backend.put, key, data, content_type)
+            stats["uploaded"] += 1
+            return backend.public_url(key)
+        except Exception as e:
+            print(f"❌ Storage upload error ({key}, attempt {attempt + 1}):", e)
+
+        if attempt < UPLOAD_RETRIES:
+            stats["retries"] += 1
+            await asyncio.sleep(UPLOAD_RETRY_BASE_S * 2 ** attempt)
+
+    stats["failed"] += 1
+    print(f"❌ Giving up on upload of {key} after {UPLOAD_RETRIES + 1} attempts")
+    return None
+
+
+async def _worker():
+    while True:
+        key, data, content_type, fut = await _queue.get()
+        try:
+            url = await _upload(key, data, content_type)
+            if not fut.done():
+                fut.set_result(url)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        finally:
+            if isinstance(data, SpooledUpload):
+                data.release()
+            _queue.task_done()
+
+
+def get_stats():
+    return {
+        **stats,
+        "backend": get_backend().name,
+        "pending": _queue.qsize() if _queue else 0,
+        "max_pending": STORAGE_MAX_PENDING,
+        "workers": STORAGE_WORKERS,
+    }
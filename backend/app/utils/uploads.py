@@ -0,0 +1,129 @@
+# app/utils/uploads.py
+"""
+Uploads are used straight from the SpooledTemporaryFile Starlette
+parsed the multipart body into (kept in memory up to 1 MB, rolled over
+to a temp file on disk beyond that) instead of `await file.read()`
+holding the whole image in memory or copying it to a second file. The
+sha256 is computed by reading that file in place. Inference, storage
+and thumbnailing then read it through independent handles.
+
+A SpooledUpload is reference counted: every background consumer that
+outlives the request (storage queue, variant generation) calls retain()
+and release(); the file is closed (and deleted) when the last one lets
+go.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import threading
+
+from fastapi import HTTPException, UploadFile
+
+MAX_IMAGE_MB = int(os.getenv("MAX_IMAGE_MB", "25"))
+MAX_DRONE_FRAME_MB = int(os.getenv("MAX_DRONE_FRAME_MB", "300"))
+CHUNK_SIZE = 1024 * 1024
+
+
+class _Reader(io.RawIOBase):
+    """
+    Read handle with its own position over the shared spooled file.
+    """
+
+    def __init__(self, upload: "SpooledUpload"):
+        self._upload = upload
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._upload.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def readinto(self, b):
+        n = self._upload._read_at(self._pos, b)
+        self._pos += n
+        return n
+
+
+class SpooledUpload:
+    def __init__(self, file, size: int, sha256: str, filename=None, content_type=None):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type or "image/jpeg"
+        self._lock = threading.Lock()
+        self._refs = 1
+
+    def _read_at(self, pos: int, b) -> int:
+        # one seek + read at a time; handles may be used from worker threads
+        with self._lock:
+            self.file.seek(pos)
+            return self.file.readinto(b)
+
+    def open(self):
+        """
+        New independent read handle (safe to use from worker threads).
+        """
+        return io.BufferedReader(_Reader(self), CHUNK_SIZE)
+
+    def read(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    def retain(self):
+        self._refs += 1
+        return self
+
+    def release(self):
+        self._refs -= 1
+        if self._refs <= 0:
+            self.file.close()
+
+
+def _hash(file) -> str:
+    digest = hashlib.sha256()
+    file.seek(0)
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def spool(upload: UploadFile, max_mb: int = MAX_IMAGE_MB) -> SpooledUpload:
+    """
+    Take over the file of an UploadFile and hash it without copying.
+    Raises 413 past max_mb and 400 for an empty file.
+    """
+    file = upload.file
+    size = upload.size
+    if size is None:
+        size = file.seek(0, io.SEEK_END)
+
+    if size > max_mb * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"File larger than {max_mb} MB")
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+
+    sha256 = await asyncio.to_thread(_hash, file)
+
+    # Starlette closes the UploadFile's file when the request ends; hand
+    # it an empty one so ours lives until the last consumer releases it
+    upload.file = io.BytesIO()
+
+    return SpooledUpload(file, size, sha256, upload.filename, upload.content_type)
@@ -0,0 +1,401 @@
+# app/utils/vector_tiles.py
+"""
+Mapbox Vector Tiles (MVT) for the outbreak map layers.
+
+    detections  grid clusters (see app.utils.clusters) up to
+                CLUSTER_MAX_ZOOM, individual detections beyond
+    alerts      alert points
+    fields      field polygons, clipped to the tile and simplified to
+                about TILE_SIMPLIFY_PX pixels at the tile's zoom
+
+Encoded tiles are cached on disk under
+    TILE_CACHE_DIR/<layer>/<z>/<x>/<y>.mvt
+each file starting with the state it was rendered at: for the layer's
+rows and for the map_changes log, the newest id known to be committed
+(see map_changes.Cursor) and how many newer entries fell inside the
+area the tile is drawn from. A cached tile is served while both counts
+are unchanged, so a new detection (also one committing after higher
+ids) or a logged delete / edit only invalidates the tiles around it.
+The checks are two COUNT queries over a primary key range and see the
+writes of every worker; the cache directory can be shared by workers
+on one host.
+
+Needs the optional `mapbox-vector-tile` package (pip install
+mapbox-vector-tile); without it the endpoint answers 501.
+"""
+
+import hashlib
+import json
+import math
+import os
+import struct
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import shapely
+from shapely.geometry import Point, Polygon, box, shape
+from sqlalchemy import DateTime, bindparam, text
+
+from app.utils import clusters, map_changes
+
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "wheatguard_tiles"))
+TILE_EXTENT = 4096
+TILE_BUFFER_PX = 64
+TILE_SIMPLIFY_PX = float(os.getenv("TILE_SIMPLIFY_PX", "1.0"))
+TILE_MAX_FEATURES = int(os.getenv("TILE_MAX_FEATURES", "10000"))
+TILE_CLUSTER_OFFSET = 2        # cluster level z+2: 16x16 cells per tile
+FIELD_MARGIN_DEG = 0.05        # fields are indexed by their centre point
+
+MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+EARTH_RADIUS_M = 6378137.0
+ORIGIN_M = math.pi * EARTH_RADIUS_M
+
+LAYERS = {
+    "detections": "detections",
+    "alerts": "alerts",
+    "fields": "fields",
+}
+
+# rows of a layer with id > :after, inside the area a tile is drawn from
+_ROWS_AFTER = {
+    "detections": (
+        "SELECT COUNT(*) FROM detections d JOIN reports r ON r.id = d.report_id "
+        "WHERE d.id > :after AND r.lat BETWEEN :south AND :north AND r.lon BETWEEN :west AND :east"
+    ),
+    "alerts": (
+        "SELECT COUNT(*) FROM alerts "
+        "WHERE id > :after AND lat BETWEEN :south AND :north AND lon BETWEEN :west AND :east"
+    ),
+    "fields": (
+        "SELECT COUNT(*) FROM fields "
+        "WHERE id > :after AND geo_lat BETWEEN :south AND :north AND geo_lon BETWEEN :west AND :east"
+    ),
+}
+
+# settled row id, map_changes settled id, rows / log entries after them
+_HEADER = struct.Struct("<QQQQ")
+
+
+class VectorTilesUnavailable(RuntimeError):
+    pass
+
+
+# -------------------------------------------------
+# Tile math (web mercator, XYZ scheme)
+# -------------------------------------------------
+def tile_lonlat_bounds(z: int, x: int, y: int):
+    """
+    (west, south, east, north) in degrees.
+    """
+    n = 2 ** z
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def tile_mercator_bounds(z: int, x: int, y: int):
+    size = 2 * ORIGIN_M / 2 ** z
+    minx = -ORIGIN_M + x * size
+    maxy = ORIGIN_M - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _to_mercator(coords):
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -85.0511, 85.0511)
+    return np.column_stack([
+        np.radians(lon) * EARTH_RADIUS_M,
+        np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * EARTH_RADIUS_M,
+    ])
+
+
+def project(geom):
+    return shapely.transform(geom, _to_mercator)
+
+
+# -------------------------------------------------
+# Cache invalidation
+# -------------------------------------------------
+def field_bounds(field):
+    """
+    (west, south, east, north) a field covers in tiles: its outline and
+    the centre point it is looked up by.
+    """
+    try:
+        west, south, east, north = field_geometry(field.polygon).bounds
+    except Exception:
+        west, south, east, north = field.geo_lon, field.geo_lat, field.geo_lon, field.geo_lat
+    return (
+        min(west, field.geo_lon), min(south, field.geo_lat),
+        max(east, field.geo_lon), max(north, field.geo_lat),
+    )
+
+
+def field_changed(db, field):
+    """
+    Log a field about to be edited or deleted (and once more after an
+    edit) so the tiles covering it are rendered again.
+    """
+    map_changes.area_changed(db, "fields", field.id, field_bounds(field))
+
+
+def _source_bounds(layer: str, z: int, bounds):
+    """
+    Area whose rows can appear in a tile with these (padded) bounds.
+    """
+    pad = 0.0
+    if layer == "detections" and z <= clusters.CLUSTER_MAX_ZOOM:
+        # a cluster's centroid is drawn here if any part of its cell is
+        pad = clusters.cell_deg(min(z + TILE_CLUSTER_OFFSET, clusters.CLUSTER_MAX_ZOOM))
+    elif layer == "fields":
+        pad = FIELD_MARGIN_DEG
+    west, south, east, north = bounds
+    return west - pad, south - pad, east + pad, north + pad
+
+
+def _settled_row_id(db, layer: str) -> int:
+    # newest row created before map_changes.settled_before()
+    return db.execute(text(
+        f"SELECT id FROM {LAYERS[layer]} WHERE created_at < :cutoff ORDER BY id DESC LIMIT 1"
+    ).bindparams(bindparam("cutoff", type_=DateTime)), {
+        "cutoff": map_changes.settled_before(),
+    }).scalar() or 0
+
+
+def _counts(db, layer: str, source, row_id: int, change_id: int):
+    west, south, east, north = source
+    rows = db.execute(text(_ROWS_AFTER[layer]), {
+        "after": row_id, "south": south, "north": north, "west": west, "east": east,
+    }).scalar()
+    return rows, map_changes.touching(db, layer, change_id, source)
+
+
+def _state(db, layer: str, source):
+    row_id = _settled_row_id(db, layer)
+    change_id = map_changes.settled_id(db, layer)
+    return (row_id, change_id) + _counts(db, layer, source, row_id, change_id)
+
+
+def _is_fresh(db, layer: str, source, state) -> bool:
+    row_id, change_id, rows, changes = state
+    return _counts(db, layer, source, row_id, change_id) == (rows, changes)
+
+
+def _fingerprint(layer, z, x, y, state) -> str:
+    raw = f"{layer}/{z}/{x}/{y}:" + ":".join(map(str, state))
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def _cache_path(layer, z, x, y):
+    return os.path.join(TILE_CACHE_DIR, layer, str(z), str(x), f"{y}.mvt")
+
+
+def _read_cached(path):
+    """
+    (state, data) or None. Files older than the change log retention
+    can't be checked against it any more.
+    """
+    try:
+        with open(path, "rb") as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > map_changes.RETENTION_S:
+                return None
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    if len(raw) < _HEADER.size:
+        return None
+    return _HEADER.unpack_from(raw), raw[_HEADER.size:]
+
+
+# -------------------------------------------------
+# Layers
+# -------------------------------------------------
+def _detection_features(db, z, bounds):
+    west, south, east, north = bounds
+
+    if z <= clusters.CLUSTER_MAX_ZOOM:
+        level = min(z + TILE_CLUSTER_OFFSET, clusters.CLUSTER_MAX_ZOOM)
+        cells = clusters.detection_clusters.clusters(db, west, south, east, north, level)
+        features = []
+        for c in cells:
+            props = {
+                "cluster": True,
+                "count": c["count"],
+                "top_disease": c["top_disease"],
+                "diseases": json.dumps(c["diseases"]),
+            }
+            for name, n in c["severity"].items():
+                props[f"severity_{name.lower()}"] = n
+            features.append((Point(c["lon"], c["lat"]), props, None))
+        return features
+
+    return [
+        (
+            Point(p["lon"], p["lat"]),
+            {
+                "cluster": False,
+                "count": 1,
+                "disease": p["top_disease"],
+                "severity": next(iter(p["severity"])),
+            },
+            p["detection_id"],
+        )
+        for p in clusters.points(db, west, south, east, north, TILE_MAX_FEATURES)
+    ]
+
+
+def _alert_features(db, z, bounds):
+    west, south, east, north = bounds
+    rows = db.execute(text(
+        "SELECT id, disease, severity, cases, source, lat, lon, created_at FROM alerts "
+        "WHERE lat BETWEEN :south AND :north AND lon BETWEEN :west AND :east "
+        "ORDER BY id DESC LIMIT :limit"
+    ), {"south": south, "north": north, "west": west, "east": east, "limit": TILE_MAX_FEATURES}).fetchall()
+
+    return [
+        (
+            Point(r.lon, r.lat),
+            {
+                "disease": r.disease,
+                "severity": r.severity,
+                "cases": r.cases,
+                "source": r.source,
+                "timestamp": str(r.created_at),
+            },
+            r.id,
+        )
+        for r in rows
+    ]
+
+
+def field_geometry(polygon):
+    """
+    Field outline as a lon/lat shapely geometry. The dashboard stores a
+    list of [lat, lon] pairs; GeoJSON geometries / features also work.
+    """
+    if isinstance(polygon, str):
+        polygon = json.loads(polygon)
+    if isinstance(polygon, dict):
+        return shape(polygon.get("geometry", polygon))
+    return Polygon([(float(p[1]), float(p[0])) for p in polygon])
+
+
+def _field_features(db, z, bounds):
+    west, south, east, north = bounds
+    rows = db.execute(text(
+        "SELECT id, farmer_id, village, crop, polygon FROM fields "
+        "WHERE geo_lat BETWEEN :south AND :north AND geo_lon BETWEEN :west AND :east "
+        "LIMIT :limit"
+    ), {
+        "south": south - FIELD_MARGIN_DEG,
+        "north": north + FIELD_MARGIN_DEG,
+        "west": west - FIELD_MARGIN_DEG,
+        "east": east + FIELD_MARGIN_DEG,
+        "limit": TILE_MAX_FEATURES,
+    }).fetchall()
+
+    features = []
+    for r in rows:
+        try:
+            geom = field_geometry(r.polygon)
+        except Exception as e:
+            print(f" skipped field {r.id} in tile: {e}")
+            continue
+        features.append((
+            geom,
+            {"farmer_id": r.farmer_id, "village": r.village, "crop": r.crop},
+            r.id,
+        ))
+    return features
+
+
+_LAYER_FEATURES = {
+    "detections": _detection_features,
+    "alerts": _alert_features,
+    "fields": _field_features,
+}
+
+
+# -------------------------------------------------
+# Encoding
+# -------------------------------------------------
+def encode_tile(layer: str, features, z: int, x: int, y: int) -> bytes:
+    bounds = tile_mercator_bounds(z, x, y)
+    pixel = (bounds[2] - bounds[0]) / TILE_EXTENT
+    clip = box(*bounds).buffer(TILE_BUFFER_PX * pixel, join_style="mitre")
+
+    out = []
+    for geom, props, fid in features:
+        geom = project(geom)
+
+        if geom.geom_type != "Point":
+            geom = geom.intersection(clip)
+            if geom.is_empty:
+                continue
+            simplified = geom.simplify(TILE_SIMPLIFY_PX * pixel, preserve_topology=True)
+            # fields smaller than a pixel at this zoom are kept as a point
+            geom = simplified if simplified.area > pixel * pixel else geom.representative_point()
+        elif not clip.contains(geom):
+            continue
+
+        feature = {"geometry": geom, "properties": props}
+        if fid is not None:
+            feature["id"] = fid
+        out.append(feature)
+
+    if not out:
+        return b""
+
+    return mapbox_vector_tile.encode(
+        [{"name": layer, "features": out}],
+        default_options={"quantize_bounds": bounds, "extents": TILE_EXTENT},
+    )
+
+
+def get_tile(db, layer: str, z: int, x: int, y: int):
+    """
+    (mvt bytes, fingerprint) from the disk cache or freshly rendered.
+    Empty tiles are cached as empty files.
+    """
+    if mapbox_vector_tile is None:
+        raise VectorTilesUnavailable("Vector tiles need the mapbox-vector-tile package")
+
+    # query a little past the edges so symbols at the seams aren't cut
+    west, south, east, north = tile_lonlat_bounds(z, x, y)
+    pad = TILE_BUFFER_PX / TILE_EXTENT
+    bounds = (
+        west - (east - west) * pad,
+        south - (north - south) * pad,
+        east + (east - west) * pad,
+        north + (north - south) * pad,
+    )
+    source = _source_bounds(layer, z, bounds)
+
+    path = _cache_path(layer, z, x, y)
+    cached = _read_cached(path)
+    if cached is not None:
+        state, data = cached
+        if _is_fresh(db, layer, source, state):
+            return data, _fingerprint(layer, z, x, y, state)
+
+    # read before rendering: rows added meanwhile make the next hit re-render
+    state = _state(db, layer, source)
+    data = encode_tile(layer, _LAYER_FEATURES[layer](db, z, bounds), z, x, y)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.part"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(*state))
+        f.write(data)
+    os.replace(tmp, path)
+    return data, _fingerprint(layer, z, x, y, state)
@@ -0,0 +1,120 @@
+# app/utils/worker_events.py
+"""
+Notifications between API workers for in-process state that has to
+change in every worker at once (model registry, AI text cache).
+
+The worker making a change applies it itself, stores whatever has to
+survive in the database and calls `publish(topic, payload)`. With
+REDIS_URL set the message goes out on WORKER_EVENTS_CHANNEL and every
+*other* worker runs the handlers registered with `on(topic, handler)`.
+Without Redis there is only one worker, so publish does nothing.
+
+Messages sent while a worker's subscription was down are lost: after
+reconnecting, every handler is called once with payload None and must
+resync from the database (or drop what it caches).
+"""
+
+import asyncio
+import json
+import os
+import uuid
+
+REDIS_URL = os.getenv("REDIS_URL")
+WORKER_EVENTS_CHANNEL = os.getenv("WORKER_EVENTS_CHANNEL", "wheatguard:worker_events")
+
+_origin = uuid.uuid4().hex
+_handlers = {}          # topic -> [handler(payload)], sync or async
+_publisher = None
+_listener = None
+_subscribed = None
+
+
+def on(topic: str, handler):
+    _handlers.setdefault(topic, []).append(handler)
+
+
+def publish(topic: str, payload=None):
+    """
+    Tell the other workers. Blocking (one Redis PUBLISH): call it from a
+    worker thread or a sync endpoint.
+    """
+    global _publisher
+
+    if not REDIS_URL:
+        return
+    import redis
+
+    if _publisher is None:
+        _publisher = redis.Redis.from_url(REDIS_URL)
+    message = json.dumps({"origin": _origin, "topic": topic, "payload": payload})
+    try:
+        _publisher.publish(WORKER_EVENTS_CHANNEL, message)
+    except Exception as e:
+        print(f" worker event '{topic}' not published:", e)
+
+
+async def _dispatch(topic: str, payload):
+    for handler in _handlers.get(topic, []):
+        try:
+            result = handler(payload)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            print(f" worker event '{topic}' handler error:", e)
+
+
+async def _listen():
+    import redis.asyncio as aioredis
+
+    client = aioredis.Redis.from_url(REDIS_URL)
+    connected_before = False
+    while True:
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(WORKER_EVENTS_CHANNEL)
+                _subscribed.set()
+                if connected_before:
+                    for topic in list(_handlers):
+                        await _dispatch(topic, None)
+                connected_before = True
+
+                async for msg in pubsub.listen():
+                    if msg["type"] != "message":
+                        continue
+                    data = json.loads(msg["data"])
+                    if data["origin"] != _origin:
+                        await _dispatch(data["topic"], data["payload"])
+        except asyncio.CancelledError:
+            await client.aclose()
+            raise
+        except Exception as e:
+            print(" worker events subscription lost:", e)
+            await asyncio.sleep(1.0)
+
+
+async def start():
+    """
+    Subscribe (every worker, at startup). Waits for the subscription so
+    state read from the database afterwards can't miss a change.
+    """
+    global _listener, _subscribed
+
+    if REDIS_URL and _listener is None:
+        _subscribed = asyncio.Event()
+        _listener = asyncio.create_task(_listen())
+        try:
+            await asyncio.wait_for(_subscribed.wait(), 5.0)
+        except asyncio.TimeoutError:
+            print(" worker events: Redis not reachable yet, still trying")
+
+
+async def stop():
+    global _listener
+
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
@@ -0,0 +1,243 @@
+"""
+Load test: alert push fan-out against a local mock FCM server.
+
+Run from backend/:
+    python -m benchmarks.bench_fcm_fanout [--devices 100000] [--latency-ms 30]
+
+Seeds a temporary SQLite database with --devices registered devices
+around one village (a share of them with expired tokens), starts a mock
+of the legacy FCM HTTP endpoint on localhost and pushes one alert through
+app.utils.fcm_dispatch and the notification outbox. Reports recipient
+selection time, time to queue, time until the outbox is drained,
+requests made and the worst event-loop stall seen meanwhile. The rate
+limit is --rate messages/s (default high enough to measure throughput).
+--legacy N times N sends through the old one-request-per-token path for
+comparison.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+_DB = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+_PORT = None
+_RATE = 1_000_000
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _configure():
+    # must run before any app module reads its settings
+    global _PORT
+    _PORT = _free_port()
+    os.environ["DATABASE_URL"] = f"sqlite:///{_DB}"
+    os.environ["FCM_URL"] = f"http://127.0.0.1:{_PORT}/fcm/send"
+    os.environ["FCM_SERVER_KEY"] = "bench"
+    os.environ["FCM_RATE_PER_S"] = str(_RATE)
+    os.environ["FCM_BURST"] = str(int(_RATE))
+
+
+class MockFCM:
+    """
+    Minimal HTTP/1.1 keep-alive server speaking the legacy FCM API.
+    Tokens starting with "expired-" answer NotRegistered.
+    """
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.requests = 0
+        self.tokens = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                body = json.loads(await reader.readexactly(length)) if length else {}
+
+                self._in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self._in_flight)
+                await asyncio.sleep(self.latency_s)
+                self._in_flight -= 1
+
+                tokens = body.get("registration_ids") or [body.get("to")]
+                self.requests += 1
+                self.tokens += len(tokens)
+                results = [
+                    {"error": "NotRegistered"} if t.startswith("expired-") else {"message_id": "0:1"}
+                    for t in tokens
+                ]
+                failure = sum(1 for r in results if "error" in r)
+                out = json.dumps({
+                    "multicast_id": 1,
+                    "success": len(tokens) - failure,
+                    "failure": failure,
+                    "results": results,
+                }).encode()
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(out)}\r\n\r\n".encode() + out
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+def _serve_in_thread(mock: MockFCM):
+    # own loop/thread, so the server's work doesn't count as a stall
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(asyncio.start_server(mock.handle, "127.0.0.1", _PORT, backlog=1024))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+
+
+def seed(devices: int, lat: float, lon: float, spread_km: float, expired: float):
+    from app.db.database import engine, init_db
+    from sqlalchemy import text
+
+    init_db()
+    rng = np.random.default_rng(0)
+    lats = lat + rng.normal(0, spread_km / 111.32, devices)
+    lons = lon + rng.normal(0, spread_km / (111.32 * np.cos(np.radians(lat))), devices)
+    bad = rng.random(devices) < expired
+
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO fcm_devices (device_id, token, lat, lon) VALUES (:d, :t, :lat, :lon)"),
+            [
+                {
+                    "d": f"device-{i}",
+                    "t": f"{'expired' if bad[i] else 'token'}-{i}",
+                    "lat": float(lats[i]),
+                    "lon": float(lons[i]),
+                }
+                for i in range(devices)
+            ],
+        )
+
+
+async def watch_loop(stop: asyncio.Event, lag: list):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lag.append(time.perf_counter() - t - 0.005)
+
+
+async def run(args):
+    from app.utils import fcm_dispatch, fcm_sender, notification_outbox, spatial
+
+    alert = {"id": 1, "disease": "Yellow Rust", "severity": "High", "lat": args.lat, "lon": args.lon}
+
+    # first query builds the in-process index; time it separately
+    t = time.perf_counter()
+    await asyncio.to_thread(fcm_dispatch.find_recipients, args.lat, args.lon, args.radius)
+    index_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    recipients = await asyncio.to_thread(fcm_dispatch.find_recipients, args.lat, args.lon, args.radius)
+    select_s = time.perf_counter() - t
+
+    notification_outbox.start()
+    stop, lag = asyncio.Event(), []
+    watcher = asyncio.create_task(watch_loop(stop, lag))
+
+    t = time.perf_counter()
+    task = fcm_dispatch.schedule_alert_push(alert)
+    schedule_ms = (time.perf_counter() - t) * 1000
+    await task
+    queued_s = time.perf_counter() - t
+
+    while True:
+        queue = (await asyncio.to_thread(notification_outbox.get_stats))["queue"]
+        if not queue["pending"] and not queue["sending"]:
+            break
+        await asyncio.sleep(0.25)
+    drained_s = time.perf_counter() - t
+
+    stop.set()
+    await watcher
+    await notification_outbox.stop()
+
+    st = notification_outbox.get_stats()
+    print(f"\nindex            : {spatial.device_index.stats()['backend']}, first query {index_s:.2f}s")
+    print(f"recipients       : {len(recipients):,} of {args.devices:,} devices within {args.radius} km")
+    print(f"selection        : {select_s * 1000:.0f} ms")
+    print(f"schedule returns : {schedule_ms:.2f} ms")
+    print(f"queued           : {queued_s:.2f} s")
+    print(f"outbox drained   : {drained_s:.2f} s ({st['requests']} requests, batch {fcm_sender.FCM_BATCH_SIZE}, "
+          f"concurrency {fcm_sender.FCM_CONCURRENCY}, rate {st['rate_per_s']:,.0f}/s)")
+    print(f"sent / invalid   : {st['sent']:,} / {st['invalid_tokens_removed']:,} tokens removed")
+    print(f"request latency  : p50 {st['send_ms']['p50']} ms, p95 {st['send_ms']['p95']} ms")
+    print(f"delivery latency : p50 {st['delivery_ms']['p50']} ms, p95 {st['delivery_ms']['p95']} ms")
+    print(f"max loop stall   : {max(lag) * 1000:.1f} ms")
+    return recipients
+
+
+def legacy(n: int, recipients):
+    from app.utils.fcm_sender import send_fcm
+
+    t = time.perf_counter()
+    for _, token, km in recipients[:n]:
+        send_fcm(token, "Disease Alert", f"High severity near your area ({km:.1f} km)", {"disease": "x"})
+    per = (time.perf_counter() - t) / max(1, min(n, len(recipients)))
+    print(f"legacy           : {per * 1000:.1f} ms per token, ~{per * len(recipients):.0f} s for all recipients")
+
+
+def main():
+    global _RATE
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=100_000)
+    ap.add_argument("--radius", type=float, default=5.0)
+    ap.add_argument("--spread-km", type=float, default=4.0)
+    ap.add_argument("--expired", type=float, default=0.05)
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--rate", type=float, default=_RATE)
+    ap.add_argument("--legacy", type=int, default=0)
+    ap.add_argument("--lat", type=float, default=31.52)
+    ap.add_argument("--lon", type=float, default=74.35)
+    args = ap.parse_args()
+
+    _RATE = args.rate
+    _configure()
+    mock = MockFCM(args.latency_ms / 1000)
+    _serve_in_thread(mock)
+
+    try:
+        print(f"seeding {args.devices:,} devices...")
+        seed(args.devices, args.lat, args.lon, args.spread_km, args.expired)
+
+        recipients = asyncio.run(run(args))
+        print(f"mock server      : {mock.requests} requests, {mock.tokens:,} tokens, "
+              f"max {mock.max_in_flight} in flight")
+        if args.legacy:
+            legacy(args.legacy, recipients)
+    finally:
+        os.unlink(_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark: legacy preprocess_image vs. app.ml.preprocess.
+
+Run from backend/:
+    python -m benchmarks.bench_preprocess [--images 20] [--batch 8]
+
+Uses synthetic 12MP (4000x3000) JPEGs similar to phone photos.
+"""
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.ml.preprocess import IMAGE_SIZE, preprocess_into, batch_buffer
+
+
+def legacy_preprocess_image(image_bytes: bytes):
+    # verbatim copy of the original app.ml.model_utils.preprocess_image
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img = img.resize((IMAGE_SIZE, IMAGE_SIZE))
+
+    arr = np.array(img).astype("float32") / 255.0
+
+    mean = np.array([0.485, 0.456, 0.406], dtype="float32")
+    std = np.array([0.229, 0.224, 0.225], dtype="float32")
+
+    arr = (arr - mean) / std
+    arr = arr.transpose(2, 0, 1)
+    arr = np.expand_dims(arr, 0)
+    return arr
+
+
+def make_photo(seed: int, width=4000, height=3000) -> bytes:
+    rng = np.random.default_rng(seed)
+    # smooth field-like gradients plus sensor noise, so JPEG size is realistic
+    y = np.linspace(0, 1, height, dtype="float32")[:, None]
+    x = np.linspace(0, 1, width, dtype="float32")[None, :]
+    base = np.stack([
+        80 + 60 * np.sin(6 * x + seed) * y,
+        120 + 70 * np.cos(4 * y + seed) * x,
+        50 + 40 * x * y,
+    ], axis=-1)
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype("float32")
+    img = np.clip(base + noise, 0, 255).astype("uint8")
+
+    buf = BytesIO()
+    Image.fromarray(img).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def bench(fn, photos, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(photos)
+        best = min(best, time.perf_counter() - t)
+    return best * 1000 / len(photos)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=8)
+    ap.add_argument("--batch", type=int, default=8)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"generating {args.images} synthetic 12MP JPEGs...")
+    photos = [make_photo(i) for i in range(args.images)]
+    print(f"avg jpeg size: {sum(map(len, photos)) / len(photos) / 1e6:.1f} MB")
+
+    def legacy(ps):
+        # old path: one 1x3xHxW array per image, concatenated for a batch
+        for i in range(0, len(ps), args.batch):
+            np.concatenate([legacy_preprocess_image(p) for p in ps[i:i + args.batch]])
+
+    def fused(ps):
+        for i in range(0, len(ps), args.batch):
+            chunk = ps[i:i + args.batch]
+            buf = batch_buffer(len(chunk), capacity=args.batch)
+            for j, p in enumerate(chunk):
+                preprocess_into(p, buf[j])
+
+    t_legacy = bench(legacy, photos, args.repeat)
+    t_fused = bench(fused, photos, args.repeat)
+
+    ref = legacy_preprocess_image(photos[0])[0]
+    out = np.empty_like(ref)
+    preprocess_into(photos[0], out)
+    diff = np.abs(ref - out)
+
+    print(f"legacy preprocess_image : {t_legacy:8.1f} ms/image")
+    print(f"draft + fused + buffer  : {t_fused:8.1f} ms/image")
+    print(f"speedup                 : {t_legacy / t_fused:8.1f}x")
+    print(f"output diff vs legacy   : mean {diff.mean():.4f}, max {diff.max():.4f} (normalized units)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Load test: real-time detection feed with thousands of connected sockets.
+
+Run from backend/:
+    python -m benchmarks.bench_socket_feed [--sockets 5000] [--rate 200] [--seconds 10]
+
+Starts a Socket.IO server in a subprocess (app.utils.socket_manager with
+the in-process FeedManager, no database), connects --sockets raw
+Engine.IO websocket clients (1% admins, the rest farmers subscribed to
+25 km around random points of the region) and has the server produce
+--rate detections/s for --seconds, once per mode:
+
+  broadcast   one new_detection emit per event to every socket (old code)
+  rooms       one new_detection emit per event to the event's geo rooms
+  batched     new_detections batches through the FeedBatcher
+  msgpack     batched, clients asking for msgpack payloads
+
+Reports server CPU (process time / wall time), Socket.IO messages and
+detections delivered per second, and backpressure drops/summaries.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import random
+import subprocess
+import sys
+import time
+
+REGION = (70.0, 29.0, 75.5, 33.0)        # w, s, e, n (Punjab)
+MODES = ("broadcast", "rooms", "batched", "msgpack")
+
+
+# -------------------------------------------------
+# Server (subprocess)
+# -------------------------------------------------
+def serve(port: int):
+    import socketio
+    import uvicorn
+
+    from app.utils import socket_feed, socket_manager
+
+    sio = socketio.AsyncServer(async_mode="asgi", client_manager=socket_manager.create_client_manager())
+    socket_manager.sio = sio
+
+    @sio.event
+    async def connect(sid, environ, auth=None):
+        auth = auth or {}
+        if auth.get("admin"):
+            await sio.enter_room(sid, socket_manager.ADMIN_ROOM)
+        await socket_manager.subscribe_area(sid, auth)
+        sio.manager.use_msgpack(sid, bool(auth.get("msgpack")))
+
+    started = {}
+
+    @sio.event
+    async def run(sid, data):
+        rng = random.Random(data["mode"])
+        interval = 1.0 / data["rate"]
+        for k in socket_feed.stats:
+            socket_feed.stats[k] = 0
+
+        # paced against the clock and cut at `seconds`: an overloaded mode
+        # shows up as fewer events/s, not as a longer run
+        wall = time.perf_counter()
+        started["cpu"], started["wall"] = time.process_time(), wall
+        end = wall + data["seconds"]
+        i = 0
+        while time.perf_counter() < end:
+            lat = rng.uniform(REGION[1], REGION[3])
+            lon = rng.uniform(REGION[0], REGION[2])
+            det = {
+                "id": i, "lat": lat, "lon": lon, "disease": rng.choice(("Yellow Rust", "Brown Rust", "Smut")),
+                "confidence": 0.9, "severity": rng.choice(("Low", "Medium", "High")),
+                "timestamp": "2026-01-01T00:00:00",
+            }
+            if data["mode"] == "broadcast":
+                # everyone but the driver, whose acks must not queue behind
+                await sio.emit("new_detection", det, skip_sid=sid)
+            elif data["mode"] == "rooms":
+                await sio.emit("new_detection", det, room=socket_manager.event_rooms(lat, lon))
+            else:
+                await socket_manager.broadcast_new_detection(det)
+            i += 1
+
+            delay = wall + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await socket_manager.detection_feed.flush()
+        return {"events": i, "emit_s": time.perf_counter() - wall}
+
+    @sio.event
+    async def finish(sid, data=None):
+        # CPU includes writing out the backlog after the last emit
+        return {
+            "wall_s": time.perf_counter() - started["wall"],
+            "cpu_s": time.process_time() - started["cpu"],
+            "feed": socket_feed.get_stats(),
+        }
+
+    uvicorn.run(socketio.ASGIApp(sio), host="127.0.0.1", port=port, log_level="warning", ws_ping_interval=None)
+
+
+# -------------------------------------------------
+# Clients
+# -------------------------------------------------
+class Counts:
+    def __init__(self):
+        self.messages = 0
+        self.items = 0
+        self.summaries = 0
+
+
+async def _client(port, auth, counts, ready):
+    import msgpack
+    import websockets
+
+    url = f"ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket"
+    async with websockets.connect(url, max_queue=None, ping_interval=None) as ws:
+        await ws.recv()                                  # engine.io open
+        await ws.send("40" + json.dumps(auth))
+        await ws.recv()                                  # namespace connect
+        ready()
+
+        # runs until cancelled; blocking in recv keeps idle sockets free
+        async for msg in ws:
+            if isinstance(msg, bytes):
+                data = msgpack.unpackb(msg)
+                if data.get("summary"):
+                    counts.summaries += 1
+                else:
+                    counts.items += len(data["items"])
+            elif msg == "2":
+                await ws.send("3")
+            elif msg.startswith("42"):
+                counts.messages += 1
+                event, data = json.loads(msg[2:])
+                if event == "new_detection":
+                    counts.items += 1
+                elif data.get("summary"):
+                    counts.summaries += 1
+                else:
+                    counts.items += len(data["items"])
+            elif msg.startswith("451-"):
+                # payload follows as a binary frame
+                counts.messages += 1
+
+
+async def _driver(port, payload, drain_s):
+    import websockets
+
+    url = f"ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket"
+    async with websockets.connect(url, max_queue=None, ping_interval=None) as ws:
+        await ws.recv()
+        await ws.send("40")
+        await ws.recv()
+
+        async def call(ack_id, event, data=None):
+            await ws.send(f"42{ack_id}" + json.dumps([event, data]))
+            while True:
+                msg = await ws.recv()
+                if isinstance(msg, str) and msg.startswith(f"43{ack_id}"):
+                    return json.loads(msg[2 + len(str(ack_id)):])[0]
+
+        result = await call(1, "run", payload)
+        await asyncio.sleep(drain_s)
+        return {**result, **await call(2, "finish")}
+
+
+async def run_mode(port, mode, args):
+    rng = random.Random(1)
+    counts = Counts()
+    connected = 0
+
+    def ready():
+        nonlocal connected
+        connected += 1
+
+    tasks = []
+    for i in range(args.sockets):
+        auth = {"admin": True} if i % 100 == 0 else {
+            "lat": rng.uniform(REGION[1], REGION[3]),
+            "lon": rng.uniform(REGION[0], REGION[2]),
+            "radius_km": 25,
+        }
+        auth["msgpack"] = mode == "msgpack"
+        tasks.append(asyncio.create_task(_client(port, auth, counts, ready)))
+        if i % 200 == 199:
+            await asyncio.sleep(0.05)     # don't overflow the listen backlog
+
+    t = time.perf_counter()
+    while connected < args.sockets and time.perf_counter() - t < 120:
+        failed = [k for k in tasks if k.done() and k.exception()]
+        if failed:
+            raise failed[0].exception()
+        await asyncio.sleep(0.2)
+    print(f"  {mode}: {connected:,} sockets connected in {time.perf_counter() - t:.1f}s", flush=True)
+
+    result = await _driver(port, {"mode": mode, "rate": args.rate, "seconds": args.seconds}, args.drain)
+
+    for k in tasks:
+        k.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return connected, counts, result
+
+
+def _run_mode(port, mode, args, out):
+    connected, counts, result = asyncio.run(run_mode(port, mode, args))
+    out.put((connected, counts.__dict__, result))
+
+
+def _free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sockets", type=int, default=5000)
+    ap.add_argument("--rate", type=float, default=200.0, help="detections per second")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--drain", type=float, default=5.0, help="seconds to keep reading after the last emit")
+    ap.add_argument("--modes", default=",".join(MODES))
+    ap.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    print(f"{args.sockets:,} sockets, {args.rate:.0f} detections/s for {args.seconds:.0f}s\n")
+    print(f"{'mode':<10} {'events/s':>9} {'server CPU':>11} {'msgs/s':>10} {'items/s':>10} {'summarized':>11} {'dropped':>8}")
+
+    for mode in args.modes.split(","):
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_socket_feed", "--serve", str(port)],
+            env={**os.environ, "SOCKETIO_MANAGER": "local"},
+        )
+        try:
+            time.sleep(3)
+            out = mp.Queue()
+            client = mp.Process(target=_run_mode, args=(port, mode, args, out))
+            client.start()
+            connected, counts, result = out.get()
+            client.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+        wall = result["wall_s"]
+        feed = result["feed"]
+        print(f"{mode:<10} {result['events'] / result['emit_s']:>9,.0f} {result['cpu_s'] / wall * 100:>10.0f}% "
+              f"{counts['messages'] / wall:>10,.0f} {counts['items'] / wall:>10,.0f} "
+              f"{feed['summarized']:>11,} {feed['dropped']:>8,}"
+              + ("" if connected == args.sockets else f"  (only {connected} connected)"))
+
+
+if __name__ == "__main__":
+    main()
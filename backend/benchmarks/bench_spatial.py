@@ -0,0 +1,149 @@
+"""
+Benchmark: "within 5 km" queries, legacy full scan vs. app.utils.spatial.
+
+Run from backend/:
+    python -m benchmarks.bench_spatial [--rows 1000000] [--queries 200]
+    python -m benchmarks.bench_spatial --db postgresql+psycopg2://...   # also PostGIS
+
+Seeds a `bench_reports` table with points scattered over the Punjab
+wheat belt (temporary SQLite file unless --db is given) and compares:
+  legacy  load every row, Python haversine per row (old /map/nearby)
+  grid    in-process grid index (SQLite fallback)
+  postgis ST_DWithin on a GiST expression index (Postgres + PostGIS only)
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from app.utils.spatial import SpatialIndex
+
+TABLE = "bench_reports"
+LAT_RANGE = (29.0, 32.5)
+LON_RANGE = (70.5, 74.5)
+
+
+def legacy_haversine(lat1, lon1, lat2, lon2):
+    # verbatim copy of the original app.api.map_data.haversine
+    R = 6371
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(d_lon / 2) ** 2)
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def seed(engine, rows: int):
+    rng = np.random.default_rng(0)
+    # clustered like real reports: villages plus some uniform noise
+    centres = np.column_stack([rng.uniform(*LAT_RANGE, 400), rng.uniform(*LON_RANGE, 400)])
+    pick = rng.integers(0, len(centres), rows)
+    lats = centres[pick, 0] + rng.normal(0, 0.05, rows)
+    lons = centres[pick, 1] + rng.normal(0, 0.05, rows)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, lat FLOAT, lon FLOAT)"))
+        step = 50000
+        for i in range(0, rows, step):
+            conn.execute(
+                text(f"INSERT INTO {TABLE} (id, lat, lon) VALUES (:id, :lat, :lon)"),
+                [
+                    {"id": j + 1, "lat": float(lats[j]), "lon": float(lons[j])}
+                    for j in range(i, min(i + step, rows))
+                ],
+            )
+    return centres
+
+
+def timed(fn, points):
+    times, found = [], 0
+    for lat, lon in points:
+        t = time.perf_counter()
+        found += len(fn(lat, lon))
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return times[len(times) // 2] * 1000, times[int(len(times) * 0.95)] * 1000, found / len(points)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--legacy-queries", type=int, default=3)
+    ap.add_argument("--radius", type=float, default=5.0)
+    ap.add_argument("--limit", type=int, default=100)
+    ap.add_argument("--db", default=None)
+    args = ap.parse_args()
+
+    tmp = None
+    if args.db is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+        args.db = f"sqlite:///{tmp}"
+    engine = create_engine(args.db)
+
+    print(f"seeding {args.rows:,} rows...")
+    t = time.perf_counter()
+    centres = seed(engine, args.rows)
+    print(f"seeded in {time.perf_counter() - t:.1f}s")
+
+    rng = np.random.default_rng(1)
+    points = [
+        (float(c[0] + rng.normal(0, 0.03)), float(c[1] + rng.normal(0, 0.03)))
+        for c in centres[rng.integers(0, len(centres), args.queries)]
+    ]
+    index = SpatialIndex(TABLE)
+
+    with engine.connect() as conn:
+        def legacy(lat, lon):
+            rows = conn.execute(text(f"SELECT id, lat, lon FROM {TABLE}")).fetchall()
+            out = []
+            for r in rows:
+                d = legacy_haversine(lat, lon, r.lat, r.lon)
+                if d <= args.radius:
+                    out.append((r.id, d))
+            return out
+
+        def grid(lat, lon):
+            index.refresh(conn)
+            return index._nearby_grid(lat, lon, args.radius, args.limit)
+
+        t = time.perf_counter()
+        index.refresh(conn)
+        print(f"grid index built in {time.perf_counter() - t:.1f}s ({index.stats()['cells']} cells)")
+
+        results = [("legacy scan", legacy, points[:args.legacy_queries]), ("grid index", grid, points)]
+
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+            index.create_db_index(conn)
+            conn.execute(text(f"ANALYZE {TABLE}"))
+            conn.commit()
+            results.append((
+                "postgis gist",
+                lambda lat, lon: index._nearby_postgis(conn, lat, lon, args.radius, args.limit),
+                points,
+            ))
+
+        # same ids for the first query (within the limit)
+        ref = sorted(legacy(*points[0]), key=lambda h: h[1])[:args.limit]
+        got = grid(*points[0])
+        assert [i for i, _ in ref] == [i for i, _ in got], "grid index disagrees with full scan"
+
+        print(f"\n{args.rows:,} rows, radius {args.radius} km, limit {args.limit}")
+        for name, fn, pts in results:
+            p50, p95, hits = timed(fn, pts)
+            print(f"{name:14s}: p50 {p50:9.2f} ms  p95 {p95:9.2f} ms  ({hits:.0f} hits/query, {len(pts)} queries)")
+
+    engine.dispose()
+    if tmp:
+        os.unlink(tmp)
+
+
+if __name__ == "__main__":
+    main()
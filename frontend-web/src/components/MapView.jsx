@@ -14,6 +14,17 @@ import NdviTrendGraph from "./NdviTrendGraph";
 
 const API_BASE = import.meta.env.VITE_API_BASE || "http://localhost:8000";
 
+// photos from cloud storage are absolute, local ones are served by the API
+const photoSrc = (url) => (/^https?:\/\//.test(url) ? url : `${API_BASE}${url}`);
+
+// popups are ~220px wide: load the thumbnail, fall back to the original
+// while the server is still generating it
+const fallbackToOriginal = (url) => (e) => {
+  if (e.currentTarget.dataset.fallback) return;
+  e.currentTarget.dataset.fallback = "1";
+  e.currentTarget.src = photoSrc(url);
+};
+
 
 delete L.Icon.Default.prototype._getIconUrl;
 L.IconDefault = L.Icon.Default.mergeOptions({
@@ -317,7 +328,8 @@ export default function MapView({ detections = [] }) {
                     <>
                       <br />
                       <img
-                        src={`${API_BASE}${f.photo_url}`}
+                        src={photoSrc(f.photo_variants?.thumb || f.photo_url)}
+                        onError={fallbackToOriginal(f.photo_url)}
                         style={{ width: "100%", borderRadius: 8 }}
                       />
                     </>
@@ -327,7 +339,8 @@ export default function MapView({ detections = [] }) {
                     <>
                       <br />
                       <img
-                        src={`${API_BASE}${f.field_photo_url}`}
+                        src={photoSrc(f.field_photo_variants?.thumb || f.field_photo_url)}
+                        onError={fallbackToOriginal(f.field_photo_url)}
                         style={{
                           width: "100%",
                           borderRadius: 8,
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from "react";
 import { getMapData } from "../services/api";
-import { socket } from "../services/socket";
+import { socket, trackFeed } from "../services/socket";
 
 import MapView from "../components/MapView";
 import StatsCards from "../components/StatsCards";
@@ -25,24 +25,44 @@ export default function Dashboard() {
   useEffect(() => {
     fetchData();
 
-    socket.on("new_detection", (data) => {
+    // detections arrive batched (one event per ~250 ms window); a
+    // summary or a missed batch reloads the whole list
+    const feedComplete = trackFeed(fetchData);
+    socket.on("new_detections", (batch) => {
+      feedComplete(batch);
+      if (batch.summary) {
+        toast(`🌾 ${batch.count} new detections (connection busy, reloading)`);
+        return;
+      }
       setDetections((prev) => {
-        if (prev.some((d) => d.id === data.id)) return prev;
-        return [...prev, data];
+        const seen = new Set(prev.map((d) => d.id));
+        const fresh = batch.items.filter((d) => !seen.has(d.id));
+        return fresh.length ? [...prev, ...fresh] : prev;
       });
 
-      toast.success(`🌾 New detection: ${data.disease} (${data.severity})`);
+      toast.success(
+        batch.count === 1
+          ? `🌾 New detection: ${batch.items[0].disease} (${batch.items[0].severity})`
+          : `🌾 ${batch.count} new detections`
+      );
 
-      if (data.severity === "High") {
+      const critical = batch.items.filter((d) => d.severity === "High");
+      if (critical.length === 1) {
+        const d = critical[0];
         toast.error(
-          `🚨 Critical hotspot detected near (${data.lat.toFixed(
+          `🚨 Critical hotspot detected near (${d.lat.toFixed(
             3
-          )}, ${data.lon.toFixed(3)})`
+          )}, ${d.lon.toFixed(3)})`
         );
+      } else if (critical.length > 1) {
+        toast.error(`🚨 ${critical.length} critical hotspots detected`);
       }
     });
 
-    return () => socket.off("new_detection");
+    return () => {
+      socket.off("new_detections");
+      feedComplete.stop();
+    };
   }, []);
 
   async function fetchData() {
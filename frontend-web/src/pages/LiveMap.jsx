@@ -5,7 +5,7 @@ import {
   getNDVIStressAlerts,
   getFields,        
 } from "../services/api";
-import { socket } from "../services/socket";
+import { socket, trackFeed } from "../services/socket";
 import toast from "react-hot-toast";
 import { useSearchParams } from "react-router-dom";
 
@@ -26,11 +26,26 @@ export default function LiveMap() {
   useEffect(() => {
     loadAllData();
 
-    socket.on("new_detection", (d) => {
-      setDetections((prev) =>
-        prev.some((x) => x.id === d.id) ? prev : [...prev, d]
-      );
-      toast.success(`🌾 ${d.disease} (${d.severity}) detected`);
+    // detections arrive batched (one event per ~250 ms window); a
+    // summary or a missed batch reloads the map data
+    const feedComplete = trackFeed(loadAllData);
+    socket.on("new_detections", (batch) => {
+      feedComplete(batch);
+      if (batch.summary) {
+        toast(`🌾 ${batch.count} new detections (connection busy, reloading)`);
+        return;
+      }
+      setDetections((prev) => {
+        const seen = new Set(prev.map((x) => x.id));
+        const fresh = batch.items.filter((d) => !seen.has(d.id));
+        return fresh.length ? [...prev, ...fresh] : prev;
+      });
+      if (batch.count === 1) {
+        const d = batch.items[0];
+        toast.success(`🌾 ${d.disease} (${d.severity}) detected`);
+      } else {
+        toast.success(`🌾 ${batch.count} new detections`);
+      }
     });
 
     socket.on("ndvi_stress_update", (items) => {
@@ -55,8 +70,9 @@ export default function LiveMap() {
     });
 
     return () => {
-      socket.off("new_detection");
+      socket.off("new_detections");
       socket.off("ndvi_stress_update");
+      feedComplete.stop();
     };
   }, []);
 
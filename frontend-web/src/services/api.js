@@ -26,9 +26,18 @@ api.interceptors.response.use(
 );
 
 
-export const getMapData = async () => {
-  const res = await api.get("/detections/map_data");
-  return res.data;
+export const getMapData = async (params = {}) => {
+  // keyset paginated: follow X-Next-Cursor until the last page
+  const out = [];
+  let cursor;
+  do {
+    const res = await api.get("/detections/map_data", {
+      params: cursor ? { ...params, cursor } : params,
+    });
+    out.push(...res.data);
+    cursor = res.headers["x-next-cursor"];
+  } while (cursor);
+  return out;
 };
 
 export const getNearbyAlerts = async (lat, lon) => {
@@ -11,8 +11,47 @@ export const socket = io(SOCKET_URL, {
   reconnectionDelay: 1000,
   withCredentials: false,
   autoConnect: true,
+  // the dashboard joins the server's "admin" room with the login token,
+  // which gets every detection/alert/NDVI event; read on each (re)connect
+  auth: (cb) => cb({ token: localStorage.getItem("token") }),
 });
 
 socket.on("connect", () => console.log("🟢 Connected to Socket.IO"));
 socket.on("disconnect", () => console.log("🔴 Disconnected from Socket.IO"));
 socket.on("connect_error", (err) => console.error("⚠️ Socket error:", err.message));
+
+// new_detections batches carry {room, src, seq}: seq numbers the batches
+// one server process sent to one room. A jump means batches for this
+// client were dropped (slow connection, reconnect); a summary means its
+// items were left out. Either way the page reloads instead of patching.
+// Returns check(batch) -> true when the batch continues the feed.
+export function trackFeed(reload, minIntervalMs = 5000) {
+  const last = new Map();
+  let timer = null;
+  let lastReload = 0;
+
+  function scheduleReload() {
+    if (timer) return;
+    const wait = Math.max(0, lastReload + minIntervalMs - Date.now());
+    timer = setTimeout(() => {
+      timer = null;
+      lastReload = Date.now();
+      reload();
+    }, wait);
+  }
+
+  function check(batch) {
+    let complete = !batch.summary;
+    if (batch.seq != null) {
+      const key = `${batch.src}:${batch.room}`;
+      const prev = last.get(key);
+      if (prev != null && batch.seq !== prev + 1) complete = false;
+      last.set(key, batch.seq);
+    }
+    if (!complete) scheduleReload();
+    return complete;
+  }
+
+  check.stop = () => clearTimeout(timer);
+  return check;
+}
@@ -3,6 +3,7 @@ import 'package:hive_flutter/hive_flutter.dart';
 import 'package:socket_io_client/socket_io_client.dart' as IO;
 import 'package:easy_localization/easy_localization.dart';
 import 'package:geocoding/geocoding.dart';
+import 'package:geolocator/geolocator.dart';
 import '../services/api_service.dart';
 import '../utils/disease_names.dart';
 import 'map_page.dart';
@@ -90,11 +91,34 @@ class _AlertsPageState extends State<AlertsPage> {
   }
 
   
-  void _initSocket() {
+  // realtime alerts only arrive for this radius around the farmer
+  static const double _alertRadiusKm = 25;
+
+  Future<Map<String, dynamic>> _socketArea() async {
+    try {
+      final pos = await Geolocator.getLastKnownPosition() ??
+          await Geolocator.getCurrentPosition(
+              desiredAccuracy: LocationAccuracy.medium);
+      return {
+        "lat": pos.latitude,
+        "lon": pos.longitude,
+        "radius_km": _alertRadiusKm,
+      };
+    } catch (e) {
+      debugPrint("No location for alert subscription: $e");
+      return {};
+    }
+  }
+
+  Future<void> _initSocket() async {
+  final area = await _socketArea();
+  if (!mounted) return;
+
   socket = IO.io(
     "http://10.0.2.2:8000",
     IO.OptionBuilder()
         .setTransports(['websocket'])
+        .setAuth(area)
         .disableAutoConnect()
         .build(),
   );
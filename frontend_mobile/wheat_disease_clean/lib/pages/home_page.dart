@@ -82,7 +82,7 @@ class _HomePageState extends State<HomePage>
 
       final box = Hive.box('predictions');
       final now = DateFormat('yyyy-MM-dd HH:mm').format(DateTime.now());
-      box.add({
+      final key = await box.add({
         'imagePath': _selectedImage!.path,
         'disease': result['disease'],
         'confidence': result['confidence'],
@@ -98,7 +98,9 @@ class _HomePageState extends State<HomePage>
       if (!mounted) return;
       Navigator.push(
         context,
-        MaterialPageRoute(builder: (_) => ResultPage(result: result)),
+        MaterialPageRoute(
+          builder: (_) => ResultPage(result: result, historyKey: key),
+        ),
       );
     } catch (e) {
       ScaffoldMessenger.of(
@@ -1,8 +1,6 @@
-import 'dart:convert';
 import 'package:flutter/material.dart';
 import 'package:flutter_map/flutter_map.dart';
 import 'package:latlong2/latlong.dart';
-import 'package:http/http.dart' as http;
 import '../services/api_service.dart';
 
 import 'package:geolocator/geolocator.dart';
@@ -58,16 +56,9 @@ class _MapPageState extends State<MapPage> {
   
   Future<void> _fetchMapData() async {
     try {
-      final url = Uri.parse("${ApiService.baseUrl}/detections/map_data");
-      final res = await http.get(url);
+      detections = await ApiService.getMapData();
 
-      if (res.statusCode == 200) {
-        detections = jsonDecode(res.body);
-
-        print("Fetched markers: ${detections.length}");
-      } else {
-        print("Error loading map: ${res.statusCode}");
-      }
+      print("Fetched markers: ${detections.length}");
     } catch (e) {
       print("Map data fetch error: $e");
     }
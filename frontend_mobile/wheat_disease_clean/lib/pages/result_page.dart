@@ -2,6 +2,7 @@ import 'package:flutter/material.dart';
 import 'package:flutter_markdown/flutter_markdown.dart';
 import 'package:easy_localization/easy_localization.dart';
 import 'package:flutter_tts/flutter_tts.dart';
+import 'package:hive/hive.dart';
 
 import '../services/api_service.dart';
 import '../services/speech_service.dart';
@@ -9,8 +10,9 @@ import '../utils/disease_names.dart';
 
 class ResultPage extends StatefulWidget {
   final Map<String, dynamic> result;
+  final dynamic historyKey;
 
-  const ResultPage({super.key, required this.result});
+  const ResultPage({super.key, required this.result, this.historyKey});
 
   @override
   State<ResultPage> createState() => _ResultPageState();
@@ -23,6 +25,11 @@ class _ResultPageState extends State<ResultPage> {
   bool chatbotSpeaking = false;
   bool organicMode = false; 
 
+  String? remedyText;
+  String? explanationText;
+  bool remedyLoading = false;
+  bool remedyRequested = false;
+
   @override
   void initState() {
     super.initState();
@@ -33,6 +40,57 @@ class _ResultPageState extends State<ResultPage> {
     });
   }
 
+  @override
+  void didChangeDependencies() {
+    super.didChangeDependencies();
+
+    // /predict returns remedy_status "pending": fetch the text afterwards
+    final detectionId = widget.result['detection_id'];
+    if (!remedyRequested &&
+        widget.result['remedy'] == null &&
+        detectionId != null) {
+      remedyRequested = true;
+      loadRemedy(detectionId as int, context.locale.languageCode);
+    }
+  }
+
+  Future<void> loadRemedy(int detectionId, String lang) async {
+    setState(() => remedyLoading = true);
+
+    Map<String, dynamic>? data;
+    try {
+      data = await ApiService.getRemedy(detectionId, lang);
+    } catch (e) {
+      print("Remedy fetch error: $e");
+    }
+
+    if (data != null && widget.historyKey != null) {
+      final box = Hive.box('predictions');
+      final saved = box.get(widget.historyKey);
+      if (saved != null) {
+        box.put(widget.historyKey, {
+          ...Map<String, dynamic>.from(saved),
+          'remedy': data['remedy'],
+          'ai_explanation': data['ai_explanation'],
+        });
+      }
+    }
+
+    if (!mounted) return;
+    setState(() {
+      remedyLoading = false;
+      remedyText = data?['remedy']?.toString();
+      explanationText = data?['ai_explanation']?.toString();
+    });
+  }
+
+  Widget loadingCard(Color color) {
+    return Padding(
+      padding: const EdgeInsets.all(20),
+      child: Center(child: CircularProgressIndicator(color: color)),
+    );
+  }
+
   Future<void> toggleSpeak(String text) async {
     if (isSpeaking) {
       await tts.stop();
@@ -130,10 +188,12 @@ class _ResultPageState extends State<ResultPage> {
     final confidence = widget.result['confidence']?.toString() ?? "0";
     final severity = widget.result['severity']?.toString() ?? "Low";
 
-    final originalRemedy = widget.result['remedy']?.toString() 
+    final originalRemedy = remedyText
+      ?? widget.result['remedy']?.toString() 
       ?? "- No remedy available right now.";
 
-    final originalExplanation = widget.result['ai_explanation']?.toString() 
+    final originalExplanation = explanationText
+      ?? widget.result['ai_explanation']?.toString() 
       ?? "- No explanation available right now.";
 
     
@@ -226,29 +286,31 @@ class _ResultPageState extends State<ResultPage> {
                     isSpeaking ? Icons.stop_circle : Icons.volume_up_rounded,
                     color: Colors.green,
                   ),
-                  onPressed: () => toggleSpeak(remedy),
+                  onPressed: remedyLoading ? null : () => toggleSpeak(remedy),
                 ),
               ],
             ),
 
             Card(
               color: Colors.green.shade50,
-              child: Padding(
-                padding: const EdgeInsets.all(12),
-                child: MarkdownBody(
-                  data: remedy.replaceAll("###", ""),
-                  selectable: true,
-                  styleSheet: MarkdownStyleSheet(
-                    p: const TextStyle(fontSize: 17, height: 1.5),
-                  ),
-                ),
-              ),
+              child: remedyLoading
+                  ? loadingCard(Colors.green)
+                  : Padding(
+                      padding: const EdgeInsets.all(12),
+                      child: MarkdownBody(
+                        data: remedy.replaceAll("###", ""),
+                        selectable: true,
+                        styleSheet: MarkdownStyleSheet(
+                          p: const TextStyle(fontSize: 17, height: 1.5),
+                        ),
+                      ),
+                    ),
             ),
 
             const SizedBox(height: 20),
 
             
-            if (!organicMode) ...[
+            if (!organicMode && !remedyLoading) ...[
               Align(
                 alignment: Alignment.centerLeft,
                 child: Text(
@@ -290,22 +352,24 @@ class _ResultPageState extends State<ResultPage> {
                     isSpeaking ? Icons.stop_circle : Icons.volume_up_rounded,
                     color: Colors.deepPurple,
                   ),
-                  onPressed: () => toggleSpeak(explanation),
+                  onPressed: remedyLoading ? null : () => toggleSpeak(explanation),
                 ),
               ],
             ),
 
             Card(
               color: Colors.deepPurple.shade50,
-              child: Padding(
-                padding: const EdgeInsets.all(12),
-                child: MarkdownBody(
-                  data: explanation.replaceAll("###", ""),
-                  styleSheet: MarkdownStyleSheet(
-                    p: const TextStyle(fontSize: 17, height: 1.5),
-                  ),
-                ),
-              ),
+              child: remedyLoading
+                  ? loadingCard(Colors.deepPurple)
+                  : Padding(
+                      padding: const EdgeInsets.all(12),
+                      child: MarkdownBody(
+                        data: explanation.replaceAll("###", ""),
+                        styleSheet: MarkdownStyleSheet(
+                          p: const TextStyle(fontSize: 17, height: 1.5),
+                        ),
+                      ),
+                    ),
             ),
 
             const SizedBox(height: 30),
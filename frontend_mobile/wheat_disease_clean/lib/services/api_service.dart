@@ -40,6 +40,35 @@ class ApiService {
     }
   }
 
+  static Future<Map<String, dynamic>?> getRemedy(
+    int detectionId,
+    String language, {
+    int attempts = 4,
+  }) async {
+    // /predict answers before the remedy is written: long-poll for it
+    for (var i = 0; i < attempts; i++) {
+      final uri = Uri.parse('$baseUrl/detections/$detectionId/remedy').replace(
+        queryParameters: {'language': language, 'wait': '20'},
+      );
+      final response = await http.get(uri);
+
+      if (response.statusCode == 404) return null;
+      if (response.statusCode != 200) {
+        throw Exception("Failed to load remedy: ${response.statusCode}");
+      }
+
+      final data = Map<String, dynamic>.from(jsonDecode(response.body));
+      if (data['status'] == 'ready') return data;
+
+      // still pending, or failed (the next request schedules it again)
+      if (data['status'] == 'failed') {
+        await Future.delayed(const Duration(seconds: 2));
+      }
+    }
+
+    return null;
+  }
+
   static Future<void> saveDetection(Map<String, dynamic> data) async {
     final response = await http.post(
       Uri.parse('$baseUrl/detections/save'),
@@ -53,14 +82,26 @@ class ApiService {
   }
 
   static Future<List<dynamic>> getMapData() async {
-    final response = await http.get(Uri.parse('$baseUrl/detections/map_data'));
+    // keyset paginated: follow X-Next-Cursor until the last page
+    final out = <dynamic>[];
+    String? cursor;
+
+    do {
+      final uri = Uri.parse('$baseUrl/detections/map_data').replace(
+        queryParameters: cursor == null ? null : {'cursor': cursor},
+      );
+      final response = await http.get(uri);
+
+      if (response.statusCode != 200) {
+        throw Exception("Failed to load map data");
+      }
 
-    if (response.statusCode == 200) {
       final data = jsonDecode(response.body);
-      return data.where((d) => d['lat'] != null && d['lon'] != null).toList();
-    } else {
-      throw Exception("Failed to load map data");
-    }
+      out.addAll(data.where((d) => d['lat'] != null && d['lon'] != null));
+      cursor = response.headers['x-next-cursor'];
+    } while (cursor != null);
+
+    return out;
   }
 
   static Future<List<Map<String, dynamic>>> getAlerts() async {